@@ -0,0 +1,114 @@
+// Client for the cube export written by src/olap_cube.py (cube_data.json[.gz]).
+// Rows are (day offset, dimension codes..., measure); a query filters them by
+// date range and members, buckets the days at the requested grain and sums the
+// measure per (period, group). Nothing but the export is loaded.
+const OlapCube = (() => {
+    const FILE = 'cube_data.json';
+    const DAY_MS = 86400000;
+    let data = null, base = 0;
+    const labelCache = {};
+
+    async function fetchJson(path) {
+        if ('DecompressionStream' in window) {
+            try {
+                const r = await fetch(path + '.gz');
+                if (r.ok) {
+                    const buf = await r.arrayBuffer();
+                    const bytes = new Uint8Array(buf);
+                    // Servers that send Content-Encoding: gzip have already inflated it
+                    if (bytes[0] !== 0x1f || bytes[1] !== 0x8b) return JSON.parse(new TextDecoder().decode(bytes));
+                    return await new Response(new Blob([buf]).stream().pipeThrough(new DecompressionStream('gzip'))).json();
+                }
+            } catch (e) {
+                console.warn('Compressed cube unavailable, using JSON:', e);
+            }
+        }
+        const r = await fetch(path);
+        return r.ok ? r.json() : null;
+    }
+
+    async function load() {
+        if (!data) {
+            data = await fetchJson(FILE);
+            if (data && data.base_date) base = Date.parse(data.base_date + 'T00:00:00Z');
+        }
+        return data;
+    }
+
+    const pad = n => String(n).padStart(2, '0');
+    const iso = d => `${d.getUTCFullYear()}-${pad(d.getUTCMonth() + 1)}-${pad(d.getUTCDate())}`;
+
+    // Same labels as bucket_labels() in src/olap_cube.py
+    function label(offset, grain) {
+        if (offset < 0) return '(no date)';
+        const d = new Date(base + offset * DAY_MS);
+        const y = d.getUTCFullYear(), m = d.getUTCMonth();
+        if (grain === 'day') return iso(d);
+        if (grain === 'week') return iso(new Date(d.getTime() - ((d.getUTCDay() + 6) % 7) * DAY_MS));
+        if (grain === 'month') return `${y}-${pad(m + 1)}`;
+        if (grain === 'quarter') return `${y}-Q${Math.floor(m / 3) + 1}`;
+        return String(y);
+    }
+
+    function labeller(grain) {
+        if (!labelCache[grain]) {
+            const cache = new Map();
+            labelCache[grain] = o => {
+                if (!cache.has(o)) cache.set(o, label(o, grain));
+                return cache.get(o);
+            };
+        }
+        return labelCache[grain];
+    }
+
+    function toOffset(date) {
+        return date ? Math.round((Date.parse(date + 'T00:00:00Z') - base) / DAY_MS) : null;
+    }
+
+    // q = { grain, by, filters: {dim: [values]}, start, end } (dates as yyyy-mm-dd, inclusive)
+    // -> { periods, groups, series: {group: [value per period]}, totals: {group: value}, total }
+    function query(name, q = {}) {
+        const cube = data.cubes[name], cols = cube.columns, dict = cube.dictionaries;
+        const n = cube.rows, day = cols.day, measure = cols[cube.measure];
+        const lo = toOffset(q.start), hi = toOffset(q.end);
+        const checks = Object.entries(q.filters || {}).filter(([, v]) => v && v.length).map(([dim, values]) => {
+            const wanted = new Set(values);
+            return [cols[dim], dict[dim].map(v => wanted.has(v))];
+        });
+        const byCol = q.by ? cols[q.by] : null, byDict = q.by ? dict[q.by] : null;
+        const bucket = q.grain ? labeller(q.grain) : null;
+
+        const cells = new Map(), totals = {}, periods = new Set();
+        let total = 0;
+        rows: for (let i = 0; i < n; i++) {
+            const o = day[i];
+            if ((lo !== null || hi !== null) && o < 0) continue;
+            if (lo !== null && o < lo) continue;
+            if (hi !== null && o > hi) continue;
+            for (const [col, ok] of checks) if (!ok[col[i]]) continue rows;
+            const group = byCol ? (byDict[byCol[i]] ?? '(missing)') : 'All';
+            const period = bucket ? bucket(o) : 'All';
+            const key = period + '\u0000' + group;
+            cells.set(key, (cells.get(key) || 0) + measure[i]);
+            totals[group] = (totals[group] || 0) + measure[i];
+            periods.add(period);
+            total += measure[i];
+        }
+
+        const periodList = [...periods].sort();
+        const groups = Object.keys(totals).sort((a, b) => totals[b] - totals[a]);
+        const series = {};
+        for (const g of groups) series[g] = periodList.map(p => cells.get(p + '\u0000' + g) || 0);
+        return { periods: periodList, groups, series, totals, total };
+    }
+
+    return {
+        load, query,
+        cubes: () => Object.keys(data.cubes),
+        dims: name => data.cubes[name].dims,
+        measure: name => data.cubes[name].measure,
+        members: (name, dim) => data.cubes[name].dictionaries[dim],
+        grains: () => data.grains,
+        range: () => [data.base_date, data.end_date],
+    };
+})();
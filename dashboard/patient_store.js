@@ -0,0 +1,94 @@
+// Client for the sharded patient store written by src/patient_record_store.py.
+// Lookups fetch manifest.json + one shard; search fetches the trigram buckets
+// the query needs and then only the index pages holding the matches. Falls back
+// to the single patient_records.json when no sharded store has been generated.
+const PatientStore = (() => {
+    const DIR = 'patient_records/';
+    const utf8 = new TextEncoder();
+    let manifest = null, legacy = null;
+    const shards = {}, buckets = {}, pages = {};
+
+    // FNV-1a over UTF-8 bytes, like fnv1a() in patient_record_store.py
+    function fnv1a(s) {
+        let h = 0x811c9dc5;
+        for (const b of utf8.encode(s)) { h ^= b; h = Math.imul(h, 16777619) >>> 0 }
+        return h >>> 0;
+    }
+
+    function shardOf(pid, sh) {
+        if (sh.scheme === 'range') return Math.floor(parseInt(pid.slice(1), 10) / sh.size);
+        return fnv1a(pid) % sh.count;
+    }
+
+    async function getJson(path) {
+        const r = await fetch(path);
+        return r.ok ? r.json() : null;
+    }
+
+    async function loadManifest() {
+        if (manifest || legacy) return;
+        manifest = await getJson(DIR + 'manifest.json');
+        if (!manifest) legacy = await getJson('patient_records.json');
+    }
+
+    async function getRecord(pid) {
+        await loadManifest();
+        if (legacy) return legacy.records[pid];
+        const n = shardOf(pid, manifest.shards);
+        if (Number.isNaN(n)) return undefined;
+        if (!(n in shards)) shards[n] = (await getJson(`${DIR}shard_${n}.json`)) || {};
+        return shards[n][pid];
+    }
+
+    async function indexRow(i) {
+        const per = manifest.index.rows_per_file, k = Math.floor(i / per), j = i % per;
+        if (!(k in pages)) pages[k] = await getJson(`${DIR}index_${k}.json`);
+        const c = pages[k], d = manifest.index.dictionaries;
+        return {
+            patient_id: c.patient_id[j], name: c.name[j],
+            gender: d.gender[c.gender[j]] ?? '', city: d.city[c.city[j]] ?? '', blood_group: d.blood_group[c.blood_group[j]] ?? '',
+            total_visits: c.total_visits[j], total_lab_reports: c.total_lab_reports[j]
+        };
+    }
+
+    function intersect(a, b) {
+        const out = [];
+        for (let i = 0, j = 0; i < a.length && j < b.length;) {
+            if (a[i] === b[j]) { out.push(a[i]); i++; j++ } else if (a[i] < b[j]) i++; else j++;
+        }
+        return out;
+    }
+
+    // Same matching rule as before: case-insensitive substring of ID, name or city
+    async function search(q, limit) {
+        q = q.toLowerCase();
+        const matches = p => p.patient_id.toLowerCase().includes(q) || p.name.toLowerCase().includes(q) || p.city.toLowerCase().includes(q);
+        await loadManifest();
+        if (legacy) return legacy.patient_index.filter(matches).slice(0, limit);
+
+        const n = manifest.search.ngram, total = manifest.total_patients;
+        const out = [];
+        if (q.length < n) {
+            // too short for the trigram index: scan the pages in order until the limit is reached
+            for (let i = 0; i < total && out.length < limit; i++) { const p = await indexRow(i); if (matches(p)) out.push(p) }
+            return out;
+        }
+
+        let candidates = null;
+        const grams = [...new Set(Array.from({ length: q.length - n + 1 }, (_, i) => q.slice(i, i + n)))];
+        for (const g of grams) {
+            const b = fnv1a(g) % manifest.search.buckets;
+            if (!(b in buckets)) buckets[b] = (await getJson(`${DIR}search_${b}.json`)) || {};
+            const postings = buckets[b][g] || [];
+            candidates = candidates === null ? postings : intersect(candidates, postings);
+            if (candidates.length === 0) return out;
+        }
+        for (const i of candidates) {
+            const p = await indexRow(i);
+            if (matches(p)) { out.push(p); if (out.length >= limit) break }
+        }
+        return out;
+    }
+
+    return { getRecord, search };
+})();
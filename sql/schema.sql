@@ -24,7 +24,11 @@ CREATE TABLE IF NOT EXISTS visits (
     reason VARCHAR(255),
     visit_type VARCHAR(50),
     FOREIGN KEY (patient_id) REFERENCES patients(patient_id),
-    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id)
+    FOREIGN KEY (doctor_id) REFERENCES doctors(doctor_id),
+    -- GetPatientHistory: patient's visits newest first, without touching the row data
+    INDEX idx_visits_patient_date (patient_id, visit_date, doctor_id, visit_type, reason),
+    -- GetDoctorSummary and per-doctor/per-hospital date ranges
+    INDEX idx_visits_doctor_date (doctor_id, visit_date, patient_id)
 );
 
 CREATE TABLE IF NOT EXISTS lab_reports (
@@ -33,5 +37,7 @@ CREATE TABLE IF NOT EXISTS lab_reports (
     test_type VARCHAR(100),
     result VARCHAR(100),
     report_date DATE,
-    FOREIGN KEY (visit_id) REFERENCES visits(visit_id)
+    FOREIGN KEY (visit_id) REFERENCES visits(visit_id),
+    -- GetPatientLabReports: a visit's reports by date
+    INDEX idx_lab_reports_visit_date (visit_id, report_date, test_type, result)
 );
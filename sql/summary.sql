@@ -0,0 +1,172 @@
+USE healthcare_db;
+
+-- =====================================================================
+-- Pre-aggregated summary tables, maintained by src/summary_refresh.py.
+-- Run after schema.sql and procedures.sql (GetDoctorSummary is replaced
+-- by a version that reads the summaries).
+-- =====================================================================
+
+-- Visits per doctor per day
+CREATE TABLE IF NOT EXISTS doctor_daily_stats (
+    doctor_id VARCHAR(20) NOT NULL,
+    visit_date DATE NOT NULL,
+    visit_count INT NOT NULL,
+    PRIMARY KEY (doctor_id, visit_date)
+);
+
+-- Visits per (doctor, patient); COUNT(*) per doctor = unique patients
+CREATE TABLE IF NOT EXISTS doctor_patients (
+    doctor_id VARCHAR(20) NOT NULL,
+    patient_id VARCHAR(20) NOT NULL,
+    visit_count INT NOT NULL,
+    PRIMARY KEY (doctor_id, patient_id)
+);
+
+-- Visits per (hospital, month, patient); backs the distinct counts below
+CREATE TABLE IF NOT EXISTS hospital_monthly_patients (
+    hospital VARCHAR(100) NOT NULL,
+    month DATE NOT NULL,
+    patient_id VARCHAR(20) NOT NULL,
+    visit_count INT NOT NULL,
+    PRIMARY KEY (hospital, month, patient_id)
+);
+
+-- Visits, unique patients and active doctors per hospital per month
+CREATE TABLE IF NOT EXISTS hospital_monthly_stats (
+    hospital VARCHAR(100) NOT NULL,
+    month DATE NOT NULL,
+    visit_count INT NOT NULL,
+    unique_patients INT NOT NULL,
+    active_doctors INT NOT NULL,
+    PRIMARY KEY (hospital, month)
+);
+
+-- Lab reports per test type and result per month
+CREATE TABLE IF NOT EXISTS lab_result_monthly (
+    month DATE NOT NULL,
+    test_type VARCHAR(100) NOT NULL,
+    result VARCHAR(100) NOT NULL,
+    report_count INT NOT NULL,
+    PRIMARY KEY (month, test_type, result)
+);
+
+-- Change logs written by the triggers below and drained by the refresh job.
+-- Each row is a +1 (new values) or -1 (old values) contribution.
+CREATE TABLE IF NOT EXISTS summary_visit_log (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    sign TINYINT NOT NULL,
+    doctor_id VARCHAR(20),
+    patient_id VARCHAR(20),
+    visit_date DATE
+);
+
+CREATE TABLE IF NOT EXISTS summary_lab_log (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    sign TINYINT NOT NULL,
+    test_type VARCHAR(100),
+    result VARCHAR(100),
+    report_date DATE
+);
+
+-- Triggers: capture every insert, upsert and delete on the fact tables
+DROP TRIGGER IF EXISTS visits_summary_insert;
+DROP TRIGGER IF EXISTS visits_summary_update;
+DROP TRIGGER IF EXISTS visits_summary_delete;
+DROP TRIGGER IF EXISTS lab_reports_summary_insert;
+DROP TRIGGER IF EXISTS lab_reports_summary_update;
+DROP TRIGGER IF EXISTS lab_reports_summary_delete;
+
+DELIMITER //
+
+CREATE TRIGGER visits_summary_insert AFTER INSERT ON visits FOR EACH ROW
+BEGIN
+    INSERT INTO summary_visit_log (sign, doctor_id, patient_id, visit_date)
+    VALUES (1, NEW.doctor_id, NEW.patient_id, NEW.visit_date);
+END //
+
+CREATE TRIGGER visits_summary_update AFTER UPDATE ON visits FOR EACH ROW
+BEGIN
+    IF NOT (OLD.doctor_id <=> NEW.doctor_id AND OLD.patient_id <=> NEW.patient_id
+            AND OLD.visit_date <=> NEW.visit_date) THEN
+        INSERT INTO summary_visit_log (sign, doctor_id, patient_id, visit_date)
+        VALUES (-1, OLD.doctor_id, OLD.patient_id, OLD.visit_date),
+               (1, NEW.doctor_id, NEW.patient_id, NEW.visit_date);
+    END IF;
+END //
+
+CREATE TRIGGER visits_summary_delete AFTER DELETE ON visits FOR EACH ROW
+BEGIN
+    INSERT INTO summary_visit_log (sign, doctor_id, patient_id, visit_date)
+    VALUES (-1, OLD.doctor_id, OLD.patient_id, OLD.visit_date);
+END //
+
+CREATE TRIGGER lab_reports_summary_insert AFTER INSERT ON lab_reports FOR EACH ROW
+BEGIN
+    INSERT INTO summary_lab_log (sign, test_type, result, report_date)
+    VALUES (1, NEW.test_type, NEW.result, NEW.report_date);
+END //
+
+CREATE TRIGGER lab_reports_summary_update AFTER UPDATE ON lab_reports FOR EACH ROW
+BEGIN
+    IF NOT (OLD.test_type <=> NEW.test_type AND OLD.result <=> NEW.result
+            AND OLD.report_date <=> NEW.report_date) THEN
+        INSERT INTO summary_lab_log (sign, test_type, result, report_date)
+        VALUES (-1, OLD.test_type, OLD.result, OLD.report_date),
+               (1, NEW.test_type, NEW.result, NEW.report_date);
+    END IF;
+END //
+
+CREATE TRIGGER lab_reports_summary_delete AFTER DELETE ON lab_reports FOR EACH ROW
+BEGIN
+    INSERT INTO summary_lab_log (sign, test_type, result, report_date)
+    VALUES (-1, OLD.test_type, OLD.result, OLD.report_date);
+END //
+
+DELIMITER ;
+
+-- Stored Procedure: Get Doctor Visit Summary (same columns as procedures.sql, read from the summaries)
+DROP PROCEDURE IF EXISTS GetDoctorSummary;
+
+DELIMITER //
+
+CREATE PROCEDURE GetDoctorSummary(IN did VARCHAR(20))
+BEGIN
+    SELECT d.name AS doctor_name, d.specialization, d.hospital,
+           COALESCE((SELECT SUM(s.visit_count) FROM doctor_daily_stats s WHERE s.doctor_id = d.doctor_id), 0)
+               AS total_visits,
+           (SELECT COUNT(*) FROM doctor_patients dp WHERE dp.doctor_id = d.doctor_id) AS unique_patients
+    FROM doctors d
+    WHERE d.doctor_id = did;
+END //
+
+DELIMITER ;
+
+-- Stored Procedure: Get Hospital Monthly Stats
+DROP PROCEDURE IF EXISTS GetHospitalMonthlyStats;
+
+DELIMITER //
+
+CREATE PROCEDURE GetHospitalMonthlyStats(IN hosp VARCHAR(100))
+BEGIN
+    SELECT hospital, month, visit_count, unique_patients, active_doctors
+    FROM hospital_monthly_stats
+    WHERE hospital = hosp
+    ORDER BY month DESC;
+END //
+
+DELIMITER ;
+
+-- Stored Procedure: Get Lab Result Counts by Month
+DROP PROCEDURE IF EXISTS GetLabResultMonthly;
+
+DELIMITER //
+
+CREATE PROCEDURE GetLabResultMonthly(IN from_month DATE, IN to_month DATE)
+BEGIN
+    SELECT month, test_type, result, report_count
+    FROM lab_result_monthly
+    WHERE month BETWEEN from_month AND to_month
+    ORDER BY month, test_type, result;
+END //
+
+DELIMITER ;
@@ -0,0 +1,480 @@
+"""
+Incrementally maintained aggregate state.
+
+Keeps mergeable partial results for every aggregation in the transform step
+(doctor_summary, visit_reason_analysis, hospital_visits, lab_result_distribution,
+city_distribution) and the dashboard counters, per group and per month bucket:
+
+- row counts, which merge by addition;
+- distinct-count sketches, kept as int64 [n, 2] arrays of unique (entry, value)
+  pairs. "exact" sketches hold the distinct integer-encoded IDs and merge by
+  union; "hll" (the default) sketches hold each entry's non-zero HyperLogLog
+  registers as (register << 8 | rank) and merge by the highest rank per
+  register. Most (group, month) entries see only a few IDs, so sparse
+  registers are far smaller than 2**p bytes per entry.
+
+refresh() folds in only the rows appended to data/raw/ since the last run,
+reading each file from the previous end offset, so a small daily batch is
+applied in time proportional to the batch, not the history. Each file's
+position is a fixed-size fingerprint (size, mtime and a hash of the last
+TAIL_WINDOW bytes, see incremental_ingest.file_position); if a file was
+rewritten rather than appended to, the state is rebuilt from scratch.
+Visits are joined to doctors.csv for their hospital when they are folded, so
+any change to doctors.csv (a moved doctor, or a new doctor whose visits were
+already folded without one) also triggers a rebuild, as does a change of
+sketch settings.
+
+The state is saved per month bucket, one directory each under
+data/state/aggregates/buckets/, and a save rewrites only the buckets that
+received rows; state.json names the current directory of every bucket.
+
+    python -m src.aggregate_state            # refresh + write data/processed/ aggregates
+"""
+import os
+import re
+import sys
+import json
+import uuid
+import shutil
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.config import AGGREGATE_CONFIG, SPARK_CONFIG
+from src.id_codec import ID_PREFIXES, encode_ids
+from src.incremental_ingest import appended_since, file_position, read_delta
+from src.local_transform import write_output
+from src.raw_reader import read_table
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
+STATE_DIR = os.path.join(BASE_DIR, "data", "state", "aggregates")
+BUCKETS_DIR = "buckets"
+STATE_VERSION = 2
+
+# Bytes before a file's saved end offset hashed to tell an append from a rewrite
+TAIL_WINDOW = 1 << 16
+
+# Source files folded incrementally; the date column (if any) defines the month bucket
+SOURCES = {
+    "patients": {"file": "patients.csv", "date": None},
+    "visits": {"file": "visits.csv", "date": "visit_date"},
+    "lab_reports": {"file": "lab_reports.csv", "date": "report_date"},
+}
+
+# Lookup tables joined into the deltas at fold time; any change to one invalidates the state
+LOOKUPS = {"doctors": "doctors.csv"}
+
+AGGREGATES = {
+    "doctor": {"source": "visits", "keys": ["doctor_id"], "distinct": ["patient_id"]},
+    "reason": {"source": "visits", "keys": ["reason"], "distinct": ["patient_id"]},
+    "hospital": {"source": "visits", "keys": ["hospital"], "distinct": ["patient_id", "doctor_id"]},
+    "visit_type": {"source": "visits", "keys": ["visit_type"], "distinct": []},
+    "lab_result": {"source": "lab_reports", "keys": ["test_type", "result"], "distinct": []},
+    "city": {"source": "patients", "keys": ["city"], "distinct": []},
+    "gender": {"source": "patients", "keys": ["gender"], "distinct": []},
+    "blood_group": {"source": "patients", "keys": ["blood_group"], "distinct": []},
+}
+
+
+# ---------------------------------------------------------------------------
+# Sketches
+# ---------------------------------------------------------------------------
+
+# HLL sketch values carry the register index above an 8-bit rank
+RANK_BITS = 8
+
+
+def hash64(codes):
+    """SplitMix64 finaliser: spreads integer IDs uniformly over 64 bits."""
+    with np.errstate(over="ignore"):
+        z = np.asarray(codes, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def hll_pairs(entries, codes, p):
+    """(entry, register << RANK_BITS | rank) for the HyperLogLog register each (entry, code) sets."""
+    h = hash64(codes)
+    index = (h >> np.uint64(64 - p)).astype(np.int64)
+    # Rank = position of the first 1-bit in the remaining bits, from their top 32 bits
+    rest = ((h << np.uint64(p)) >> np.uint64(32)).astype(np.float64)
+    rank = np.where(rest > 0, 32 - np.floor(np.log2(np.maximum(rest, 1))), 33).astype(np.int64)
+    return np.column_stack([entries, (index << RANK_BITS) | rank])
+
+
+def merge_pairs(pairs, shift=0):
+    """
+    Sort int64 (entry, value) rows and keep one per (entry, value >> shift), the largest:
+    shift=0 drops duplicate pairs, shift=RANK_BITS keeps each HLL register's highest rank.
+    """
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    keep = np.ones(len(pairs), dtype=bool)
+    keep[:-1] = (pairs[1:, 0] != pairs[:-1, 0]) | ((pairs[1:, 1] >> shift) != (pairs[:-1, 1] >> shift))
+    return pairs[keep]
+
+
+def hll_estimate(registers):
+    """Cardinality estimate for each row of registers (with small-range correction)."""
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)), axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw).round().astype(np.int64)
+
+
+# ---------------------------------------------------------------------------
+# State store
+# ---------------------------------------------------------------------------
+
+def _bucket_key(bucket):
+    """A bucket as saved in state.json: "YYYY-MM", "" for undated sources, None for a missing date."""
+    return None if pd.isna(bucket) else bucket
+
+
+def _bucket_dir(bucket, token):
+    label = "missing" if bucket is None else re.sub(r"[^0-9A-Za-z-]", "_", bucket) or "undated"
+    return f"{label}.{token}"
+
+
+class AggregateStore:
+    """Per-(group, month) counts and distinct sketches for every entry in AGGREGATES."""
+
+    def __init__(self, state_dir=STATE_DIR, sketch=None, precision=None):
+        self.state_dir = state_dir
+        self.sketch = sketch or AGGREGATE_CONFIG["sketch"]
+        self.precision = precision or AGGREGATE_CONFIG["hll_precision"]
+        self.offsets = {}
+        self.entries = {}
+        self.sketches = {}
+        self.buckets = {}   # bucket -> its directory under buckets/
+        self.dirty = set()  # buckets changed since the last save
+        for name, spec in AGGREGATES.items():
+            self.entries[name] = pd.DataFrame({**{k: pd.Series(dtype=object) for k in spec["keys"]},
+                                               "bucket": pd.Series(dtype=object),
+                                               "count": pd.Series(dtype=np.int64)})
+            for column in spec["distinct"]:
+                self.sketches[(name, column)] = self._empty_sketch()
+
+    def _empty_sketch(self):
+        return np.empty((0, 2), dtype=np.int64)
+
+    # ---- persistence ----
+
+    @classmethod
+    def load(cls, state_dir=STATE_DIR):
+        meta_file = os.path.join(state_dir, "state.json")
+        if not os.path.exists(meta_file):
+            return cls(state_dir)
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta.get("version") != STATE_VERSION:
+            return cls(state_dir)  # an older layout: the next refresh rebuilds it
+        store = cls(state_dir, meta["sketch"], meta["precision"])
+        store.offsets = meta["offsets"]
+
+        tables, sizes = [], dict.fromkeys(AGGREGATES, 0)
+        parts = {key: [] for key in store.sketches}
+        for bucket, dir_name in meta["buckets"]:
+            store.buckets[bucket] = dir_name
+            path = os.path.join(state_dir, BUCKETS_DIR, dir_name)
+            tables.append(pq.read_table(os.path.join(path, "entries.parquet")))
+            names = tables[-1].column("aggregate").to_numpy(zero_copy_only=False)
+            with np.load(os.path.join(path, "sketches.npz")) as sketches:
+                for name, spec in AGGREGATES.items():
+                    for column in spec["distinct"]:
+                        part = sketches[f"{name}.{column}"]
+                        # entries are numbered within the bucket
+                        parts[(name, column)].append(part + [sizes[name], 0])
+                    sizes[name] += int(np.count_nonzero(names == name))
+        if tables:
+            combined = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+            for name, rows in combined.groupby("aggregate", sort=False):
+                store.entries[name] = rows[AGGREGATES[name]["keys"] + ["bucket", "count"]].reset_index(drop=True)
+        for key, arrays in parts.items():
+            if arrays:
+                store.sketches[key] = np.concatenate(arrays)
+        return store
+
+    def _bucket_sketch(self, sketch, rows, n_entries):
+        """The part of a sketch for the entries `rows` (sorted), numbered from 0 within them."""
+        local = np.full(n_entries, -1, dtype=np.int64)
+        local[rows] = np.arange(len(rows))
+        pairs = sketch[local[sketch[:, 0]] >= 0]
+        return np.column_stack([local[pairs[:, 0]], pairs[:, 1]])
+
+    def _bucket_rows(self, entries):
+        """{bucket: row positions} of an entries frame."""
+        groups = entries.groupby("bucket", dropna=False, sort=False).indices
+        return {_bucket_key(bucket): rows for bucket, rows in groups.items()}
+
+    def _save_bucket(self, bucket, path, table, table_rows, entry_rows):
+        """
+        Write one bucket: its entries of every aggregate as one Parquet file (rows of
+        `table`, told apart by their `aggregate` column) and the matching sketch parts.
+        """
+        os.makedirs(path)
+        pq.write_table(table.take(table_rows[bucket]), os.path.join(path, "entries.parquet"))
+        sketches = {}
+        empty = np.empty(0, dtype=np.int64)
+        for (name, column), sketch in self.sketches.items():
+            rows = entry_rows[name].get(bucket, empty)
+            sketches[f"{name}.{column}"] = self._bucket_sketch(sketch, rows, len(self.entries[name]))
+        np.savez(os.path.join(path, "sketches.npz"), **sketches)
+
+    def save(self):
+        """
+        Write each bucket changed since the last save to a new directory, then switch
+        state.json to them with one rename and delete the directories they replace.
+        """
+        buckets_dir = os.path.join(self.state_dir, BUCKETS_DIR)
+        os.makedirs(buckets_dir, exist_ok=True)
+        token = uuid.uuid4().hex[:12]
+        if self.dirty:
+            combined = pd.concat([entries.assign(aggregate=name) for name, entries in self.entries.items()],
+                                 ignore_index=True)
+            table, table_rows = pa.Table.from_pandas(combined, preserve_index=False), self._bucket_rows(combined)
+            entry_rows = {name: self._bucket_rows(self.entries[name]) for name, _ in self.sketches}
+        for bucket in self.dirty:
+            self.buckets[bucket] = _bucket_dir(bucket, token)
+            self._save_bucket(bucket, os.path.join(buckets_dir, self.buckets[bucket]), table, table_rows, entry_rows)
+
+        meta_file = os.path.join(self.state_dir, "state.json")
+        with open(meta_file + ".tmp", "w") as f:
+            json.dump({"version": STATE_VERSION, "sketch": self.sketch, "precision": self.precision,
+                       "offsets": self.offsets, "buckets": list(self.buckets.items())}, f, indent=2)
+        os.replace(meta_file + ".tmp", meta_file)
+        self.dirty = set()
+
+        # replaced buckets, a save that failed half-way, or a state rebuilt from scratch
+        live = set(self.buckets.values())
+        for dir_name in os.listdir(buckets_dir):
+            if dir_name not in live:
+                shutil.rmtree(os.path.join(buckets_dir, dir_name), ignore_errors=True)
+        for name in [f"{name}.parquet" for name in AGGREGATES] + ["sketches.npz"]:
+            if os.path.exists(os.path.join(self.state_dir, name)):
+                os.remove(os.path.join(self.state_dir, name))  # the single-directory layout of version 1
+
+    # ---- folding deltas ----
+
+    def fold(self, name, delta):
+        """Merge a delta frame (with a `bucket` column) into one aggregate."""
+        if delta.empty:
+            return
+        spec = AGGREGATES[name]
+        keys = spec["keys"] + ["bucket"]
+        self.dirty.update(_bucket_key(bucket) for bucket in delta["bucket"].unique())
+        entries = self.entries[name]
+
+        counts = delta.groupby(keys, dropna=False, sort=False).size().rename("delta").reset_index()
+        counts = counts.merge(entries.reset_index(names="entry")[keys + ["entry"]], on=keys, how="left")
+        known = counts["entry"].notna()
+
+        entries.loc[counts.loc[known, "entry"].astype(np.int64), "count"] += counts.loc[known, "delta"].to_numpy()
+        new = counts.loc[~known, keys].assign(count=counts.loc[~known, "delta"].to_numpy())
+        entries = pd.concat([entries, new], ignore_index=True) if len(new) else entries
+        self.entries[name] = entries
+
+        if not spec["distinct"]:
+            return
+        row_entry = delta[keys].merge(entries.reset_index(names="entry")[keys + ["entry"]], on=keys, how="left")
+        row_entry = row_entry["entry"].to_numpy(dtype=np.int64)
+        for column in spec["distinct"]:
+            codes = encode_ids(delta[column], ID_PREFIXES[column])
+            valid = codes >= 0
+            self._add_to_sketch(name, column, row_entry[valid], codes[valid])
+
+    def _add_to_sketch(self, name, column, entries, codes):
+        if self.sketch == "hll":
+            pairs, shift = hll_pairs(entries, codes, self.precision), RANK_BITS
+        else:
+            # codes use all 63 bits, so they are not packed together with the entry
+            pairs, shift = np.column_stack([entries, codes]), 0
+        # only the rows of entries the delta touches need merging; the rest are kept as they are
+        sketch = self.sketches[(name, column)]
+        touched = np.zeros(len(self.entries[name]), dtype=bool)
+        touched[entries] = True
+        mask = touched[sketch[:, 0]]
+        merged = merge_pairs(np.concatenate([sketch[mask], pairs]), shift)
+        self.sketches[(name, column)] = np.concatenate([sketch[~mask], merged])
+
+    def fold_source(self, source, delta, doctors=None):
+        """Fold a delta of one raw table into every aggregate fed by it."""
+        date_column = SOURCES[source]["date"]
+        if date_column:
+            bucket = delta[date_column].astype("string").str.slice(0, 7)
+        else:
+            bucket = pd.Series("", index=delta.index)
+        delta = delta.assign(bucket=bucket.astype(object))
+        if source == "visits":
+            hospitals = doctors.drop_duplicates("doctor_id", keep="last")[["doctor_id", "hospital"]]
+            delta = delta.merge(hospitals, on="doctor_id", how="left")
+        for name, spec in AGGREGATES.items():
+            if spec["source"] == source:
+                self.fold(name, delta)
+
+    # ---- queries ----
+
+    def totals(self, name, buckets=None):
+        """
+        Roll an aggregate up over month buckets (all, or only those in `buckets`):
+        one row per group with `count` and `distinct_<column>` for each sketch.
+        """
+        spec = AGGREGATES[name]
+        entries = self.entries[name]
+        selected = entries["bucket"].isin(buckets).to_numpy() if buckets is not None else np.ones(len(entries), bool)
+
+        # ngroup(sort=False) numbers groups by first appearance, matching drop_duplicates() order
+        group_codes = entries.groupby(spec["keys"], dropna=False, sort=False).ngroup().to_numpy()
+        groups = entries[spec["keys"]].drop_duplicates()
+        result = groups.reset_index(drop=True)
+        result["count"] = np.bincount(group_codes[selected], weights=entries["count"].to_numpy()[selected],
+                                      minlength=len(groups)).astype(np.int64)
+
+        for column in spec["distinct"]:
+            sketch = self.sketches[(name, column)]
+            keep = selected[sketch[:, 0]]
+            pairs = np.column_stack([group_codes[sketch[keep, 0]], sketch[keep, 1]])
+            if self.sketch == "hll":
+                pairs = merge_pairs(pairs, RANK_BITS)
+                registers = np.zeros((len(groups), 1 << self.precision), dtype=np.uint8)
+                registers[pairs[:, 0], pairs[:, 1] >> RANK_BITS] = pairs[:, 1] & ((1 << RANK_BITS) - 1)
+                result[f"distinct_{column}"] = hll_estimate(registers)
+            else:
+                pairs = merge_pairs(pairs)
+                result[f"distinct_{column}"] = np.bincount(pairs[:, 0], minlength=len(groups)).astype(np.int64)
+        return result[result["count"] > 0].reset_index(drop=True)
+
+    def monthly(self, name):
+        """Row counts per month bucket for one aggregate."""
+        entries = self.entries[name]
+        return entries.groupby("bucket")["count"].sum().sort_index()
+
+    # ---- outputs ----
+
+    def doctor_summary(self, doctors):
+        t = self.totals("doctor").rename(columns={"count": "total_visits", "distinct_patient_id": "unique_patients"})
+        return t.merge(doctors, on="doctor_id", how="left")
+
+    def visit_reason_analysis(self):
+        return self.totals("reason").rename(columns={"count": "total_visits", "distinct_patient_id": "unique_patients"})
+
+    def hospital_visits(self):
+        return self.totals("hospital").rename(columns={"count": "total_visits", "distinct_patient_id": "unique_patients",
+                                                       "distinct_doctor_id": "active_doctors"})
+
+    def lab_result_distribution(self):
+        return self.totals("lab_result").rename(columns={"count": "report_count"})
+
+    def city_distribution(self):
+        return self.totals("city").rename(columns={"count": "patient_count"})
+
+    def value_counts(self, name):
+        """{value: count} for a single-key aggregate, largest first (like Series.value_counts)."""
+        t = self.totals(name).sort_values("count", ascending=False, kind="stable")
+        return dict(zip(t[AGGREGATES[name]["keys"][0]], t["count"].tolist()))
+
+    def row_count(self, source):
+        name = next(n for n, spec in AGGREGATES.items() if spec["source"] == source)
+        return int(self.entries[name]["count"].sum())
+
+
+# ---------------------------------------------------------------------------
+# Refresh from the raw files
+# ---------------------------------------------------------------------------
+
+def _stale_reason(store, raw_dir, lookups):
+    """Why the saved state cannot be extended by appends alone, or None if it can."""
+    if store.offsets and (store.sketch != AGGREGATE_CONFIG["sketch"] or
+                          (store.sketch == "hll" and store.precision != AGGREGATE_CONFIG["hll_precision"])):
+        return f"sketch settings changed to {AGGREGATE_CONFIG['sketch']}"
+    for source, spec in SOURCES.items():
+        position = store.offsets.get(source)
+        if position and not appended_since(os.path.join(raw_dir, spec["file"]), position):
+            return f"{spec['file']} was rewritten"
+    if any(source in store.offsets for source in SOURCES):
+        for name, position in lookups.items():
+            if store.offsets.get(name) != position:
+                return f"{LOOKUPS[name]} changed"
+    return None
+
+
+def refresh(raw_dir=RAW_DIR, state_dir=STATE_DIR):
+    """Fold rows appended to the raw files since the last refresh; returns (store, rows folded per source)."""
+    store = AggregateStore.load(state_dir)
+    lookups = {name: file_position(os.path.join(raw_dir, file_name), TAIL_WINDOW)
+               for name, file_name in LOOKUPS.items()}
+    reason = _stale_reason(store, raw_dir, lookups)
+    if reason:
+        print(f"  [INFO] {reason} - rebuilding aggregate state")
+        store = AggregateStore(state_dir)
+
+    doctors = read_table("doctors", encode=False, parse_dates=False, raw_dir=raw_dir)
+    folded = {}
+    for source, spec in SOURCES.items():
+        path = os.path.join(raw_dir, spec["file"])
+        offset = store.offsets.get(source, {}).get("offset", 0)
+        rows = 0
+        for chunk in read_delta(path, offset):
+            store.fold_source(source, chunk, doctors)
+            rows += len(chunk)
+        store.offsets[source] = file_position(path, TAIL_WINDOW)
+        folded[source] = rows
+    store.offsets.update(lookups)
+
+    store.save()
+    return store, folded
+
+
+def dashboard_counters(store):
+    """Dashboard sections that depend on patients, visits and lab reports, answered from the state."""
+    return {
+        "total_patients": store.row_count("patients"),
+        "total_visits": store.row_count("visits"),
+        "total_lab_reports": store.row_count("lab_reports"),
+        "total_cities": int(len(store.totals("city"))),
+        "gender_distribution": store.value_counts("gender"),
+        "blood_group_distribution": store.value_counts("blood_group"),
+        "visit_type_distribution": store.value_counts("visit_type"),
+        "lab_test_types": store.totals("lab_result").groupby("test_type")["count"].sum()
+                               .sort_values(ascending=False, kind="stable").to_dict(),
+        "lab_results_overview": store.totals("lab_result").groupby("result")["count"].sum()
+                                     .sort_values(ascending=False, kind="stable").to_dict(),
+        "monthly_visits": {k: int(v) for k, v in store.monthly("visit_type").items()},
+    }
+
+
+def write_processed(store, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR, output_format=None):
+    """Write the aggregations from the state store to data/processed/ (same layout as the transforms)."""
+    output_format = output_format or SPARK_CONFIG["output_format"]
+    doctors = read_table("doctors", encode=False, parse_dates=False, raw_dir=raw_dir)
+    outputs = {
+        "doctor_summary": store.doctor_summary(doctors),
+        "city_distribution": store.city_distribution(),
+        "visit_reason_analysis": store.visit_reason_analysis(),
+        "lab_result_distribution": store.lab_result_distribution(),
+        "hospital_visits": store.hospital_visits(),
+    }
+    for folder_name, df in outputs.items():
+        write_output(df, folder_name, output_format, processed_dir)
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold new raw rows into the aggregate state store")
+    parser.add_argument("--no-write", action="store_true", help="only update the state, do not rewrite data/processed/")
+    args = parser.parse_args()
+
+    store, folded = refresh()
+    print(f"  [OK] Folded {folded} new rows into {STATE_DIR}")
+    if not args.no_write:
+        write_processed(store)
+        print("  [OK] Aggregates written to data/processed/")
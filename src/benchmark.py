@@ -0,0 +1,311 @@
+"""
+End-to-end benchmark harness.
+
+Generates (or reuses) a synthetic dataset per scale factor with
+src/synthetic_data.py and times each pipeline stage on it:
+
+    validation       streaming TableValidators over the four CSVs
+    ingest           parallel MySQL load (only with --with-db)
+    transform        transform step on --backend (local by default)
+    dashboard        generate_dashboard_data on the transform output
+    cube             olap_cube (cubes + dashboard export)
+    patient_records  generate_patient_records
+    features         patient_features on --backend (full build)
+
+Every stage runs in a fresh process, so its peak RSS is measured on its
+own. Results (seconds, rows/sec, peak MB) are saved to
+data/benchmarks/run_<timestamp>.json and compared against a stored
+baseline; stages that got slower or bigger by more than --threshold are
+reported as regressions and the run exits non-zero.
+
+The parse cache (src/parse_cache.py) is never the shared data/cache/raw/,
+whose contents would depend on earlier runs. --parse-cache picks the mode,
+which is saved with the results; runs are only compared with a baseline
+taken in the same mode:
+
+    cold   each stage process starts with its own empty cache (the default),
+           so it pays for parsing its inputs, as on a first run
+    warm   one cache per scale, filled before any stage is timed, so stages
+           measure reads from the mapped entries
+    off    PARSE_CACHE=false; every read parses the CSVs
+
+    python -m src.benchmark --scales 1 10 --save-baseline
+    python -m src.benchmark --scales 1 10
+    python -m src.benchmark --scales 10 --parse-cache warm
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+from datetime import datetime
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.synthetic_data import SYNTHETIC_DIR, generate_dataset, load_dataset_info
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.join(BASE_DIR, "data", "benchmarks")
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+STAGES = ["validation", "ingest", "transform", "dashboard", "cube", "patient_records", "features"]
+DEFAULT_STAGES = ["validation", "transform", "dashboard", "cube", "patient_records", "features"]
+# Stages that read another stage's output
+STAGE_REQUIRES = {"dashboard": ["transform"]}
+PARSE_CACHE_MODES = ["cold", "warm", "off"]
+
+# Changes smaller than these are treated as noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.5
+MIN_MEMORY_DELTA_MB = 32
+
+
+# ---------- Stages (run inside a worker process) ----------
+
+def stage_validation(raw_dir, work_dir, **options):
+    from src.data_validation import build_validators, validate_file_chunked
+    validators = build_validators(quarantine_dir=os.path.join(work_dir, "quarantine"))
+    for table_name, validator in validators.items():
+        for _ in validate_file_chunked(os.path.join(raw_dir, f"{table_name}.csv"), validator):
+            pass
+    return sum(v.rows_in for v in validators.values())
+
+
+def stage_ingest(raw_dir, work_dir, **options):
+    from src.parallel_ingest import load_all_tables
+    results = load_all_tables(raw_dir, quarantine_dir=os.path.join(work_dir, "quarantine"))
+    return sum(r["rows"] for r in results.values())
+
+
+def stage_transform(raw_dir, work_dir, backend="local", **options):
+    from src.transform_backend import run_transform
+    run_transform(backend, raw_dir=raw_dir, processed_dir=os.path.join(work_dir, "processed"))
+
+
+def stage_dashboard(raw_dir, work_dir, **options):
+    from src.generate_dashboard_data import generate
+    generate(force=True, cache_file=os.path.join(work_dir, "dashboard_cache.json"), raw_dir=raw_dir,
+             processed_dir=os.path.join(work_dir, "processed"),
+             output_file=os.path.join(work_dir, "dashboard_data.json"))
+
+
+def stage_cube(raw_dir, work_dir, **options):
+    from src.olap_cube import generate
+    generate(raw_dir=raw_dir, cube_dir=os.path.join(work_dir, "cube"),
+             output_file=os.path.join(work_dir, "cube_data.json"))
+
+
+def stage_patient_records(raw_dir, work_dir, **options):
+    from src.generate_patient_records import generate
+    generate(raw_dir=raw_dir, output_file=os.path.join(work_dir, "patient_records.json"))
+
+
+def stage_features(raw_dir, work_dir, backend="local", **options):
+    from src.patient_features import generate
+    generate(backend=backend, raw_dir=raw_dir, features_dir=os.path.join(work_dir, "features"),
+             state_file=os.path.join(work_dir, "features_state.json"))
+
+
+STAGE_FUNCTIONS = {
+    "validation": stage_validation,
+    "ingest": stage_ingest,
+    "transform": stage_transform,
+    "dashboard": stage_dashboard,
+    "cube": stage_cube,
+    "patient_records": stage_patient_records,
+    "features": stage_features,
+}
+
+
+def _peak_memory_mb():
+    """Peak resident set size of this process in MB (None where `resource` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_stage(stage, raw_dir, work_dir, options):
+    start = time.perf_counter()
+    rows = STAGE_FUNCTIONS[stage](raw_dir, work_dir, **options)
+    return {"seconds": time.perf_counter() - start, "rows": rows, "peak_mb": _peak_memory_mb()}
+
+
+def _warm_parse_cache(raw_dir):
+    from src.raw_reader import TABLES, cached_raw_table
+    for table_name in TABLES:
+        cached_raw_table(table_name, raw_dir=raw_dir)
+
+
+def run_in_process(fn, *args, env=None):
+    """Call fn(*args) in a fresh (spawned) process started with `env` added to its environment."""
+    env = env or {}
+    saved = {key: os.environ.get(key) for key in env}
+    # src.config reads the environment on import, so the settings must be in place when the process starts
+    os.environ.update(env)
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            return pool.submit(fn, *args).result()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def parse_cache_env(mode, cache_dir):
+    """Environment for a stage process in one of PARSE_CACHE_MODES."""
+    if mode not in PARSE_CACHE_MODES:
+        raise ValueError(f"Unknown parse cache mode `{mode}`; expected one of {PARSE_CACHE_MODES}")
+    if mode == "off":
+        return {"PARSE_CACHE": "false"}
+    return {"PARSE_CACHE": "true", "PARSE_CACHE_DIR": cache_dir}
+
+
+def run_stage(stage, raw_dir, work_dir, options, env=None):
+    """Run one stage in a fresh (spawned) process and return its measurements."""
+    return run_in_process(_run_stage, stage, raw_dir, work_dir, options, env=env)
+
+
+# ---------- Harness ----------
+
+def prepare_dataset(scale, seed, regenerate=False):
+    """Return (raw_dir, dataset info) for a scale factor, generating it if needed."""
+    raw_dir = os.path.join(SYNTHETIC_DIR, f"x{scale:g}")
+    info = load_dataset_info(raw_dir)
+    if regenerate or not info or info.get("seed") != seed or info.get("scale") != scale:
+        print(f"\n[DATA] Generating scale x{scale:g} (seed {seed})...")
+        info = generate_dataset(raw_dir, scale, seed)
+    return raw_dir, info
+
+
+def run_benchmarks(scales, stages=None, seed=42, backend="local", regenerate=False, parse_cache="cold"):
+    """Time every stage at every scale; returns the run document (not yet saved)."""
+    parse_cache_env(parse_cache, "")  # fail on an unknown mode before generating anything
+    stages = set(stages or DEFAULT_STAGES)
+    stages |= {required for stage in stages for required in STAGE_REQUIRES.get(stage, [])}
+    stages = [s for s in STAGES if s in stages]
+    results = []
+    for scale in scales:
+        raw_dir, info = prepare_dataset(scale, seed, regenerate)
+        total_rows = sum(info["rows"].values())
+        work_dir = os.path.join(BENCHMARK_DIR, "work", f"x{scale:g}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        cache_dir = os.path.join(work_dir, "parse_cache")
+        if parse_cache == "warm":
+            print(f"\n[INFO] Warming the parse cache for x{scale:g}")
+            run_in_process(_warm_parse_cache, raw_dir, env=parse_cache_env(parse_cache, cache_dir))
+
+        for stage in stages:
+            print(f"\n[BENCH] {stage} @ x{scale:g} ({total_rows:,} input rows)")
+            stage_cache_dir = os.path.join(cache_dir, stage) if parse_cache == "cold" else cache_dir
+            try:
+                measured = run_stage(stage, raw_dir, work_dir, {"backend": backend},
+                                     env=parse_cache_env(parse_cache, stage_cache_dir))
+            except Exception as e:
+                print(f"  [WARN] {stage} failed: {e}")
+                results.append({"scale": scale, "stage": stage, "error": str(e)})
+                continue
+            rows = measured["rows"] if measured["rows"] is not None else total_rows
+            result = {
+                "scale": scale,
+                "stage": stage,
+                "rows": rows,
+                "seconds": round(measured["seconds"], 3),
+                "rows_per_sec": round(rows / measured["seconds"]) if measured["seconds"] > 0 else None,
+                "peak_mb": round(measured["peak_mb"], 1) if measured["peak_mb"] is not None else None,
+            }
+            results.append(result)
+            print(f"  [OK] {result['seconds']:.2f}s, {result['rows_per_sec'] or 0:,} rows/sec, "
+                  f"peak {result['peak_mb']} MB")
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "seed": seed,
+        "backend": backend,
+        "parse_cache": parse_cache,
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count()},
+        "results": results,
+    }
+
+
+def compare(run, baseline, threshold=0.2):
+    """List the (scale, stage) results that are slower or use more memory than the baseline."""
+    previous = {(r["scale"], r["stage"]): r for r in baseline.get("results", []) if "error" not in r}
+    regressions = []
+    for result in run["results"]:
+        base = previous.get((result["scale"], result["stage"]))
+        if base is None or "error" in result:
+            continue
+        checks = [("seconds", MIN_SECONDS_DELTA, "s"), ("peak_mb", MIN_MEMORY_DELTA_MB, " MB")]
+        for metric, min_delta, unit in checks:
+            old, new = base.get(metric), result.get(metric)
+            if old is None or new is None or old <= 0:
+                continue
+            if new > old * (1 + threshold) and new - old > min_delta:
+                regressions.append({"scale": result["scale"], "stage": result["stage"], "metric": metric,
+                                    "baseline": old, "current": new, "change": round(new / old - 1, 3),
+                                    "unit": unit})
+    return regressions
+
+
+def save_json(document, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10],
+                        help="scale factors relative to data/raw (default: 1 10)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=None,
+                        help=f"stages to run (default: {' '.join(DEFAULT_STAGES)})")
+    parser.add_argument("--with-db", action="store_true", help="include the MySQL ingest stage")
+    parser.add_argument("--backend", default="local", choices=["local", "spark", "auto"])
+    parser.add_argument("--parse-cache", default="cold", choices=PARSE_CACHE_MODES,
+                        help="parse cache mode for the stage processes (default: cold)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--regenerate", action="store_true", help="regenerate the synthetic datasets")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown / memory growth reported as a regression (default: 0.2)")
+    args = parser.parse_args()
+
+    stages = args.stages or list(DEFAULT_STAGES)
+    if args.with_db and "ingest" not in stages:
+        stages.append("ingest")
+
+    run = run_benchmarks(args.scales, stages, args.seed, args.backend, args.regenerate, args.parse_cache)
+    run_file = os.path.join(BENCHMARK_DIR, f"run_{datetime.now():%Y%m%d_%H%M%S}.json")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("parse_cache") != run["parse_cache"]:
+            print(f"\n[WARN] Baseline was taken with parse cache `{baseline.get('parse_cache')}`, "
+                  f"this run with `{run['parse_cache']}`; not compared")
+        else:
+            regressions = compare(run, baseline, args.threshold)
+            run["regressions"] = regressions
+    save_json(run, run_file)
+    print(f"\n[OK] Results written to {run_file}")
+
+    if args.save_baseline:
+        save_json(run, args.baseline)
+        print(f"[OK] Baseline saved to {args.baseline}")
+    for r in regressions:
+        print(f"[REGRESSION] {r['stage']} @ x{r['scale']:g}: {r['metric']} "
+              f"{r['baseline']}{r['unit']} -> {r['current']}{r['unit']} (+{r['change']:.0%})")
+    sys.exit(1 if regressions else 0)
@@ -9,3 +9,81 @@ DB_CONFIG = {
     "password": os.getenv("DB_PASSWORD", "123456789"),
     "database": os.getenv("DB_NAME", "healthcare_db")
 }
+
+# Bulk ingestion settings (see src/etl_ingest.py)
+INGEST_CONFIG = {
+    "chunksize": int(os.getenv("INGEST_CHUNKSIZE", "50000")),
+    "batch_size": int(os.getenv("INGEST_BATCH_SIZE", "1000")),
+    "commit_every": int(os.getenv("INGEST_COMMIT_EVERY", "10000")),
+    "use_load_data": os.getenv("INGEST_LOAD_DATA", "false").lower() in ("1", "true", "yes"),
+}
+
+# Connection pool settings (see src/db_connection.py); mysql-connector caps pools at 32
+DB_POOL_CONFIG = {
+    "size": int(os.getenv("DB_POOL_SIZE", "8")),
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+}
+
+# Spark execution settings (see src/pyspark_transform.py)
+SPARK_CONFIG = {
+    "tuned": os.getenv("SPARK_TUNED", "true").lower() in ("1", "true", "yes"),
+    # 0 = derive from the local core count
+    "shuffle_partitions": int(os.getenv("SPARK_SHUFFLE_PARTITIONS", "0")),
+    "broadcast_threshold": int(os.getenv("SPARK_BROADCAST_THRESHOLD", str(64 * 1024 * 1024))),
+    # "csv" or "parquet" for everything written under data/processed/
+    "output_format": os.getenv("PROCESSED_FORMAT", "csv").lower(),
+    "parquet_compression": os.getenv("PARQUET_COMPRESSION", "snappy"),
+}
+
+# Transform backend selection (see src/transform_backend.py)
+TRANSFORM_CONFIG = {
+    # auto | spark | local
+    "backend": os.getenv("TRANSFORM_BACKEND", "auto").lower(),
+    # "auto" runs in-process below this total raw input size
+    "local_max_bytes": int(os.getenv("TRANSFORM_LOCAL_MAX_BYTES", str(512 * 1024 * 1024))),
+}
+
+# Typed raw CSV reader (see src/raw_reader.py)
+RAW_READER_CONFIG = {
+    # pyarrow (multithreaded, typed in Arrow) | c (pandas' parser)
+    "engine": os.getenv("CSV_ENGINE", "pyarrow").lower(),
+}
+
+# Incremental aggregate state (see src/aggregate_state.py)
+AGGREGATE_CONFIG = {
+    # exact | hll - sketch used for distinct counts
+    "sketch": os.getenv("AGGREGATE_SKETCH", "hll").lower(),
+    "hll_precision": int(os.getenv("AGGREGATE_HLL_PRECISION", "12")),
+}
+
+# Portal query service (see src/query_service.py)
+QUERY_SERVICE_CONFIG = {
+    "host": os.getenv("QUERY_SERVICE_HOST", "127.0.0.1"),
+    "port": int(os.getenv("QUERY_SERVICE_PORT", "8765")),
+    # auto | mysql | memory (auto uses MySQL when it is reachable, else the CSVs)
+    "backend": os.getenv("QUERY_SERVICE_BACKEND", "auto").lower(),
+    "cache_size": int(os.getenv("QUERY_CACHE_SIZE", "10000")),
+    "cache_ttl": float(os.getenv("QUERY_CACHE_TTL", "60")),
+}
+
+# Stage scheduler (see src/scheduler.py)
+PIPELINE_CONFIG = {
+    # stages that may run at the same time
+    "workers": int(os.getenv("PIPELINE_WORKERS", "4")),
+}
+
+# OLAP cubes for dashboard drill-downs (see src/olap_cube.py)
+CUBE_CONFIG = {
+    "compression": os.getenv("CUBE_COMPRESSION", "zstd"),
+    # smaller row groups let date-range loads skip more of the file
+    "row_group_size": int(os.getenv("CUBE_ROW_GROUP_SIZE", "16384")),
+    # day | week | month | quarter | year - grain of dashboard/cube_data.json (data/cube/ stays at day grain)
+    "export_grain": os.getenv("CUBE_EXPORT_GRAIN", "month").lower(),
+}
+
+# Parsed raw-CSV cache shared by the pipeline stages (see src/parse_cache.py)
+PARSE_CACHE_CONFIG = {
+    "enabled": os.getenv("PARSE_CACHE", "true").lower() in ("1", "true", "yes"),
+    # where the entries live; empty = data/cache/raw/
+    "dir": os.getenv("PARSE_CACHE_DIR", ""),
+}
@@ -1,5 +1,13 @@
+import os
+import json
+import time
+
+import numpy as np
 import pandas as pd
 
+from src.id_codec import ID_PREFIXES, TABLE_KEYS, INVALID_ID, encode_ids
+from src.raw_reader import read_table_chunks
+
 
 def validate_patients(df):
     """Validate patient data - drop nulls, ensure valid fields."""
@@ -29,3 +37,231 @@ def validate_lab_reports(df):
     df = df.dropna(subset=['report_id', 'visit_id'])
     df = df.drop_duplicates(subset=['report_id'])
     return df
+
+
+# ---------------------------------------------------------------------------
+# Streaming validation: bounded memory, cross-chunk dedup, FK checks, quarantine
+# ---------------------------------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUARANTINE_DIR = os.path.join(BASE_DIR, "data", "quarantine")
+
+# Per-table rules. Rules are applied in order: not-null, allowed values,
+# foreign keys, then primary-key uniqueness; a rejected row gets the first rule it fails.
+VALIDATION_RULES = {
+    "patients": {
+        "not_null": ["patient_id", "name"],
+        "allowed": {"gender": ["M", "F", "Other"]},
+        "foreign_keys": {},
+    },
+    "doctors": {
+        "not_null": ["doctor_id", "name"],
+        "allowed": {},
+        "foreign_keys": {},
+    },
+    "visits": {
+        "not_null": ["visit_id", "patient_id", "doctor_id"],
+        "allowed": {},
+        "foreign_keys": {"patient_id": "patients", "doctor_id": "doctors"},
+    },
+    "lab_reports": {
+        "not_null": ["report_id", "visit_id"],
+        "allowed": {},
+        "foreign_keys": {"visit_id": "visits"},
+    },
+}
+
+
+class KeySet:
+    """
+    Compact set of integer-encoded IDs.
+    Stored as a byte-per-ID bitmap over [base, base + span) while the ID range is
+    dense (the generated IDs are sequential); switches to a sorted int64 array if
+    the range grows beyond `max_dense_span`.
+    Malformed IDs all encode to INVALID_ID, so when their raw `text` is passed
+    they are kept and looked up by that string instead, in a plain set.
+    """
+
+    def __init__(self, max_dense_span=1 << 28):
+        self.max_dense_span = max_dense_span
+        self._base = None
+        self._bits = np.zeros(0, dtype=bool)
+        self._sorted = None
+        self._malformed = set()
+
+    def __len__(self):
+        if self._sorted is not None:
+            return len(self._sorted) + len(self._malformed)
+        return int(np.count_nonzero(self._bits)) + len(self._malformed)
+
+    def contains(self, codes, text=None):
+        """
+        Vectorised membership test; returns a boolean array aligned with `codes`.
+        INVALID_ID rows are matched on `text` (their raw ID strings) when given.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        found = np.zeros(len(codes), dtype=bool)
+        if self._sorted is not None:
+            if len(self._sorted):
+                idx = np.minimum(np.searchsorted(self._sorted, codes), len(self._sorted) - 1)
+                found = self._sorted[idx] == codes
+        elif self._base is not None:
+            rel = codes - self._base
+            inside = (rel >= 0) & (rel < len(self._bits))
+            found[inside] = self._bits[rel[inside]]
+
+        malformed = codes == INVALID_ID
+        found[malformed] = False
+        if text is not None and self._malformed and malformed.any():
+            found[malformed] = pd.Series(np.asarray(text, dtype=object)[malformed]).isin(self._malformed).to_numpy()
+        return found
+
+    def add(self, codes, text=None):
+        codes = np.asarray(codes, dtype=np.int64)
+        if text is not None:
+            self._malformed.update(np.asarray(text, dtype=object)[codes == INVALID_ID])
+        codes = codes[codes != INVALID_ID]
+        if not len(codes):
+            return
+
+        if self._sorted is not None:
+            self._sorted = np.unique(np.concatenate([self._sorted, codes]))
+            return
+
+        lo, hi = int(codes.min()), int(codes.max())
+        if self._base is None:
+            base, end = lo, hi + 1
+        else:
+            base, end = min(self._base, lo), max(self._base + len(self._bits), hi + 1)
+
+        if end - base > self.max_dense_span:
+            existing = np.flatnonzero(self._bits).astype(np.int64) + (self._base or 0)
+            self._sorted = np.unique(np.concatenate([existing, codes]))
+            self._bits = None
+            return
+
+        if self._base is None or base < self._base or end - base > len(self._bits):
+            # Grow geometrically to the right so appends of new IDs stay amortised O(1)
+            size = max(end - base, min(2 * len(self._bits), self.max_dense_span))
+            bits = np.zeros(size, dtype=bool)
+            if self._base is not None:
+                offset = self._base - base
+                bits[offset:offset + len(self._bits)] = self._bits
+            self._base, self._bits = base, bits
+        self._bits[codes - self._base] = True
+
+
+class TableValidator:
+    """
+    Validates one table chunk by chunk.
+    Primary keys accepted so far are kept in a KeySet, so duplicates are caught
+    across chunks; foreign keys are checked against the parents' KeySets.
+    Malformed IDs (INVALID_ID) are compared by their raw text in both checks.
+    Rejected rows are appended to <quarantine_dir>/<table>_rejected.csv with a
+    `reject_reason` column, and per-rule counts are kept in `self.counts`.
+    """
+
+    def __init__(self, table_name, parent_keys=None, quarantine_dir=QUARANTINE_DIR):
+        self.table_name = table_name
+        self.rules = VALIDATION_RULES[table_name]
+        self.key_column = TABLE_KEYS[table_name]
+        self.parent_keys = parent_keys or {}
+        self.keys = KeySet()
+        self.quarantine_file = os.path.join(quarantine_dir, f"{table_name}_rejected.csv") if quarantine_dir else None
+        self.counts = {}
+        self.rows_in = 0
+        self.rows_out = 0
+        self.seconds = 0.0
+        self._quarantine_started = False
+
+    def _reject(self, reasons, mask, reason):
+        """Assign `reason` to rows in `mask` that have not been rejected yet."""
+        mask = mask & (reasons == "")
+        n = int(mask.sum())
+        if n:
+            reasons[mask] = reason
+            self.counts[reason] = self.counts.get(reason, 0) + n
+
+    def validate(self, df):
+        """Return the valid rows of `df`; rejected rows go to quarantine."""
+        start = time.perf_counter()
+        self.rows_in += len(df)
+        reasons = np.full(len(df), "", dtype=object)
+
+        for column in self.rules["not_null"]:
+            self._reject(reasons, df[column].isna().to_numpy(), f"missing_{column}")
+
+        for column, allowed in self.rules["allowed"].items():
+            self._reject(reasons, ~df[column].isin(allowed).to_numpy(), f"invalid_{column}")
+
+        for column, parent in self.rules["foreign_keys"].items():
+            if parent in self.parent_keys:
+                codes = encode_ids(df[column], ID_PREFIXES[column])
+                found = self.parent_keys[parent].contains(codes, df[column].to_numpy(dtype=object))
+                self._reject(reasons, ~found, f"unknown_{column}")
+
+        text = df[self.key_column].to_numpy(dtype=object)
+        codes = encode_ids(df[self.key_column], ID_PREFIXES[self.key_column])
+        duplicate = self.keys.contains(codes, text)
+        pending = reasons == ""
+        # Within the chunk, keep the first occurrence among otherwise-valid rows;
+        # malformed IDs all share INVALID_ID, so they are told apart by their text
+        keys = pd.DataFrame({"code": codes, "text": np.where(codes == INVALID_ID, text, "")})
+        in_chunk = np.zeros(len(df), dtype=bool)
+        in_chunk[pending] = keys[pending].duplicated().to_numpy()
+        self._reject(reasons, duplicate | in_chunk, f"duplicate_{self.key_column}")
+
+        valid = reasons == ""
+        self.keys.add(codes[valid], text[valid])
+        self.rows_out += int(valid.sum())
+
+        if self.quarantine_file and (~valid).any():
+            self._write_quarantine(df[~valid].assign(reject_reason=reasons[~valid]))
+        self.seconds += time.perf_counter() - start
+        return df[valid]
+
+    def _write_quarantine(self, rejected):
+        os.makedirs(os.path.dirname(self.quarantine_file), exist_ok=True)
+        rejected.to_csv(self.quarantine_file, mode="a" if self._quarantine_started else "w",
+                        header=not self._quarantine_started, index=False)
+        self._quarantine_started = True
+
+    def report(self):
+        return {
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rejected": self.rows_in - self.rows_out,
+            "rejected_by_rule": dict(self.counts),
+            "seconds": round(self.seconds, 3),
+            "quarantine_file": self.quarantine_file if self._quarantine_started else None,
+        }
+
+
+def build_validators(tables=None, quarantine_dir=QUARANTINE_DIR):
+    """Create a TableValidator per table, wired to its FK parents' key sets."""
+    tables = tables or list(VALIDATION_RULES)
+    validators = {}
+    # VALIDATION_RULES is declared parents-first, so parents exist before children
+    for table_name in VALIDATION_RULES:
+        if table_name not in tables:
+            continue
+        parents = {p: validators[p].keys for p in VALIDATION_RULES[table_name]["foreign_keys"].values()
+                   if p in validators}
+        validators[table_name] = TableValidator(table_name, parents, quarantine_dir)
+    return validators
+
+
+def validate_file_chunked(file_path, validator, chunksize=50000):
+    """Stream a CSV through a TableValidator, yielding valid chunks."""
+    for chunk in read_table_chunks(validator.table_name, chunksize, path=file_path):
+        valid = validator.validate(chunk)
+        if not valid.empty:
+            yield valid
+
+
+def write_quarantine_summary(validators, quarantine_dir=QUARANTINE_DIR):
+    """Write per-table, per-rule rejection counts to <quarantine_dir>/summary.json."""
+    summary = {name: v.report() for name, v in validators.items()}
+    os.makedirs(quarantine_dir, exist_ok=True)
+    with open(os.path.join(quarantine_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
@@ -1,6 +1,71 @@
+import time
+import threading
+from contextlib import contextmanager
+
 import mysql.connector
-from src.config import DB_CONFIG
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from src.config import DB_CONFIG, DB_POOL_CONFIG, INGEST_CONFIG
+
+
+class ConnectionPool:
+    """
+    Thread-safe wrapper around mysql-connector's connection pool.
+    Unlike the raw pool, get_connection() waits for a free connection
+    instead of failing when every connection is checked out.
+    """
+
+    def __init__(self, size=None, name="healthcare_pool", **overrides):
+        self.size = min(size or DB_POOL_CONFIG["size"], pooling.CNX_POOL_MAXSIZE)
+        self._pool = pooling.MySQLConnectionPool(
+            pool_name=name,
+            pool_size=self.size,
+            pool_reset_session=True,
+            **{**DB_CONFIG, **overrides}
+        )
+
+    def get_connection(self, timeout=None):
+        """Check out a connection; calling close() on it returns it to the pool."""
+        timeout = DB_POOL_CONFIG["timeout"] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self._pool.get_connection()
+            except PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.01)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks out a connection and always returns it."""
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(allow_local_infile=INGEST_CONFIG["use_load_data"])
+    return _pool
+
 
-def get_connection():
-    """Establish and return a MySQL database connection."""
-    return mysql.connector.connect(**DB_CONFIG)
+def get_connection(pooled=False, **overrides):
+    """
+    Establish and return a MySQL database connection.
+    With pooled=True the connection is checked out from the shared pool.
+    Keyword arguments override DB_CONFIG (e.g. allow_local_infile=True).
+    """
+    if pooled and not overrides:
+        return get_pool().get_connection()
+    return mysql.connector.connect(**{**DB_CONFIG, **overrides})
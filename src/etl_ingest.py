@@ -1,29 +1,118 @@
-import pandas as pd
+import os
+import time
+import tempfile
+from src.config import INGEST_CONFIG
 from src.db_connection import get_connection
+from src.raw_reader import read_table_chunks
 from src.data_validation import validate_patients, validate_doctors, validate_visits, validate_lab_reports
 
 
-def load_csv_to_mysql(file_path, table_name, validator=None):
+def build_insert_sql(table_name, columns):
+    """Build a parameterised INSERT IGNORE statement for the given columns."""
+    placeholders = ', '.join(['%s'] * len(columns))
+    return f"INSERT IGNORE INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+
+
+def build_upsert_sql(table_name, columns, key_column):
+    """Build an INSERT ... ON DUPLICATE KEY UPDATE statement that refreshes every non-key column."""
+    placeholders = ', '.join(['%s'] * len(columns))
+    updates = ', '.join(f"{c} = VALUES({c})" for c in columns if c != key_column)
+    return (f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON DUPLICATE KEY UPDATE {updates}")
+
+
+def frame_to_rows(df):
+    """Convert a DataFrame to a list of tuples of native Python values (NaN -> None)."""
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+
+def insert_frame(conn, cursor, table_name, df, batch_size=None, commit_every=None, sql=None, pending=0):
+    """
+    Insert a DataFrame with batched executemany calls.
+    mysql-connector rewrites each executemany batch into a single multi-row INSERT.
+    Commits every `commit_every` rows; returns the number of uncommitted rows.
+    """
+    batch_size = batch_size or INGEST_CONFIG["batch_size"]
+    commit_every = commit_every or INGEST_CONFIG["commit_every"]
+    sql = sql or build_insert_sql(table_name, list(df.columns))
+
+    rows = frame_to_rows(df)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        cursor.executemany(sql, batch)
+        pending += len(batch)
+        if pending >= commit_every:
+            conn.commit()
+            pending = 0
+    return pending
+
+
+def load_data_infile(cursor, table_name, df):
+    """
+    Fast path: write the frame to a temporary CSV and bulk load it with
+    LOAD DATA LOCAL INFILE. Requires local_infile to be enabled on the server.
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        df.to_csv(tmp_path, index=False, header=False, na_rep="\\N", lineterminator="\n")
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {table_name} "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            "LINES TERMINATED BY '\\n' "
+            f"({', '.join(df.columns)})",
+            (tmp_path.replace("\\", "/"),)
+        )
+    finally:
+        os.remove(tmp_path)
+
+
+def load_csv_to_mysql(file_path, table_name, validator=None, chunksize=None,
+                      batch_size=None, commit_every=None, use_load_data=None):
     """
     Load a CSV file into a MySQL table.
     Optionally applies a validation function before insertion.
-    """
-    df = pd.read_csv(file_path)
 
-    if validator:
-        df = validator(df)
+    The file is read in chunks of `chunksize` rows and written with batched
+    multi-row inserts of `batch_size` rows, committing every `commit_every` rows.
+    With `use_load_data=True` each chunk goes through LOAD DATA LOCAL INFILE instead.
+    Defaults come from INGEST_CONFIG. Returns a dict with load statistics.
+    """
+    chunksize = chunksize or INGEST_CONFIG["chunksize"]
+    commit_every = commit_every or INGEST_CONFIG["commit_every"]
+    if use_load_data is None:
+        use_load_data = INGEST_CONFIG["use_load_data"]
 
-    conn = get_connection()
+    start = time.perf_counter()
+    conn = get_connection(allow_local_infile=True) if use_load_data else get_connection()
     cursor = conn.cursor()
 
-    for _, row in df.iterrows():
-        placeholders = ', '.join(['%s'] * len(row))
-        columns = ', '.join(df.columns)
-        sql = f"INSERT IGNORE INTO {table_name} ({columns}) VALUES ({placeholders})"
-        cursor.execute(sql, tuple(row))
+    total_rows = 0
+    pending = 0
+    sql = None
+    try:
+        for chunk in read_table_chunks(table_name, chunksize, path=file_path):
+            if validator:
+                chunk = validator(chunk)
+            if chunk.empty:
+                continue
+
+            if use_load_data:
+                load_data_infile(cursor, table_name, chunk)
+                conn.commit()
+            else:
+                sql = sql or build_insert_sql(table_name, list(chunk.columns))
+                pending = insert_frame(conn, cursor, table_name, chunk, batch_size, commit_every, sql, pending)
+            total_rows += len(chunk)
+
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
 
-    conn.commit()
-    cursor.close()
-    conn.close()
+    elapsed = time.perf_counter() - start
+    rate = total_rows / elapsed if elapsed > 0 else 0.0
+    print(f"  [OK] Loaded {total_rows} rows into `{table_name}` in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
 
-    print(f"  [OK] Loaded {len(df)} rows into `{table_name}`")
+    return {"table": table_name, "rows": total_rows, "seconds": elapsed, "rows_per_sec": rate}
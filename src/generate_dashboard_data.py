@@ -1,84 +1,207 @@
 """
 Generate dashboard_data.json from processed CSVs and MySQL for the frontend dashboard.
+
+Sections are computed in one pass over column-pruned, typed reads of the raw
+files, and the lab sections are derived from the processed aggregates instead
+of the raw lab reports. A content-hash cache of the inputs
+(data/state/dashboard_cache.json) lets unchanged runs skip the build entirely.
+The payload is written compact, next to a gzip copy (dashboard_data.json.gz)
+that admin.html prefers.
 """
 import sys
 import os
+import gzip
 import json
-import glob
+import argparse
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import pandas as pd
+from src.processed_reader import read_processed
+from src.raw_reader import read_table
+from src.parse_cache import input_digest
+from src.aggregate_state import AggregateStore, dashboard_counters, STATE_DIR as AGGREGATE_STATE_DIR
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
 PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
 OUTPUT_FILE = os.path.join(BASE_DIR, "dashboard", "dashboard_data.json")
+CACHE_FILE = os.path.join(BASE_DIR, "data", "state", "dashboard_cache.json")
 
+PROCESSED_INPUTS = ["city_distribution", "doctor_summary", "hospital_visits",
+                    "lab_result_distribution", "visit_reason_analysis"]
 
-def read_spark_csv(folder_name):
-    """Read a Spark partitioned CSV output."""
-    pattern = os.path.join(PROCESSED_DIR, folder_name, "part-*.csv")
-    files = glob.glob(pattern)
-    if files:
-        return pd.read_csv(files[0])
-    return pd.DataFrame()
 
+def read_spark_csv(folder_name, columns=None, processed_dir=PROCESSED_DIR):
+    """Read a Spark output folder (CSV or Parquet, all part files)."""
+    return read_processed(folder_name, columns=columns, processed_dir=processed_dir)
+
+
+# ---------- Input cache ----------
+
+def input_files(from_state=False, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR):
+    """Every file the dashboard is built from, in a stable order."""
+    files = [os.path.join(raw_dir, name) for name in ("patients.csv", "doctors.csv", "visits.csv")]
+    folders = [AGGREGATE_STATE_DIR] if from_state else [os.path.join(processed_dir, f) for f in PROCESSED_INPUTS]
+    for folder in folders:
+        for root, _, names in sorted(os.walk(folder)):
+            files.extend(os.path.join(root, n) for n in sorted(names) if not n.startswith((".", "_")))
+    return [f for f in files if os.path.exists(f)]
+
+
+def load_cache(path=CACHE_FILE):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_cache(cache, path=CACHE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# ---------- Sections ----------
+
+def _counts(series):
+    """value_counts() as a plain {value: int} dict, largest first."""
+    return {k: int(v) for k, v in series.value_counts().items()}
+
+
+def _records(df):
+    """Rows as dicts, with missing values as None (JSON null; a NaN would break JSON.parse)."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
 
-def generate():
-    print("Generating dashboard data...")
 
-    # Raw data
-    patients = pd.read_csv(os.path.join(RAW_DIR, "patients.csv"))
-    doctors = pd.read_csv(os.path.join(RAW_DIR, "doctors.csv"))
-    visits = pd.read_csv(os.path.join(RAW_DIR, "visits.csv"))
-    lab_reports = pd.read_csv(os.path.join(RAW_DIR, "lab_reports.csv"))
-
-    # Processed aggregations
-    city_dist = read_spark_csv("city_distribution")
-    doctor_summary = read_spark_csv("doctor_summary")
-    hospital_visits = read_spark_csv("hospital_visits")
-    lab_result_dist = read_spark_csv("lab_result_distribution")
-    visit_reason = read_spark_csv("visit_reason_analysis")
-
-    # Build dashboard data
-    data = {
+def counters_from_raw(lab_result_dist, raw_dir=RAW_DIR):
+    """
+    Counters over the raw tables (same keys as aggregate_state.dashboard_counters).
+    Only the columns the sections need are read (typed, see src/raw_reader.py);
+    lab sections come from the lab_result_distribution aggregate.
+    """
+    patients = read_table("patients", columns=["city", "gender", "blood_group"], raw_dir=raw_dir)
+    visits = read_table("visits", columns=["visit_type", "visit_date"], raw_dir=raw_dir)
+
+    # Monthly visit trends: count per distinct date, then roll the (few hundred) dates up to months
+    per_date = visits["visit_date"].value_counts()
+    monthly = per_date.groupby(per_date.index.strftime("%Y-%m")).sum().sort_index()
+
+    lab_counts = lab_result_dist["report_count"]
+    return {
+        "total_patients": len(patients),
+        "total_visits": len(visits),
+        "total_lab_reports": int(lab_counts.sum()),
+        "total_cities": patients["city"].nunique(),
+        "gender_distribution": _counts(patients["gender"]),
+        "blood_group_distribution": _counts(patients["blood_group"]),
+        "visit_type_distribution": _counts(visits["visit_type"]),
+        "lab_test_types": {k: int(v) for k, v in lab_counts.groupby(lab_result_dist["test_type"]).sum()
+                           .sort_values(ascending=False, kind="stable").items()},
+        "lab_results_overview": {k: int(v) for k, v in lab_counts.groupby(lab_result_dist["result"]).sum()
+                                 .sort_values(ascending=False, kind="stable").items()},
+        "monthly_visits": {k: int(v) for k, v in monthly.items()},
+    }
+
+
+def build_sections(from_state=False, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR):
+    """Compute every dashboard section; returns the payload dict."""
+    # IDs and dates are shown as-is, so they are not encoded or parsed
+    doctors = read_table("doctors", encode=False, raw_dir=raw_dir)
+    recent_patients = read_table("patients", encode=False, parse_dates=False, nrows=50, raw_dir=raw_dir)
+
+    if from_state:
+        store = AggregateStore.load()
+        counters = dashboard_counters(store)
+        city_dist = store.city_distribution()
+        doctor_summary = store.doctor_summary(doctors)
+        hospital_visits = store.hospital_visits()
+        lab_result_dist = store.lab_result_distribution()
+        visit_reason = store.visit_reason_analysis()
+    else:
+        # Processed aggregations
+        city_dist = read_spark_csv("city_distribution", processed_dir=processed_dir)
+        doctor_summary = read_spark_csv("doctor_summary", processed_dir=processed_dir)
+        hospital_visits = read_spark_csv("hospital_visits", processed_dir=processed_dir)
+        lab_result_dist = read_spark_csv("lab_result_distribution", processed_dir=processed_dir)
+        visit_reason = read_spark_csv("visit_reason_analysis", processed_dir=processed_dir)
+        counters = counters_from_raw(lab_result_dist, raw_dir)
+
+    cities = city_dist.sort_values("patient_count", ascending=False)
+
+    return {
         "overview": {
-            "total_patients": len(patients),
+            "total_patients": counters["total_patients"],
             "total_doctors": len(doctors),
-            "total_visits": len(visits),
-            "total_lab_reports": len(lab_reports),
-            "total_cities": patients["city"].nunique(),
+            "total_visits": counters["total_visits"],
+            "total_lab_reports": counters["total_lab_reports"],
+            "total_cities": counters["total_cities"],
             "total_hospitals": doctors["hospital"].nunique(),
         },
-        "gender_distribution": patients["gender"].value_counts().to_dict(),
-        "blood_group_distribution": patients["blood_group"].value_counts().to_dict(),
-        "top_cities": city_dist.sort_values("patient_count", ascending=False).head(15).to_dict(orient="records"),
-        "all_cities": city_dist.sort_values("patient_count", ascending=False).to_dict(orient="records"),
+        "gender_distribution": counters["gender_distribution"],
+        "blood_group_distribution": counters["blood_group_distribution"],
+        "top_cities": _records(cities.head(15)),
+        "all_cities": _records(cities),
         "specialization_distribution": doctors["specialization"].value_counts().to_dict(),
         "hospital_distribution": doctors["hospital"].value_counts().to_dict(),
-        "visit_type_distribution": visits["visit_type"].value_counts().to_dict(),
-        "visit_reason_analysis": visit_reason.sort_values("total_visits", ascending=False).to_dict(orient="records"),
-        "doctor_summary": doctor_summary.sort_values("total_visits", ascending=False).head(20).to_dict(orient="records"),
-        "hospital_visits": hospital_visits.sort_values("total_visits", ascending=False).to_dict(orient="records"),
-        "lab_result_distribution": lab_result_dist.to_dict(orient="records"),
-        "lab_test_types": lab_reports["test_type"].value_counts().to_dict(),
-        "lab_results_overview": lab_reports["result"].value_counts().to_dict(),
+        "visit_type_distribution": counters["visit_type_distribution"],
+        "visit_reason_analysis": _records(visit_reason.sort_values("total_visits", ascending=False)),
+        "doctor_summary": _records(doctor_summary.sort_values("total_visits", ascending=False).head(20)),
+        "hospital_visits": _records(hospital_visits.sort_values("total_visits", ascending=False)),
+        "lab_result_distribution": _records(lab_result_dist),
+        "lab_test_types": counters["lab_test_types"],
+        "lab_results_overview": counters["lab_results_overview"],
         # Recent patients sample
-        "recent_patients": patients.head(50).to_dict(orient="records"),
-        # Monthly visit trends (from visit_date)
-        "monthly_visits": visits.assign(
-            month=pd.to_datetime(visits["visit_date"]).dt.to_period("M").astype(str)
-        ).groupby("month").size().to_dict(),
+        "recent_patients": _records(recent_patients),
+        "monthly_visits": counters["monthly_visits"],
     }
 
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump(data, f, indent=2, default=str)
 
-    print(f"  [OK] Dashboard data written to {OUTPUT_FILE}")
+def write_payload(data, output_file=OUTPUT_FILE, level=9):
+    """Write compact JSON plus a gzip copy (`<output_file>.gz`); returns both sizes in bytes."""
+    payload = json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    for path, body in ((output_file, payload), (output_file + ".gz", gzip.compress(payload, level, mtime=0))):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    return len(payload), os.path.getsize(output_file + ".gz")
+
+
+def generate(from_state=False, force=False, cache_file=CACHE_FILE, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR,
+             output_file=OUTPUT_FILE):
+    """
+    Build dashboard_data.json (+ .gz). With from_state=True the patient, visit and lab
+    counters and the aggregations come from the incremental aggregate state
+    (src/aggregate_state.py) instead of re-reading the full raw history.
+    Returns False when the inputs are unchanged and the build was skipped.
+    """
+    print("Generating dashboard data...")
+
+    cache = load_cache(cache_file)
+    digest, entries = input_digest(input_files(from_state, raw_dir, processed_dir), cache)
+    mode = "state" if from_state else "processed"
+    outputs_exist = os.path.exists(output_file) and os.path.exists(output_file + ".gz")
+    if not force and outputs_exist and cache.get("digest") == digest and cache.get("mode") == mode:
+        print(f"  [SKIP] Inputs unchanged since last build ({digest[:12]})")
+        return False
+
+    data = build_sections(from_state, raw_dir, processed_dir)
+    size, gz_size = write_payload(data, output_file)
+    save_cache({"digest": digest, "mode": mode, "output": os.path.relpath(output_file, BASE_DIR), "files": entries},
+               cache_file)
+
+    print(f"  [OK] Dashboard data written to {output_file} ({size:,} bytes, {gz_size:,} gzipped)")
     print(f"  [OK] {len(data)} data sections generated")
+    return True
 
 
 if __name__ == "__main__":
-    generate()
+    parser = argparse.ArgumentParser(description="Build dashboard_data.json")
+    parser.add_argument("--from-state", action="store_true",
+                        help="use the incremental aggregate state (python -m src.aggregate_state) instead of raw CSVs")
+    parser.add_argument("--force", action="store_true", help="rebuild even if no input changed")
+    args = parser.parse_args()
+    generate(from_state=args.from_state, force=args.force)
@@ -1,116 +1,214 @@
 """
 Generate patient-level records for Patient Portal and Doctor Lookup.
 Creates patient_records.json with per-patient visits, doctors, and lab reports.
+
+Records are built in one linear pass: visits are joined to doctors once,
+sorted by (patient, visit_date desc), and walked group by group; lab reports
+are bucketed by visit in a single scan. Patient ranges can optionally be
+split across a process pool with --workers. Inputs are read with
+src/raw_reader.py, so the join, sorts and lookups run on integer ID codes.
+The output carries each ID as written in the raw files (the `<column>_text`
+columns), so malformed IDs are passed through rather than rewritten; rows
+with a malformed key are not joined to anything.
+
+With --sharded the records are written as a sharded store under
+dashboard/patient_records/ instead (see src/patient_record_store.py).
 """
 import sys
 import os
 import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-import pandas as pd
+import numpy as np
+
+from src.id_codec import ID_PREFIXES, INVALID_ID
+from src.patient_record_store import STORE_DIR, write_store
+from src.raw_reader import read_id_text, read_table
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
 OUTPUT_FILE = os.path.join(BASE_DIR, "dashboard", "patient_records.json")
 
+LAB_FIELDS = ["report_id", "test_type", "result", "report_date"]
+TEXT = "_text"
+
+
+def load_inputs(raw_dir=RAW_DIR):
+    """
+    Read the four raw tables: IDs as integer codes for the joins, plus each ID column
+    as written (`<column>_text`) for the output. Dates stay text, as they are written out verbatim.
+    """
+    tables = []
+    for table in ("patients", "doctors", "visits", "lab_reports"):
+        df = read_table(table, parse_dates=False, raw_dir=raw_dir)
+        text = read_id_text(table, raw_dir=raw_dir)
+        tables.append(df.assign(**{column + TEXT: text[column] for column in text.columns}))
+    return tuple(tables)
+
+
+def join_visits(visits, doctors):
+    """
+    Attach doctor details to each visit and sort by patient, newest visit first.
+    Unknown doctors get the same placeholders the portals expect.
+    """
+    doctor_cols = doctors[doctors["doctor_id"] != INVALID_ID].drop_duplicates("doctor_id", keep="last")
+    doctor_cols = doctor_cols[["doctor_id", "name", "specialization", "hospital"]]
+    joined = visits.merge(doctor_cols.rename(columns={"name": "doctor_name"}), on="doctor_id", how="left")
+    unknown = joined["doctor_name"].isna()
+    joined["doctor_name"] = joined["doctor_name"].astype(object).where(~unknown, "Unknown")
+    joined["specialization"] = joined["specialization"].astype(object).where(~unknown, "")
+    joined["hospital"] = joined["hospital"].astype(object).where(~unknown, "")
+    # Stable sort keeps file order for visits on the same date
+    joined = joined.sort_values("visit_date", ascending=False, kind="stable")
+    return joined.sort_values("patient_id", kind="stable").reset_index(drop=True)
+
+
+def bucket_lab_reports(lab_reports):
+    """Map visit_id code -> list of lab report dicts, in file order, with one scan."""
+    visit_labs = {}
+    columns = [lab_reports[c + TEXT if c in ID_PREFIXES else c].tolist() for c in LAB_FIELDS]
+    for vid, *values in zip(lab_reports["visit_id"].tolist(), *columns):
+        if vid != INVALID_ID:
+            visit_labs.setdefault(vid, []).append(dict(zip(LAB_FIELDS, values)))
+    return visit_labs
+
+
+def build_patient_visits(joined, visit_labs):
+    """Walk the sorted visits once; return patient_id code -> (visit list, summary)."""
+    by_patient = {}
+    if joined.empty:
+        return by_patient
+
+    pids = joined["patient_id"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, pids[1:] != pids[:-1]])
+    ends = np.r_[starts[1:], len(pids)]
+
+    visit_codes = joined["visit_id"].tolist()
+    cols = {c: joined[c].tolist() for c in
+            ["visit_date", "reason", "visit_type", "doctor_name", "specialization", "hospital"]}
+    cols.update(visit_id=joined["visit_id" + TEXT].tolist(), doctor_id=joined["doctor_id" + TEXT].tolist())
+
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if pids[start] == INVALID_ID:
+            continue
+        visits = []
+        total_labs = 0
+        doctors_seen, hospitals = {}, {}
+        visit_types, reasons = {}, {}
+
+        for i in range(start, end):
+            labs = visit_labs.get(visit_codes[i], [])
+            visits.append({
+                "visit_id": cols["visit_id"][i],
+                "visit_date": str(cols["visit_date"][i]),
+                "reason": cols["reason"][i],
+                "visit_type": cols["visit_type"][i],
+                "doctor": {
+                    "doctor_id": cols["doctor_id"][i],
+                    "name": cols["doctor_name"][i],
+                    "specialization": cols["specialization"][i],
+                    "hospital": cols["hospital"][i],
+                },
+                "lab_reports": labs,
+            })
+            total_labs += len(labs)
+            doctors_seen[cols["doctor_name"][i]] = None
+            hospitals[cols["hospital"][i]] = None
+            vt, reason = cols["visit_type"][i], cols["reason"][i]
+            visit_types[vt] = visit_types.get(vt, 0) + 1
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+        by_patient[pids[start]] = (visits, {
+            "total_visits": end - start,
+            "total_lab_reports": total_labs,
+            "doctors_seen": list(doctors_seen),
+            "hospitals_visited": list(hospitals),
+            "visit_types": visit_types,
+            "reasons": reasons,
+        })
+    return by_patient
 
-def generate():
-    print("Generating patient-level records...")
-
-    patients = pd.read_csv(os.path.join(RAW_DIR, "patients.csv"))
-    doctors = pd.read_csv(os.path.join(RAW_DIR, "doctors.csv"))
-    visits = pd.read_csv(os.path.join(RAW_DIR, "visits.csv"))
-    lab_reports = pd.read_csv(os.path.join(RAW_DIR, "lab_reports.csv"))
-
-    # Build doctor lookup
-    doctor_map = doctors.set_index("doctor_id").to_dict(orient="index")
 
-    # Build visit -> lab reports mapping
-    visit_labs = lab_reports.groupby("visit_id").apply(
-        lambda x: x[["report_id", "test_type", "result", "report_date"]].to_dict(orient="records"),
-        include_groups=False
-    ).to_dict()
+def build_records(patients, joined, lab_reports):
+    """Build (records, patient_index) for the given patients and their joined visits."""
+    by_patient = build_patient_visits(joined, bucket_lab_reports(lab_reports))
 
-    # Build per-patient records
     records = {}
-
-    for _, p in patients.iterrows():
-        pid = p["patient_id"]
-        patient_info = {
+    patient_index = []
+    cols = {c: patients[c].tolist() for c in ["patient_id", "name", "gender", "dob", "blood_group", "city"]}
+    codes = cols["patient_id"]
+    cols["patient_id"] = patients["patient_id" + TEXT].tolist()
+
+    for code, pid, name, gender, dob, blood_group, city in zip(codes, *cols.values()):
+        visits, summary = by_patient.get(code, ([], None))
+        if summary is None:
+            summary = {"total_visits": 0, "total_lab_reports": 0, "doctors_seen": [],
+                       "hospitals_visited": [], "visit_types": {}, "reasons": {}}
+        records[pid] = {
             "patient_id": pid,
-            "name": p["name"],
-            "gender": p["gender"],
-            "dob": str(p["dob"]),
-            "blood_group": p["blood_group"],
-            "city": p["city"],
-            "visits": [],
-            "summary": {
-                "total_visits": 0,
-                "total_lab_reports": 0,
-                "doctors_seen": set(),
-                "hospitals_visited": set(),
-                "visit_types": {},
-                "reasons": {},
-            }
+            "name": name,
+            "gender": gender,
+            "dob": str(dob),
+            "blood_group": blood_group,
+            "city": city,
+            "visits": visits,
+            "summary": summary,
         }
+        patient_index.append({
+            "patient_id": pid,
+            "name": name,
+            "gender": gender,
+            "city": city,
+            "blood_group": blood_group,
+            "total_visits": summary["total_visits"],
+            "total_lab_reports": summary["total_lab_reports"],
+        })
+    return records, patient_index
 
-        # Get patient visits
-        patient_visits = visits[visits["patient_id"] == pid].sort_values("visit_date", ascending=False)
 
-        for _, v in patient_visits.iterrows():
-            vid = v["visit_id"]
-            did = v["doctor_id"]
-            doc_info = doctor_map.get(did, {})
+def _build_range(args):
+    return build_records(*args)
 
-            visit_record = {
-                "visit_id": vid,
-                "visit_date": str(v["visit_date"]),
-                "reason": v["reason"],
-                "visit_type": v["visit_type"],
-                "doctor": {
-                    "doctor_id": did,
-                    "name": doc_info.get("name", "Unknown"),
-                    "specialization": doc_info.get("specialization", ""),
-                    "hospital": doc_info.get("hospital", ""),
-                },
-                "lab_reports": visit_labs.get(vid, [])
-            }
 
-            patient_info["visits"].append(visit_record)
+def build_all(patients, doctors, visits, lab_reports, workers=1):
+    """
+    Build every record. With workers > 1, contiguous patient ranges are
+    built in a process pool and merged back in patient file order.
+    """
+    joined = join_visits(visits, doctors)
+    if workers <= 1 or len(patients) < 2 * workers:
+        return build_records(patients, joined, lab_reports)
 
-            # Update summary
-            patient_info["summary"]["total_visits"] += 1
-            patient_info["summary"]["total_lab_reports"] += len(visit_record["lab_reports"])
-            patient_info["summary"]["doctors_seen"].add(doc_info.get("name", "Unknown"))
-            patient_info["summary"]["hospitals_visited"].add(doc_info.get("hospital", ""))
+    tasks = []
+    for part in np.array_split(np.arange(len(patients)), workers):
+        part_patients = patients.iloc[part]
+        part_visits = joined[joined["patient_id"].isin(part_patients["patient_id"])]
+        part_labs = lab_reports[lab_reports["visit_id"].isin(part_visits["visit_id"])]
+        tasks.append((part_patients, part_visits, part_labs))
 
-            vt = v["visit_type"]
-            patient_info["summary"]["visit_types"][vt] = patient_info["summary"]["visit_types"].get(vt, 0) + 1
+    records, patient_index = {}, []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part_records, part_index in pool.map(_build_range, tasks):
+            records.update(part_records)
+            patient_index.extend(part_index)
+    return records, patient_index
 
-            reason = v["reason"]
-            patient_info["summary"]["reasons"][reason] = patient_info["summary"]["reasons"].get(reason, 0) + 1
 
-        # Convert sets to lists for JSON
-        patient_info["summary"]["doctors_seen"] = list(patient_info["summary"]["doctors_seen"])
-        patient_info["summary"]["hospitals_visited"] = list(patient_info["summary"]["hospitals_visited"])
+def generate(workers=1, raw_dir=RAW_DIR, output_file=OUTPUT_FILE, sharded=False, store_dir=STORE_DIR,
+             records_per_shard=500, shard_scheme="hash"):
+    print("Generating patient-level records...")
 
-        records[pid] = patient_info
+    patients, doctors, visits, lab_reports = load_inputs(raw_dir)
+    records, patient_index = build_all(patients, doctors, visits, lab_reports, workers)
 
-    # Also create a lightweight patient index for search
-    patient_index = []
-    for _, p in patients.iterrows():
-        pid = p["patient_id"]
-        rec = records[pid]
-        patient_index.append({
-            "patient_id": pid,
-            "name": p["name"],
-            "gender": p["gender"],
-            "city": p["city"],
-            "blood_group": p["blood_group"],
-            "total_visits": rec["summary"]["total_visits"],
-            "total_lab_reports": rec["summary"]["total_lab_reports"],
-        })
+    if sharded:
+        manifest = write_store(records, patient_index, store_dir, records_per_shard, shard_scheme)
+        print(f"  [OK] Sharded patient store written to {store_dir}")
+        print(f"  [OK] {manifest['total_patients']} patient records in {manifest['shard_files']} shards")
+        return
 
     output = {
         "records": records,
@@ -118,13 +216,20 @@ def generate():
         "total_patients": len(records),
     }
 
-    with open(OUTPUT_FILE, "w") as f:
+    with open(output_file, "w") as f:
         json.dump(output, f, default=str)
 
-    size_mb = os.path.getsize(OUTPUT_FILE) / (1024 * 1024)
-    print(f"  [OK] Patient records written to {OUTPUT_FILE}")
+    size_mb = os.path.getsize(output_file) / (1024 * 1024)
+    print(f"  [OK] Patient records written to {output_file}")
     print(f"  [OK] {len(records)} patient records ({size_mb:.1f} MB)")
 
 
 if __name__ == "__main__":
-    generate()
+    parser = argparse.ArgumentParser(description="Build per-patient records for the portals")
+    parser.add_argument("--workers", type=int, default=1, help="processes to split patient ranges across")
+    parser.add_argument("--sharded", action="store_true", help="write the sharded store instead of one JSON file")
+    parser.add_argument("--records-per-shard", type=int, default=500)
+    parser.add_argument("--shard-scheme", choices=["hash", "range"], default="hash")
+    args = parser.parse_args()
+    generate(workers=args.workers, sharded=args.sharded, records_per_shard=args.records_per_shard,
+             shard_scheme=args.shard_scheme)
@@ -0,0 +1,84 @@
+"""
+Reversible integer encoding for the prefixed string IDs used across the
+dataset (P100000, D2000, V300000, R400000).
+
+encode_ids("P100123") -> 100123, decode_ids(100123, "P") -> "P100123";
+encode_id() is the scalar form for single lookups.
+IDs are a fixed letter prefix followed by an unpadded integer. Anything
+else (a leading zero, another prefix or case, non-digits, more than
+MAX_DIGITS digits) encodes to INVALID_ID, so every valid code decodes back
+to exactly the string it came from. Outputs that must reproduce malformed
+IDs take them from the raw text (raw_reader.read_id_text), not from codes.
+encode_ids() and the *_arrow forms run on Arrow compute kernels, with no
+Python object per ID.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+ID_PREFIXES = {
+    "patient_id": "P",
+    "doctor_id": "D",
+    "visit_id": "V",
+    "report_id": "R",
+}
+
+# Primary key column of each table
+TABLE_KEYS = {
+    "patients": "patient_id",
+    "doctors": "doctor_id",
+    "visits": "visit_id",
+    "lab_reports": "report_id",
+}
+
+INVALID_ID = -1
+# Longer digit strings would overflow int64
+MAX_DIGITS = 18
+
+
+def _arrow_strings(values):
+    s = pd.Series(values, copy=False)
+    if not (isinstance(s.dtype, pd.StringDtype) and s.dtype.storage == "pyarrow"):
+        s = s.astype("string[pyarrow]")
+    return pa.array(s)
+
+
+def encode_ids_arrow(strings, prefix):
+    """encode_ids over an Arrow string array; returns an Arrow int64 array."""
+    digits = pc.utf8_slice_codeunits(strings, len(prefix))
+    valid = pc.and_(pc.and_(pc.starts_with(strings, prefix), pc.ascii_is_decimal(digits)),
+                    pc.less_equal(pc.utf8_length(digits), MAX_DIGITS))
+    # "P0100" would decode as "P100": only "0" itself may start with a zero
+    canonical = pc.or_(pc.invert(pc.starts_with(digits, "0")), pc.equal(digits, "0"))
+    valid = pc.and_(valid, canonical)
+    digits = pc.if_else(pc.fill_null(valid, False), digits, str(INVALID_ID))
+    return pc.cast(digits, pa.int64())
+
+
+def encode_ids(values, prefix):
+    """Strip `prefix` and return an int64 array; malformed or missing IDs become INVALID_ID."""
+    return encode_ids_arrow(_arrow_strings(values), prefix).to_numpy(zero_copy_only=False)
+
+
+def encode_id(value, prefix):
+    """Scalar encode_ids for single lookups (no pandas round trip)."""
+    if isinstance(value, str) and value.startswith(prefix):
+        digits = value[len(prefix):]
+        # the same rules as encode_ids_arrow: ASCII digits only, bounded length, no zero padding
+        if (digits.isascii() and digits.isdigit() and len(digits) <= MAX_DIGITS
+                and (digits == "0" or not digits.startswith("0"))):
+            return int(digits)
+    return INVALID_ID
+
+
+def decode_ids(codes, prefix):
+    """Inverse of encode_ids: int array -> array of prefixed string IDs."""
+    return np.char.add(prefix, np.asarray(codes, dtype=np.int64).astype(str)).astype(object)
+
+
+def decode_ids_arrow(codes, prefix):
+    """Bulk decode_ids as an Arrow string array, with INVALID_ID as null."""
+    codes = pa.array(np.asarray(codes, dtype=np.int64))
+    strings = pc.binary_join_element_wise(prefix, pc.cast(codes, pa.string()), "")
+    return pc.if_else(pc.equal(codes, INVALID_ID), pa.scalar(None, pa.string()), strings)
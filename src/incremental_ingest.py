@@ -0,0 +1,343 @@
+"""
+Incremental CSV -> MySQL ingestion.
+
+A local manifest records, per raw file, its size and SHA-256 plus the highest
+primary key loaded (the watermark). A sidecar .npz per table keeps the sorted
+integer-encoded keys and a 64-bit hash of every loaded row; rows with malformed
+keys (which all encode to INVALID_ID) are kept by their raw key text instead.
+On each run:
+
+- unchanged files are skipped without being parsed;
+- files that only grew (the old bytes hash the same) are parsed from the old
+  end-of-file offset, so an append-only nightly load reads just the new tail;
+- any other change falls back to a full re-read, diffed row by row.
+
+Rows are read with the typed reader (src/raw_reader.py) and checked by the
+same streaming TableValidators as a full load (src/data_validation.py), with
+rejects quarantined. The key sets of tables that are skipped or only appended
+to are seeded with the keys loaded before, so duplicates of earlier rows and
+foreign keys to them are judged as in a full load.
+
+Only new or changed rows are sent, with INSERT ... ON DUPLICATE KEY UPDATE.
+Deleted rows are not propagated.
+"""
+import os
+import json
+import time
+import hashlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.config import INGEST_CONFIG
+from src.data_validation import QUARANTINE_DIR, build_validators, write_quarantine_summary
+from src.db_connection import get_connection
+from src.etl_ingest import build_upsert_sql, insert_frame
+from src.id_codec import ID_PREFIXES, INVALID_ID, TABLE_KEYS, encode_ids
+from src.instrumentation import step
+from src.parallel_ingest import TABLE_SOURCES, SCHEMA_FILE, parse_fk_dependencies, topological_order
+from src.raw_reader import read_table_chunks
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+STATE_DIR = os.path.join(BASE_DIR, "data", "state")
+MANIFEST_FILE = os.path.join(STATE_DIR, "ingest_manifest.json")
+
+
+def load_manifest(path=MANIFEST_FILE):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_fingerprint(path, prefix_size=None, block_size=1 << 20):
+    """
+    Return (size, sha256 of the whole file, sha256 of the first `prefix_size` bytes).
+    Both digests are computed in a single read of the file.
+    """
+    full, prefix = hashlib.sha256(), hashlib.sha256()
+    prefix_digest = None
+    read = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            full.update(block)
+            if prefix_size is not None and prefix_digest is None:
+                take = min(len(block), prefix_size - read)
+                prefix.update(block[:take])
+                if read + take == prefix_size:
+                    prefix_digest = prefix.hexdigest()
+            read += len(block)
+    return read, full.hexdigest(), prefix_digest
+
+
+def _row_state_path(table_name, state_dir=STATE_DIR):
+    return os.path.join(state_dir, f"{table_name}_rows.npz")
+
+
+def load_row_state(table_name, state_dir=STATE_DIR):
+    """
+    Rows already loaded: "keys" (sorted int64) and "hashes" (uint64) for well-formed IDs,
+    "malformed_keys" (sorted raw ID strings) and "malformed_hashes" for the rest.
+    """
+    state = {"keys": np.empty(0, dtype=np.int64), "hashes": np.empty(0, dtype=np.uint64),
+             "malformed_keys": np.empty(0, dtype=str), "malformed_hashes": np.empty(0, dtype=np.uint64)}
+    path = _row_state_path(table_name, state_dir)
+    if os.path.exists(path):
+        with np.load(path) as saved:
+            state.update({name: saved[name] for name in saved.files})
+    return state
+
+
+def save_row_state(table_name, state, state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    tmp_path = _row_state_path(table_name, state_dir) + ".tmp.npz"
+    np.savez(tmp_path, **state)
+    os.replace(tmp_path, _row_state_path(table_name, state_dir))
+
+
+def seed_keys(validator, state):
+    """Add the keys of a row state to a TableValidator's key set (rows loaded by earlier runs)."""
+    validator.keys.add(state["keys"])
+    malformed = state["malformed_keys"].astype(object)
+    validator.keys.add(np.full(len(malformed), INVALID_ID, dtype=np.int64), malformed)
+
+
+def merge_row_state(keys, hashes, new_keys, new_hashes):
+    """Merge new (key, hash) pairs into the sorted state; new values win on conflict (keys may be strings)."""
+    all_keys = np.concatenate([keys, new_keys])
+    all_hashes = np.concatenate([hashes, new_hashes])
+    order = np.argsort(all_keys, kind="stable")
+    all_keys, all_hashes = all_keys[order], all_hashes[order]
+    last = np.ones(len(all_keys), dtype=bool)
+    last[:-1] = all_keys[1:] != all_keys[:-1]
+    return all_keys[last], all_hashes[last]
+
+
+def diff_rows(chunk_keys, chunk_hashes, keys, hashes, watermark=None):
+    """
+    Return a boolean mask of rows that are new or whose content changed. Integer keys
+    above `watermark` are new by definition; string keys are looked up without one.
+    """
+    if watermark is None:
+        send = np.zeros(len(chunk_keys), dtype=bool)
+    else:
+        send = chunk_keys > watermark  # above the watermark: new by definition
+    below = ~send
+    if below.any() and len(keys):
+        k, h = chunk_keys[below], chunk_hashes[below]
+        idx = np.minimum(np.searchsorted(keys, k), len(keys) - 1)
+        found = keys[idx] == k
+        send[below] = ~found | (hashes[idx] != h)
+    elif below.any():
+        send[below] = True
+    return send
+
+
+def _ends_line(file_path, offset):
+    """True if the byte just before `offset` is a newline, i.e. offset starts a new row."""
+    with open(file_path, "rb") as f:
+        f.seek(offset - 1)
+        return f.read(1) == b"\n"
+
+
+def _tail_digest(path, end, window):
+    """sha256 of the (up to) `window` bytes of `path` that end at byte `end`."""
+    with open(path, "rb") as f:
+        f.seek(max(0, end - window))
+        return hashlib.sha256(f.read(min(end, window))).hexdigest()
+
+
+def file_position(path, window=None):
+    """
+    {"offset": size, "sha256": ...} of `path` as it is now, for a later appended_since() check.
+    With `window`, the whole file is not hashed: the position records the mtime and a hash
+    of the last `window` bytes, so recording and checking it cost the same at any file size.
+    """
+    if window:
+        stat = os.stat(path)
+        return {"offset": stat.st_size, "mtime_ns": stat.st_mtime_ns, "window": window,
+                "tail_sha256": _tail_digest(path, stat.st_size, window)}
+    size, digest, _ = file_fingerprint(path)
+    return {"offset": size, "sha256": digest}
+
+
+def appended_since(path, position):
+    """
+    True if `path` still starts with exactly the bytes recorded by file_position() (an
+    append-only change). The whole recorded prefix is hashed, so an edit anywhere in it
+    counts as a rewrite. For a position recorded with a `window`, only that window before
+    the old end is compared (and the mtime, if nothing was appended): an edit further back
+    that keeps the row's length is missed when rows are appended in the same change.
+    """
+    size = os.path.getsize(path)
+    if size < position["offset"]:
+        return False
+    if position["offset"] == 0:
+        return True
+    if "window" in position:
+        if size == position["offset"]:
+            return os.stat(path).st_mtime_ns == position["mtime_ns"]
+        return (_tail_digest(path, position["offset"], position["window"]) == position["tail_sha256"]
+                and _ends_line(path, position["offset"]))
+    if "sha256" not in position:
+        return False
+    _, _, prefix_digest = file_fingerprint(path, position["offset"])
+    return prefix_digest == position["sha256"] and _ends_line(path, position["offset"])
+
+
+def read_delta(file_path, offset=0, chunksize=None):
+    """Iterate CSV chunks, starting at byte `offset` (which must be a line boundary) when > 0."""
+    chunksize = chunksize or INGEST_CONFIG["chunksize"]
+    if offset == 0:
+        yield from pd.read_csv(file_path, chunksize=chunksize)
+        return
+
+    columns = pd.read_csv(file_path, nrows=0).columns
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        if not f.read(1):
+            return
+        f.seek(offset)
+        yield from pd.read_csv(f, header=None, names=columns, chunksize=chunksize)
+
+
+def ingest_table_incremental(table_name, file_path, table_validator=None, manifest=None, state_dir=STATE_DIR,
+                             chunksize=None, batch_size=None, commit_every=None):
+    """
+    Upsert only new or changed rows of one table. Rows are checked by `table_validator`
+    (data_validation.TableValidator) first; when the file is skipped or only its tail
+    is read, the validator's key set is seeded with the keys loaded before.
+    Updates `manifest` in place and returns a dict with load statistics.
+    """
+    manifest = manifest if manifest is not None else {}
+    entry = manifest.get(table_name, {})
+    key_column = TABLE_KEYS[table_name]
+    prefix = ID_PREFIXES[key_column]
+
+    start = time.perf_counter()
+    size, digest, prefix_digest = file_fingerprint(file_path, entry.get("size"))
+
+    if entry.get("sha256") == digest:
+        if table_validator:
+            seed_keys(table_validator, load_row_state(table_name, state_dir))
+        print(f"  [SKIP] `{table_name}` unchanged since {entry.get('loaded_at')}")
+        return {"table": table_name, "rows": 0, "scanned": 0, "seconds": 0.0, "rows_per_sec": 0.0, "mode": "skip"}
+
+    append_only = (bool(entry) and size > entry["size"] and prefix_digest == entry.get("sha256")
+                   and _ends_line(file_path, entry["size"]))
+    offset = entry["size"] if append_only else 0
+    mode = "append" if append_only else "full"
+
+    state = load_row_state(table_name, state_dir)
+    if table_validator and append_only:
+        # rows before the offset are not read again, but still count for duplicates and child FKs
+        seed_keys(table_validator, state)
+    watermark = entry.get("watermark", -1)
+    seen_keys, seen_hashes, seen_malformed, seen_malformed_hashes = [], [], [], []
+    scanned = sent = 0
+
+    conn = get_connection(pooled=True)
+    cursor = conn.cursor()
+    pending = 0
+    sql = None
+    try:
+        for chunk in read_table_chunks(table_name, chunksize or INGEST_CONFIG["chunksize"], path=file_path,
+                                       offset=offset):
+            scanned += len(chunk)
+            if table_validator:
+                chunk = table_validator.validate(chunk)
+            if chunk.empty:
+                continue
+
+            chunk_keys = encode_ids(chunk[key_column], prefix)
+            chunk_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy(dtype=np.uint64)
+            # malformed IDs all encode to INVALID_ID, so they are matched on their raw text
+            malformed = chunk_keys == INVALID_ID
+            malformed_text = chunk[key_column].to_numpy(dtype=object)[malformed].astype(str)
+            send = np.empty(len(chunk), dtype=bool)
+            send[~malformed] = diff_rows(chunk_keys[~malformed], chunk_hashes[~malformed],
+                                         state["keys"], state["hashes"], watermark)
+            send[malformed] = diff_rows(malformed_text, chunk_hashes[malformed],
+                                        state["malformed_keys"], state["malformed_hashes"])
+
+            if send.any():
+                sql = sql or build_upsert_sql(table_name, list(chunk.columns), key_column)
+                pending = insert_frame(conn, cursor, table_name, chunk[send], batch_size, commit_every, sql, pending)
+                sent += int(send.sum())
+                seen_keys.append(chunk_keys[send & ~malformed])
+                seen_hashes.append(chunk_hashes[send & ~malformed])
+                seen_malformed.append(malformed_text[send[malformed]])
+                seen_malformed_hashes.append(chunk_hashes[send & malformed])
+
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if seen_keys:
+        state["keys"], state["hashes"] = merge_row_state(state["keys"], state["hashes"],
+                                                         np.concatenate(seen_keys), np.concatenate(seen_hashes))
+        state["malformed_keys"], state["malformed_hashes"] = merge_row_state(
+            state["malformed_keys"], state["malformed_hashes"],
+            np.concatenate(seen_malformed), np.concatenate(seen_malformed_hashes))
+        save_row_state(table_name, state, state_dir)
+
+    keys = state["keys"]
+    manifest[table_name] = {
+        "file": os.path.basename(file_path),
+        "size": size,
+        "sha256": digest,
+        "watermark": int(keys.max()) if len(keys) else -1,
+        "rows": int(len(keys) + len(state["malformed_keys"])),
+        "loaded_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+    elapsed = time.perf_counter() - start
+    rate = sent / elapsed if elapsed > 0 else 0.0
+    print(f"  [OK] Upserted {sent} of {scanned} scanned rows into `{table_name}` "
+          f"({mode}, {elapsed:.2f}s, {rate:,.0f} rows/sec)")
+    return {"table": table_name, "rows": sent, "scanned": scanned, "seconds": elapsed,
+            "rows_per_sec": rate, "mode": mode}
+
+
+def ingest_all_incremental(raw_dir=RAW_DIR, manifest_file=MANIFEST_FILE, state_dir=STATE_DIR, tables=None,
+                           quarantine_dir=QUARANTINE_DIR):
+    """
+    Incrementally ingest every table in FK order. The manifest is saved after
+    each table so a failure does not discard progress on earlier tables.
+    Rows are checked by streaming TableValidators, as in parallel_ingest.load_all_tables;
+    rejects go to `quarantine_dir`.
+    """
+    tables = tables or list(TABLE_SOURCES)
+    manifest = load_manifest(manifest_file)
+    validators = build_validators(tables, quarantine_dir)
+    stats = {}
+    for table_name in topological_order(tables, parse_fk_dependencies(SCHEMA_FILE)):
+        file_name, _ = TABLE_SOURCES[table_name]
+        with step(f"upsert:{table_name}") as s:
+            stats[table_name] = ingest_table_incremental(
+                table_name, os.path.join(raw_dir, file_name), validators[table_name], manifest, state_dir
+            )
+            stats[table_name]["validation"] = validators[table_name].report()
+            s.rows_in, s.rows_out = stats[table_name]["scanned"], stats[table_name]["rows"]
+            s.attrs.update(mode=stats[table_name]["mode"], rejected=stats[table_name]["validation"]["rejected"])
+        save_manifest(manifest, manifest_file)
+
+    summary = write_quarantine_summary(validators, quarantine_dir)
+    rejected = sum(r["rejected"] for r in summary.values())
+    if rejected:
+        print(f"  [WARN] {rejected} rows quarantined - see {os.path.join(quarantine_dir, 'summary.json')}")
+    return stats
@@ -0,0 +1,367 @@
+"""
+Per-stage instrumentation and JSON run reports.
+
+    report = start_run("pipeline", options)
+    with step("ingest") as s:
+        with step("load:patients") as t:
+            ...
+            t.rows_in, t.rows_out = scanned, written
+    finish_run()          # writes data/reports/run_<timestamp>.json
+
+Each step records wall and CPU time, rows in/out, rows/sec, the process's
+peak RSS when it ended, and its status (an exception marks it "failed" and is
+re-raised). Steps nest by context, and a step opened on a worker thread
+attaches to the step that is open on the main thread. spark_step() also tags
+the step's Spark jobs with a job group and collects job/stage/task counts
+from the SparkContext status tracker.
+
+When no run is active, step() still yields a Step, but nothing is recorded.
+
+Opt-in profiling, via start_run(profile=...):
+- "cprofile": deterministic cProfile over the whole run. cProfile only sees
+  the thread that enabled it, so work on a thread pool runs inside
+  profile_thread(), which gives each worker its own profiler; their stats are
+  merged with the main thread's when the run finishes.
+- "sample": a stdlib sampling profiler that snapshots every thread's stack
+  every few milliseconds.
+Either way, the hottest functions are added to the report, and the raw
+cProfile stats are saved next to it.
+"""
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_DIR = os.path.join(BASE_DIR, "data", "reports")
+
+PROFILERS = ["cprofile", "sample"]
+SAMPLE_INTERVAL = 0.005
+PROFILE_TOP = 25
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where `resource` is unavailable)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+class Step:
+    """One timed unit of work; callers may set rows_in / rows_out and add attrs."""
+
+    def __init__(self, name, rows_in=None, **attrs):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.attrs = attrs
+        self.children = []
+        self.status = "running"
+        self.error = None
+        self.spark = None
+        self._lock = threading.Lock()
+
+    def add_child(self, child):
+        with self._lock:
+            self.children.append(child)
+
+    def start(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self.started = datetime.now().isoformat(timespec="milliseconds")
+
+    def stop(self, error=None):
+        self.wall_seconds = time.perf_counter() - self._wall
+        # process-wide CPU: includes work done by other threads during the step
+        self.cpu_seconds = time.process_time() - self._cpu
+        self.peak_rss_mb = peak_rss_mb()
+        self.status = "failed" if error else "ok"
+        self.error = f"{type(error).__name__}: {error}" if error else None
+
+    def to_dict(self):
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        out = {
+            "name": self.name,
+            "status": self.status,
+            "started": getattr(self, "started", None),
+            "wall_seconds": round(getattr(self, "wall_seconds", 0.0), 4),
+            "cpu_seconds": round(getattr(self, "cpu_seconds", 0.0), 4),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_sec": round(rows / self.wall_seconds) if rows and getattr(self, "wall_seconds", 0) > 0 else None,
+            "peak_rss_mb": getattr(self, "peak_rss_mb", None),
+        }
+        if self.error:
+            out["error"] = self.error
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.spark:
+            out["spark"] = self.spark
+        if self.children:
+            out["steps"] = [c.to_dict() for c in self.children]
+        return out
+
+
+class RunReport:
+    """Collects the step tree of one run and writes it as JSON."""
+
+    def __init__(self, name, options=None, profile=None, report_dir=REPORT_DIR):
+        if profile not in (None, *PROFILERS):
+            raise ValueError(f"Unknown profiler `{profile}`; expected one of {PROFILERS}")
+        self.root = Step(name, **(options or {}))
+        self.profile = profile
+        self.report_dir = report_dir
+        self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(report_dir, f"run_{self.run_id}.json")
+        self.main_thread = threading.get_ident()
+        self._open = [self.root]  # steps open on the main thread
+        self._profiler = None
+        self._thread_profilers = []
+        self._sampler = None
+        self.profile_summary = None
+
+    def start(self):
+        self.root.start()
+        if self.profile == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == "sample":
+            self._sampler = SamplingProfiler()
+            self._sampler.start()
+
+    def parent_for_thread(self):
+        return self._open[-1]
+
+    def add_thread_profile(self, profiler):
+        with self.root._lock:
+            self._thread_profilers.append(profiler)
+
+    def finish(self, error=None):
+        if self._profiler is not None:
+            self._profiler.disable()
+            stats = pstats.Stats(self._profiler)
+            for profiler in self._thread_profilers:
+                stats.add(profiler)
+            os.makedirs(self.report_dir, exist_ok=True)
+            stats_file = os.path.join(self.report_dir, f"run_{self.run_id}.prof")
+            stats.dump_stats(stats_file)
+            self.profile_summary = {"type": "cprofile", "stats_file": stats_file,
+                                    "threads": 1 + len(self._thread_profilers), "top": _cprofile_top(stats)}
+        elif self._sampler is not None:
+            self.profile_summary = self._sampler.stop()
+        self.root.stop(error)
+        return self.write()
+
+    def to_dict(self):
+        out = {"run_id": self.run_id, "report_version": 1, **self.root.to_dict()}
+        if self.profile_summary:
+            out["profile"] = self.profile_summary
+        return out
+
+    def write(self):
+        os.makedirs(self.report_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+        return self.path
+
+
+_run = None
+_current = contextvars.ContextVar("instrumentation_step", default=None)
+
+
+def start_run(name, options=None, profile=None, report_dir=REPORT_DIR):
+    """Begin recording steps for a run; returns the RunReport."""
+    global _run
+    _run = RunReport(name, options, profile, report_dir)
+    _run.start()
+    return _run
+
+
+def finish_run(error=None):
+    """Stop the active run and write its report; returns the report path (None if no run)."""
+    global _run
+    run, _run = _run, None
+    return run.finish(error) if run else None
+
+
+def current_run():
+    return _run
+
+
+@contextmanager
+def step(name, rows_in=None, **attrs):
+    """Time a unit of work as a child of the current step."""
+    s = Step(name, rows_in, **attrs)
+    run = _run
+    if run is None:
+        yield s
+        return
+
+    parent = _current.get()
+    if parent is None:
+        parent = run.parent_for_thread() if threading.get_ident() != run.main_thread else run.root
+    parent.add_child(s)
+    on_main = threading.get_ident() == run.main_thread
+    token = _current.set(s)
+    if on_main:
+        run._open.append(s)
+    s.start()
+    try:
+        yield s
+    except BaseException as e:
+        s.stop(e)
+        raise
+    else:
+        s.stop()
+    finally:
+        _current.reset(token)
+        if on_main:
+            run._open.remove(s)
+
+
+@contextmanager
+def profile_thread():
+    """Profile the calling worker thread into the active run's cProfile stats (no-op otherwise)."""
+    run = _run
+    if run is None or run._profiler is None or threading.get_ident() == run.main_thread:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ builds cProfile on sys.monitoring, which already sees every thread
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.create_stats()
+        if profiler.stats:  # pstats cannot load an empty profile
+            run.add_thread_profile(profiler)
+
+
+@contextmanager
+def spark_step(spark, name, rows_in=None, **attrs):
+    """step() that also collects the Spark jobs it triggered (by job group) from the status tracker."""
+    with step(name, rows_in, **attrs) as s:
+        if _run is None:
+            yield s
+            return
+        sc = spark.sparkContext
+        group = f"{_run.run_id}:{name}"
+        sc.setJobGroup(group, name)
+        try:
+            yield s
+        finally:
+            s.spark = spark_job_metrics(sc, group)
+            sc.setLocalProperty("spark.jobGroup.id", None)
+            sc.setLocalProperty("spark.job.description", None)
+
+
+def spark_job_metrics(sc, group):
+    """Job, stage and task counts for a job group from SparkContext.statusTracker()."""
+    tracker = sc.statusTracker()
+    jobs, stages = [], []
+    for job_id in sorted(tracker.getJobIdsForGroup(group)):
+        job = tracker.getJobInfo(job_id)
+        if job is None:
+            continue
+        jobs.append({"job_id": job_id, "status": str(job.status), "stage_ids": list(job.stageIds)})
+        for stage_id in job.stageIds:
+            info = tracker.getStageInfo(stage_id)
+            if info is not None:
+                stages.append({"stage_id": stage_id, "name": info.name, "tasks": info.numTasks,
+                               "completed_tasks": info.numCompletedTasks, "failed_tasks": info.numFailedTasks})
+    return {
+        "jobs": len(jobs),
+        "failed_jobs": sum(1 for j in jobs if j["status"] == "FAILED"),
+        "stages": len(stages),
+        "tasks": sum(st["tasks"] for st in stages),
+        "failed_tasks": sum(st["failed_tasks"] for st in stages),
+        "job_details": jobs,
+        "stage_details": stages,
+    }
+
+
+# ---------- Profilers ----------
+
+def _cprofile_top(stats, limit=PROFILE_TOP):
+    rows = []
+    for (file_name, line, func), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": f"{func} ({os.path.relpath(file_name, BASE_DIR) if file_name.startswith(BASE_DIR) else file_name}:{line})",
+                     "calls": calls, "own_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)})
+    rows.sort(key=lambda r: r["cumulative_seconds"], reverse=True)
+    return rows[:limit]
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's Python stack on a timer; reports the functions seen most often.
+    Each thread's stack counts as one sample, so shares are of all sampled stacks.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.ticks = 0
+        self.samples = 0
+        self.own = Counter()
+        self.inclusive = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    @staticmethod
+    def _label(frame):
+        code = frame.f_code
+        file_name = code.co_filename
+        if file_name.startswith(BASE_DIR):
+            file_name = os.path.relpath(file_name, BASE_DIR)
+        return f"{code.co_name} ({file_name}:{code.co_firstlineno})"
+
+    def _run(self):
+        own_thread = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.ticks += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                self.samples += 1
+                self.own[self._label(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    label = self._label(frame)
+                    if label not in seen:
+                        seen.add(label)
+                        self.inclusive[label] += 1
+                    frame = frame.f_back
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, limit=PROFILE_TOP):
+        self._stop.set()
+        self._thread.join()
+        total = max(self.samples, 1)
+        return {
+            "type": "sample",
+            "interval_seconds": self.interval,
+            "ticks": self.ticks,
+            "samples": self.samples,
+            "top_own": [{"function": f, "share": round(n / total, 4)} for f, n in self.own.most_common(limit)],
+            "top_inclusive": [{"function": f, "share": round(n / total, 4)}
+                              for f, n in self.inclusive.most_common(limit)],
+        }
@@ -0,0 +1,157 @@
+"""
+In-process (JVM-free) transform backend.
+
+Produces the same five aggregations and four Power BI exports as
+src/pyspark_transform.py, with pandas/NumPy, and writes them to the same
+data/processed/ folders in a Spark-compatible layout (part files + _SUCCESS),
+so downstream readers cannot tell which backend ran. Used for small and
+medium inputs where starting a SparkSession costs more than the work itself.
+
+Inputs are read with the typed schema of src/raw_reader.py (categoricals,
+datetime64 dates), but with the ID columns kept as the strings in the raw
+files: the aggregations group and count distinct IDs on that text, as Spark
+does, so malformed IDs (which all share one integer code) stay apart, and the
+Power BI exports carry the IDs exactly as written.
+Parquet output gets plain string and date columns, like Spark's.
+"""
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.config import SPARK_CONFIG
+from src.instrumentation import step
+from src.raw_reader import decode_frame, read_table
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
+
+# Same partition keys as PARQUET_PARTITIONS in src/pyspark_transform.py
+PARQUET_PARTITIONS = {
+    "visits_powerbi": {"visit_year": "visit_date", "visit_month": "visit_date"},
+    "lab_reports_powerbi": {"report_year": "report_date", "report_month": "report_date"},
+}
+
+
+def _to_arrow(df):
+    """Arrow table with Spark's column types: categoricals as strings, timestamps as dates."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+        elif pa.types.is_timestamp(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.date32()))
+    return table
+
+
+def write_output(df, folder_name, output_format="csv", processed_dir=PROCESSED_DIR):
+    """Replace a processed folder with `df` as a single part file (or a partitioned Parquet dataset)."""
+    path = os.path.join(processed_dir, folder_name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    df = decode_frame(df)
+
+    if output_format == "parquet":
+        partitions = PARQUET_PARTITIONS.get(folder_name, {})
+        if partitions:
+            df = df.copy()
+            for name, source in partitions.items():
+                dates = pd.to_datetime(df[source], errors="coerce")
+                df[name] = dates.dt.year if name.endswith("_year") else dates.dt.month
+        table = _to_arrow(df)
+        compression = SPARK_CONFIG["parquet_compression"]
+        if partitions:
+            pq.write_to_dataset(table, path, partition_cols=list(partitions), compression=compression,
+                                basename_template="part-{i}.parquet")
+        else:
+            pq.write_table(table, os.path.join(path, "part-00000.parquet"), compression=compression)
+    else:
+        # Spark's CSV writer trims leading/trailing whitespace (ignore*WhiteSpace defaults)
+        text_columns = df.select_dtypes(include=["object", "string", "category"]).columns
+        if len(text_columns):
+            df = df.assign(**{c: df[c].str.strip() for c in text_columns})
+        df.to_csv(os.path.join(path, "part-00000.csv"), index=False)
+
+    open(os.path.join(path, "_SUCCESS"), "w").close()
+
+
+def doctor_summary(visits, doctors):
+    summary = visits.groupby("doctor_id", dropna=False).agg(
+        total_visits=("visit_id", "count"),
+        unique_patients=("patient_id", "nunique"),
+    ).reset_index()
+    return summary.merge(doctors, on="doctor_id", how="left")
+
+
+def city_distribution(patients):
+    return patients.groupby("city", dropna=False).agg(patient_count=("patient_id", "count")).reset_index()
+
+
+def visit_reason_analysis(visits):
+    return visits.groupby("reason", dropna=False).agg(
+        total_visits=("visit_id", "count"),
+        unique_patients=("patient_id", "nunique"),
+    ).reset_index()
+
+
+def lab_result_distribution(lab_reports):
+    return lab_reports.groupby(["test_type", "result"], dropna=False).agg(
+        report_count=("report_id", "count"),
+    ).reset_index()
+
+
+def hospital_visits(visits, doctors):
+    joined = visits.merge(doctors[["doctor_id", "hospital"]], on="doctor_id", how="left")
+    return joined.groupby("hospital", dropna=False).agg(
+        total_visits=("visit_id", "count"),
+        unique_patients=("patient_id", "nunique"),
+        active_doctors=("doctor_id", "nunique"),
+    ).reset_index()
+
+
+def run_local_transform(output_format=None, raw_dir=RAW_DIR, processed_dir=PROCESSED_DIR):
+    """
+    Pandas equivalent of run_spark_transform():
+    - Reads raw CSVs
+    - Performs the same aggregations
+    - Writes processed data for analytics / Power BI
+    """
+    output_format = output_format or SPARK_CONFIG["output_format"]
+    os.makedirs(processed_dir, exist_ok=True)
+
+    # ---- Read Raw Data ----
+    with step("read:raw") as s:
+        # IDs as text: grouping on integer codes would merge every malformed ID into INVALID_ID
+        patients_df = read_table("patients", encode=False, raw_dir=raw_dir)
+        doctors_df = read_table("doctors", encode=False, raw_dir=raw_dir)
+        visits_df = read_table("visits", encode=False, raw_dir=raw_dir)
+        lab_reports_df = read_table("lab_reports", encode=False, raw_dir=raw_dir)
+        s.rows_out = len(patients_df) + len(doctors_df) + len(visits_df) + len(lab_reports_df)
+
+    outputs = [
+        ("doctor_summary", lambda: doctor_summary(visits_df, doctors_df), len(visits_df), "Doctor Summary"),
+        ("city_distribution", lambda: city_distribution(patients_df), len(patients_df), "City Distribution"),
+        ("visit_reason_analysis", lambda: visit_reason_analysis(visits_df), len(visits_df), "Visit Reason Analysis"),
+        ("lab_result_distribution", lambda: lab_result_distribution(lab_reports_df), len(lab_reports_df),
+         "Lab Result Distribution"),
+        ("hospital_visits", lambda: hospital_visits(visits_df, doctors_df), len(visits_df), "Hospital Visit Summary"),
+    ]
+    for folder_name, build, rows_in, label in outputs:
+        with step(f"transform:{folder_name}", rows_in=rows_in) as s:
+            df = build()
+            s.rows_out = len(df)
+            with step(f"write:{folder_name}", rows_in=len(df)):
+                write_output(df, folder_name, output_format, processed_dir)
+        print(f"  [OK] {label} written to {os.path.join(processed_dir, folder_name)}/")
+
+    # ---- Power BI Ready Exports ----
+    exports = [("patients_powerbi", patients_df), ("doctors_powerbi", doctors_df),
+               ("visits_powerbi", visits_df), ("lab_reports_powerbi", lab_reports_df)]
+    for folder_name, df in exports:
+        with step(f"write:{folder_name}", rows_in=len(df)) as s:
+            write_output(df, folder_name, output_format, processed_dir)
+            s.rows_out = len(df)
+    print(f"  [OK] Power BI ready exports written to {processed_dir}/")
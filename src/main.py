@@ -1,6 +1,7 @@
 import sys
 import os
 import io
+import argparse
 
 # Fix Windows console encoding for emoji support
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
@@ -8,53 +9,127 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='repla
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.etl_ingest import load_csv_to_mysql
-from src.data_validation import validate_patients, validate_doctors, validate_visits, validate_lab_reports
-from src.pyspark_transform import run_spark_transform
-
-
-def run_pipeline():
+from src.parallel_ingest import load_all_tables
+from src.incremental_ingest import ingest_all_incremental
+from src.summary_refresh import refresh_summaries
+from src.transform_backend import BACKENDS, RAW_FILES, choose_backend, run_transform
+from src.generate_dashboard_data import OUTPUT_FILE as DASHBOARD_FILE, PROCESSED_DIR, PROCESSED_INPUTS
+from src.generate_dashboard_data import generate as generate_dashboard
+from src.generate_patient_records import generate as generate_patient_records
+from src.patient_record_store import STORE_DIR
+from src.config import CUBE_CONFIG
+from src.olap_cube import CUBE_DIR, EXPORT_FILE as CUBE_EXPORT_FILE
+from src.olap_cube import generate as generate_cubes
+from src.patient_features import FEATURES_DIR, generate as generate_features
+from src.instrumentation import PROFILERS, start_run, finish_run
+from src.scheduler import Scheduler, Stage
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+STAGES = ["ingest", "summary_refresh", "transform", "dashboard", "cube", "patient_records", "features"]
+
+
+def ingest(incremental=False, raw_dir=RAW_DIR):
+    """Load the raw CSVs into MySQL (OLTP)."""
+    if incremental:
+        print("  Loading new and changed rows (incremental)...")
+        ingest_all_incremental(raw_dir)
+    else:
+        # patients + doctors load in parallel; visits and lab_reports wait on their FK parents
+        print("  Loading Patients, Doctors, Visits, Lab Reports (parallel)...")
+        load_all_tables(raw_dir)
+    print("  [OK] MySQL ingestion completed!")
+
+
+def build_stages(incremental=False, backend=None, raw_dir=RAW_DIR):
+    """The pipeline stages and the files each one reads and writes (see src/scheduler.py)."""
+    raw_files = [os.path.join(raw_dir, f) for f in RAW_FILES]
+    backend = choose_backend(backend, raw_dir)
+    return [
+        # MySQL is optional: the rest of the pipeline reads the raw CSVs, not the database
+        Stage("ingest", lambda: ingest(incremental, raw_dir), inputs=raw_files,
+              params={"incremental": incremental}, optional=True),
+        # Fold the new rows into the summary tables (sql/summary.sql)
+        Stage("summary_refresh", refresh_summaries, after=["ingest"], optional=True),
+        Stage("transform", lambda: run_transform(backend, raw_dir=raw_dir), inputs=raw_files,
+              outputs=[PROCESSED_DIR], params={"backend": backend}),
+        Stage("dashboard", lambda: generate_dashboard(force=True, raw_dir=raw_dir),
+              inputs=raw_files[:3] + [os.path.join(PROCESSED_DIR, f) for f in PROCESSED_INPUTS],
+              outputs=[DASHBOARD_FILE, DASHBOARD_FILE + ".gz"]),
+        Stage("cube", lambda: generate_cubes(raw_dir=raw_dir), inputs=raw_files[1:],
+              outputs=[CUBE_DIR, CUBE_EXPORT_FILE, CUBE_EXPORT_FILE + ".gz"],
+              params={"export_grain": CUBE_CONFIG["export_grain"]}),
+        Stage("patient_records", lambda: generate_patient_records(raw_dir=raw_dir, sharded=True),
+              inputs=raw_files, outputs=[STORE_DIR]),
+        # On Spark both stages share the getOrCreate() session and each stops it when done,
+        # so the feature build must not overlap the transform
+        Stage("features", lambda: generate_features(incremental, backend, raw_dir=raw_dir), inputs=raw_files,
+              outputs=[FEATURES_DIR], after=["transform"] if backend == "spark" else [],
+              params={"backend": backend, "incremental": incremental}),
+    ]
+
+
+def run_pipeline(incremental=False, backend=None, profile=None, stages=None, force=False, resume=False,
+                 workers=None):
     """
     Main ETL Pipeline Runner
     ========================
     1. Validates and loads raw CSV data into MySQL (OLTP)
     2. Runs PySpark transformations for analytics
     3. Exports processed data for Power BI consumption
+    4. Builds the portal data (dashboard_data.json, drill-down cubes, sharded patient records)
+    5. Builds the per-patient feature table for risk scoring (data/features/)
+
+    The stages run on a dependency-aware scheduler (src/scheduler.py): the
+    MySQL load overlaps the transform, the portal builds overlap each other,
+    and a stage whose inputs are unchanged since its last successful run is
+    skipped. `stages` limits the run to those stages and their dependencies;
+    `force` reruns everything; `resume` reruns only what failed or never ran.
+
+    With incremental=True, step 1 upserts only rows that are new or changed
+    since the last run (see src/incremental_ingest.py), and step 5 recomputes
+    only the patients with new visits, lab reports or records (src/patient_features.py).
+    `backend` selects the step 2 and step 5 engine: "spark", "local" (in-process, no JVM)
+    or "auto" (by input size; see src/transform_backend.py).
+
+    Every run writes a step-by-step timing report to data/reports/run_<timestamp>.json
+    (see src/instrumentation.py); `profile` ("cprofile" or "sample") adds the
+    hottest functions to it.
     """
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+    start_run("pipeline", {"incremental": incremental, "backend": backend, "stages": stages,
+                           "force": force, "resume": resume}, profile)
+    error = None
+    try:
+        return _run_stages(incremental, backend, stages, force, resume, workers)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        report_file = finish_run(error)
+        print(f"\n[INFO] Run report written to {report_file}")
 
+
+def _run_stages(incremental, backend, stages, force, resume, workers):
     print("=" * 60)
     print("[HEALTHCARE] Healthcare Data Platform - ETL Pipeline")
     print("=" * 60)
 
-    # Step 1: Load data into MySQL
-    print("\n[STEP 1] Loading Raw Data into MySQL...")
-    print("-" * 40)
-
-    try:
-        print("  Loading Patients...")
-        load_csv_to_mysql(os.path.join(RAW_DIR, "patients.csv"), "patients", validate_patients)
-
-        print("  Loading Doctors...")
-        load_csv_to_mysql(os.path.join(RAW_DIR, "doctors.csv"), "doctors", validate_doctors)
-
-        print("  Loading Visits...")
-        load_csv_to_mysql(os.path.join(RAW_DIR, "visits.csv"), "visits", validate_visits)
-
-        print("  Loading Lab Reports...")
-        load_csv_to_mysql(os.path.join(RAW_DIR, "lab_reports.csv"), "lab_reports", validate_lab_reports)
+    scheduler = Scheduler(build_stages(incremental, backend), workers=workers)
+    results = scheduler.run(stages, force=force, resume=resume)
 
-        print("  [OK] MySQL ingestion completed!")
-    except Exception as e:
-        print(f"  [WARN] MySQL ingestion skipped: {e}")
-        print("  [INFO] Update DB_PASSWORD in src/config.py or .env file")
-        print("  [INFO] Continuing with PySpark transformations...")
+    print("\n[SUMMARY]")
+    for name, result in results.items():
+        print(f"  {name:<16} {result}")
+    if results.get("ingest") == "failed":
+        print("  [INFO] Update DB_PASSWORD in src/config.py or .env file to load MySQL")
+    if results.get("summary_refresh") == "failed":
+        print("  [INFO] Install the summary tables with sql/summary.sql, then run python -m src.summary_refresh --full")
 
-    # Step 2: Run PySpark Transformations
-    print("\n[STEP 2] Running PySpark Transformations...")
-    print("-" * 40)
-    run_spark_transform()
+    failed = [name for name, result in results.items()
+              if result in ("failed", "blocked") and not scheduler.stages[name].optional]
+    if failed:
+        raise RuntimeError(f"Pipeline stages failed: {', '.join(failed)}; "
+                           f"fix the cause and rerun with --resume")
 
     # Done
     print("\n" + "=" * 60)
@@ -64,7 +139,23 @@ def run_pipeline():
     print("  1. Connect Power BI to data/processed/ CSVs")
     print("  2. Or connect Power BI directly to MySQL healthcare_db")
     print("  3. Deploy to AWS using aws_deployment.md guide")
+    return results
 
 
 if __name__ == "__main__":
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="Healthcare Data Platform ETL pipeline")
+    parser.add_argument("--incremental", action="store_true",
+                        help="upsert only new/changed rows using the ingest manifest")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="transform engine (default: TRANSFORM_BACKEND or auto by input size)")
+    parser.add_argument("--profile", choices=PROFILERS, default=None,
+                        help="add a cProfile or sampling profile of the run to its report")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=None,
+                        help="run only these stages and the stages they depend on")
+    parser.add_argument("--force", action="store_true", help="rerun stages even if their inputs are unchanged")
+    parser.add_argument("--resume", action="store_true",
+                        help="rerun only the stages that failed or did not run last time")
+    parser.add_argument("--workers", type=int, default=None, help="stages run at the same time (default: PIPELINE_WORKERS)")
+    args = parser.parse_args()
+    run_pipeline(incremental=args.incremental, backend=args.backend, profile=args.profile, stages=args.stages,
+                 force=args.force, resume=args.resume, workers=args.workers)
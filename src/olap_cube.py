@@ -0,0 +1,291 @@
+"""
+Pre-aggregated OLAP cubes for dashboard drill-downs.
+
+Two fact tables are built from typed reads of the raw CSVs (src/raw_reader.py):
+
+    visits        date=visit_date   hospital, specialization, visit_type, reason   -> visits
+    lab_reports   date=report_date  the same four (via the report's visit),
+                                    plus test_type, result                          -> reports
+
+Each row is one (day, dimension members) cell with an additive count, so any
+coarser view is a sum over cells. Cubes are stored as Parquet in data/cube/:
+the dimensions are dictionary-encoded, and rows are sorted by date, so row
+group statistics let a date-range load skip most of the file.
+
+    cube = Cube.load("visits", start="2024-01-01", end="2024-03-31")
+    cube.slice(hospital="Fortis").rollup(["specialization"], grain="month")
+    Cube.load("lab_reports").slice(test_type=["ECG", "MRI"]).rollup(["result"])
+
+Grains are day, week (labelled by its Monday), month, quarter and year.
+Distinct counts (unique patients) are not additive across cells and are not
+kept here; they stay in the processed aggregates.
+
+export_cubes() writes dashboard/cube_data.json (+ .gz), a compact columnar
+copy at CUBE_CONFIG["export_grain"] (month by default; the Parquet cubes keep
+day grain): per-dimension dictionaries plus integer code arrays, and periods
+as day offsets from a base date. The Drill-down section of admin.html fetches
+it when the section is first opened and queries it through dashboard/olap_cube.js.
+
+    python -m src.olap_cube             # build data/cube/ and the dashboard export
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.config import CUBE_CONFIG
+from src.id_codec import INVALID_ID
+from src.raw_reader import read_table
+from src.generate_dashboard_data import write_payload
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+CUBE_DIR = os.path.join(BASE_DIR, "data", "cube")
+EXPORT_FILE = os.path.join(BASE_DIR, "dashboard", "cube_data.json")
+
+VISIT_DIMS = ["hospital", "specialization", "visit_type", "reason"]
+CUBE_DIMS = {
+    "visits": VISIT_DIMS,
+    "lab_reports": VISIT_DIMS + ["test_type", "result"],
+}
+MEASURES = {"visits": "visits", "lab_reports": "reports"}
+GRAINS = ["day", "week", "month", "quarter", "year"]
+# Grains that can be summed from cells of a given grain (weeks straddle months and years)
+ROLLS_UP_TO = {"day": GRAINS, "week": ["week"], "month": ["month", "quarter", "year"],
+               "quarter": ["quarter", "year"], "year": ["year"]}
+PERIOD_FREQ = {"month": "M", "quarter": "Q", "year": "Y"}
+MISSING_CODE = -1
+
+
+# ---------- Build ----------
+
+def _cells(df, name, summed=False):
+    """
+    Count rows per (date, dims) cell, or re-sum the measure of existing cells when
+    `summed`; missing members and dates are kept as their own cells.
+    """
+    dims, measure = CUBE_DIMS[name], MEASURES[name]
+    groups = df.groupby(["date", *dims], observed=True, dropna=False)
+    cells = (groups[measure].sum() if summed else groups.size()).reset_index(name=measure)
+    return cells.sort_values(["date", *dims], ignore_index=True)
+
+
+def build_cubes(raw_dir=RAW_DIR):
+    """Return {cube name: cell DataFrame} built from the raw CSVs."""
+    doctors = read_table("doctors", columns=["doctor_id", "specialization", "hospital"], raw_dir=raw_dir)
+    visits = read_table("visits", columns=["visit_id", "doctor_id", "visit_date", "reason", "visit_type"],
+                        raw_dir=raw_dir)
+    labs = read_table("lab_reports", columns=["visit_id", "test_type", "result", "report_date"], raw_dir=raw_dir)
+
+    # Lookups keep one row per valid key, so malformed or duplicate IDs cannot multiply facts
+    doctors = doctors[doctors["doctor_id"] != INVALID_ID].drop_duplicates("doctor_id")
+    visits = visits.merge(doctors, on="doctor_id", how="left")
+    lookup = visits[visits["visit_id"] != INVALID_ID].drop_duplicates("visit_id")
+    labs = labs.merge(lookup[["visit_id", *VISIT_DIMS]], on="visit_id", how="left")
+
+    return {
+        "visits": _cells(visits.rename(columns={"visit_date": "date"}), "visits"),
+        "lab_reports": _cells(labs.rename(columns={"report_date": "date"}), "lab_reports"),
+    }
+
+
+def _to_arrow(cells):
+    table = pa.Table.from_pandas(cells, preserve_index=False)
+    date_index = table.schema.get_field_index("date")
+    return table.set_column(date_index, "date", table.column("date").cast(pa.date32()))
+
+
+def save_cubes(cubes, cube_dir=CUBE_DIR, compression=None):
+    """Write each cube to <cube_dir>/<name>.parquet plus meta.json."""
+    compression = compression or CUBE_CONFIG["compression"]
+    os.makedirs(cube_dir, exist_ok=True)
+    meta = {"created": datetime.now().isoformat(timespec="seconds"), "grains": GRAINS, "cubes": {}}
+    for name, cells in cubes.items():
+        path = os.path.join(cube_dir, f"{name}.parquet")
+        tmp_path = path + ".tmp"
+        pq.write_table(_to_arrow(cells), tmp_path, compression=compression,
+                       row_group_size=CUBE_CONFIG["row_group_size"])
+        os.replace(tmp_path, path)
+        meta["cubes"][name] = {"dims": CUBE_DIMS[name], "measure": MEASURES[name], "cells": len(cells),
+                               "total": int(cells[MEASURES[name]].sum()), "bytes": os.path.getsize(path)}
+    with open(os.path.join(cube_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# ---------- Query ----------
+
+def _week_start(dates):
+    return dates - pd.to_timedelta(dates.dt.weekday, unit="D")
+
+
+def floor_dates(dates, grain):
+    """First day of each date's period at `grain` (weeks start on Monday)."""
+    if grain == "day":
+        return dates
+    if grain == "week":
+        return _week_start(dates)
+    return dates.dt.to_period(PERIOD_FREQ[grain]).dt.start_time
+
+
+def bucket_labels(dates, grain):
+    """Period label of each date at `grain` ("2024-01-15", week Monday "2024-01-15", "2024-01", "2024-Q1", "2024")."""
+    if grain not in GRAINS:
+        raise ValueError(f"Unknown grain `{grain}`; expected one of {GRAINS}")
+    # Label the distinct dates only, then map back through the factorized codes
+    codes, uniques = pd.factorize(pd.Series(dates))
+    uniques = pd.Series(uniques)
+    if grain == "day":
+        labels = uniques.dt.strftime("%Y-%m-%d")
+    elif grain == "week":
+        labels = _week_start(uniques).dt.strftime("%Y-%m-%d")
+    elif grain == "month":
+        labels = uniques.dt.strftime("%Y-%m")
+    elif grain == "quarter":
+        labels = uniques.dt.strftime("%Y") + "-Q" + uniques.dt.quarter.astype(str)
+    else:
+        labels = uniques.dt.strftime("%Y")
+    # NaT has code -1, which picks the trailing None
+    return np.append(labels.to_numpy(dtype=object), None)[codes]
+
+
+class Cube:
+    """One fact table: a date column, dimension columns and one additive measure."""
+
+    def __init__(self, name, cells):
+        if name not in CUBE_DIMS:
+            raise ValueError(f"Unknown cube `{name}`; expected one of {list(CUBE_DIMS)}")
+        self.name = name
+        self.dims = CUBE_DIMS[name]
+        self.measure = MEASURES[name]
+        self.cells = cells
+
+    @classmethod
+    def load(cls, name, start=None, end=None, cube_dir=CUBE_DIR):
+        """Read a saved cube; a date range is pushed down to the Parquet row groups."""
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", pd.Timestamp(start).date()))
+        if end is not None:
+            filters.append(("date", "<=", pd.Timestamp(end).date()))
+        table = pq.read_table(os.path.join(cube_dir, f"{name}.parquet"), filters=filters or None)
+        cells = table.to_pandas(date_as_object=False)
+        return cls(name, cells)
+
+    @classmethod
+    def build(cls, name, raw_dir=RAW_DIR):
+        return cls(name, build_cubes(raw_dir)[name])
+
+    def _check_dims(self, dims):
+        unknown = [d for d in dims if d not in self.dims]
+        if unknown:
+            raise ValueError(f"Unknown dimension(s) {unknown} for cube `{self.name}`; expected some of {self.dims}")
+
+    def slice(self, start=None, end=None, **members):
+        """Sub-cube for a date range (inclusive) and dimension members (one value or a list each)."""
+        self._check_dims(members)
+        mask = np.ones(len(self.cells), dtype=bool)
+        if start is not None:
+            mask &= (self.cells["date"] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (self.cells["date"] <= pd.Timestamp(end)).to_numpy()
+        for dim, values in members.items():
+            values = [values] if isinstance(values, str) else list(values)
+            mask &= self.cells[dim].isin(values).to_numpy()
+        return Cube(self.name, self.cells[mask].reset_index(drop=True))
+
+    def rollup(self, by=(), grain=None):
+        """
+        Sum the measure over everything except `by` (and the period, when `grain` is set).
+        Returns a DataFrame with a `period` column (if any), the `by` columns and the measure.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        self._check_dims(by)
+        keys = []
+        frame = self.cells[by + [self.measure]]
+        if grain is not None:
+            frame = frame.assign(period=bucket_labels(self.cells["date"], grain))
+            keys.append("period")
+        keys += by
+        if not keys:
+            return pd.DataFrame({self.measure: [int(frame[self.measure].sum())]})
+        out = frame.groupby(keys, observed=True, dropna=False)[self.measure].sum().reset_index()
+        return out.sort_values(keys, ignore_index=True)
+
+    def total(self):
+        return int(self.cells[self.measure].sum())
+
+
+# ---------- Dashboard export ----------
+
+def _export_cube(cells, name, base, grain):
+    dims = CUBE_DIMS[name]
+    if grain != "day":
+        # each cell moves to the first day of its period
+        cells = _cells(cells.assign(date=floor_dates(cells["date"], grain)), name, summed=True)
+    days = (cells["date"] - base).dt.days
+    columns = {"day": days.fillna(MISSING_CODE).astype(int).tolist()}
+    dictionaries = {}
+    for dim in dims:
+        values = cells[dim].astype("category")
+        dictionaries[dim] = values.cat.categories.tolist()
+        columns[dim] = values.cat.codes.tolist()
+    columns[MEASURES[name]] = cells[MEASURES[name]].astype(int).tolist()
+    return {"dims": dims, "measure": MEASURES[name], "rows": len(cells),
+            "dictionaries": dictionaries, "columns": columns}
+
+
+def export_cubes(cubes, output_file=EXPORT_FILE, grain=None):
+    """
+    Write the cubes as columnar JSON for the dashboard (+ a gzip copy). Days are
+    offsets from `base_date`; dimension values are codes into `dictionaries`;
+    -1 marks a missing day or member. A coarser export `grain` (week, month, ...)
+    makes the file smaller, and `grains` then lists only what it can still be
+    rolled up to. Returns (bytes, gzipped bytes).
+    """
+    grain = grain or CUBE_CONFIG["export_grain"]
+    if grain not in GRAINS:
+        raise ValueError(f"Unknown grain `{grain}`; expected one of {GRAINS}")
+    dates = floor_dates(pd.concat([cells["date"] for cells in cubes.values()]), grain)
+    base = dates.min()
+    payload = {
+        "version": 1,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "base_date": base.strftime("%Y-%m-%d") if pd.notna(base) else None,
+        "end_date": dates.max().strftime("%Y-%m-%d") if pd.notna(base) else None,
+        "grain": grain,
+        "grains": ROLLS_UP_TO[grain],
+        "cubes": {name: _export_cube(cells, name, base, grain) for name, cells in cubes.items()},
+    }
+    # level 9 takes ~20x longer on these long digit runs for a ~7% smaller file
+    return write_payload(payload, output_file, level=6)
+
+
+def generate(raw_dir=RAW_DIR, cube_dir=CUBE_DIR, output_file=EXPORT_FILE):
+    """Build the cubes from the raw CSVs, save them to `cube_dir` and export them for the dashboard."""
+    print("Building OLAP cubes...")
+    cubes = build_cubes(raw_dir)
+    meta = save_cubes(cubes, cube_dir)
+    for name, info in meta["cubes"].items():
+        print(f"  [OK] {name}: {info['cells']:,} cells, {info['total']:,} {info['measure']} "
+              f"({info['bytes']:,} bytes)")
+    size, gz_size = export_cubes(cubes, output_file)
+    print(f"  [OK] Dashboard cube written to {output_file} ({size:,} bytes, {gz_size:,} gzipped)")
+    return meta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the OLAP cubes and their dashboard export")
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--cube-dir", default=CUBE_DIR)
+    parser.add_argument("--output", default=EXPORT_FILE, help="dashboard export (default: dashboard/cube_data.json)")
+    args = parser.parse_args()
+    generate(args.raw_dir, args.cube_dir, args.output)
@@ -0,0 +1,168 @@
+"""
+Parallel, foreign-key aware MySQL loader.
+
+Tables with no FK relationship between them (patients, doctors) load at the
+same time; a table only waits for the parents its FOREIGN KEYs reference in
+sql/schema.sql. Each table is split into chunks that are inserted by a pool of
+worker threads, each holding its own pooled MySQL connection.
+"""
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.config import INGEST_CONFIG, DB_POOL_CONFIG
+from src.db_connection import get_pool
+from src.instrumentation import profile_thread, step
+from src.raw_reader import read_table_chunks
+from src.etl_ingest import build_insert_sql, insert_frame, load_data_infile
+from src.data_validation import (validate_patients, validate_doctors, validate_visits, validate_lab_reports,
+                                 build_validators, write_quarantine_summary, QUARANTINE_DIR)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+SCHEMA_FILE = os.path.join(BASE_DIR, "sql", "schema.sql")
+
+# table -> (raw file, validator)
+TABLE_SOURCES = {
+    "patients": ("patients.csv", validate_patients),
+    "doctors": ("doctors.csv", validate_doctors),
+    "visits": ("visits.csv", validate_visits),
+    "lab_reports": ("lab_reports.csv", validate_lab_reports),
+}
+
+
+def parse_fk_dependencies(schema_file=SCHEMA_FILE):
+    """Return {table: [parent tables]} from the FOREIGN KEY clauses in schema.sql."""
+    with open(schema_file) as f:
+        schema = f.read()
+
+    deps = {}
+    for match in re.finditer(r"CREATE TABLE(?: IF NOT EXISTS)?\s+(\w+)\s*\((.*?)\);", schema, re.S | re.I):
+        table, body = match.group(1), match.group(2)
+        parents = re.findall(r"REFERENCES\s+(\w+)\s*\(", body, re.I)
+        deps[table] = sorted(set(p for p in parents if p != table))
+    return deps
+
+
+def load_chunk(table_name, chunk, validator=None, use_load_data=False, batch_size=None, commit_every=None):
+    """Validate and insert one chunk on a pooled connection. Returns rows written."""
+    if validator:
+        chunk = validator(chunk)
+    if chunk.empty:
+        return 0
+
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        try:
+            if use_load_data:
+                load_data_infile(cursor, table_name, chunk)
+            else:
+                sql = build_insert_sql(table_name, list(chunk.columns))
+                insert_frame(conn, cursor, table_name, chunk, batch_size, commit_every, sql)
+            conn.commit()
+        finally:
+            cursor.close()
+    return len(chunk)
+
+
+def load_table(executor, file_path, table_name, validator=None, chunksize=None, max_in_flight=None,
+               use_load_data=False, table_validator=None):
+    """
+    Split a CSV into chunks and insert them concurrently on `executor`.
+    At most `max_in_flight` chunks are held in memory at once.
+    A `table_validator` (data_validation.TableValidator) runs on the reading
+    thread, in file order, so its cross-chunk dedup state stays consistent.
+    """
+    chunksize = chunksize or INGEST_CONFIG["chunksize"]
+    max_in_flight = max_in_flight or 2 * DB_POOL_CONFIG["size"]
+
+    start = time.perf_counter()
+    total_rows = 0
+    in_flight = set()
+
+    for chunk in read_table_chunks(table_name, chunksize, path=file_path):
+        if table_validator:
+            chunk = table_validator.validate(chunk)
+        if len(in_flight) >= max_in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            total_rows += sum(f.result() for f in done)
+        in_flight.add(executor.submit(load_chunk, table_name, chunk, validator, use_load_data))
+
+    total_rows += sum(f.result() for f in wait(in_flight).done)
+
+    elapsed = time.perf_counter() - start
+    rate = total_rows / elapsed if elapsed > 0 else 0.0
+    print(f"  [OK] Loaded {total_rows} rows into `{table_name}` in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    return {"table": table_name, "rows": total_rows, "seconds": elapsed, "rows_per_sec": rate}
+
+
+def load_all_tables(raw_dir=RAW_DIR, workers=None, chunksize=None, tables=None, schema_file=SCHEMA_FILE,
+                    quarantine_dir=QUARANTINE_DIR):
+    """
+    Load every table in TABLE_SOURCES, running independent tables in parallel
+    and starting each table only once its FK parents have finished.
+    Rows are checked by streaming TableValidators (nulls, allowed values,
+    FK references, cross-chunk duplicates); rejects go to `quarantine_dir`.
+    `workers` defaults to the connection pool size. Returns per-table stats.
+    """
+    tables = tables or list(TABLE_SOURCES)
+    workers = workers or DB_POOL_CONFIG["size"]
+    use_load_data = INGEST_CONFIG["use_load_data"]
+    deps = parse_fk_dependencies(schema_file)
+    validators = build_validators(tables, quarantine_dir)
+
+    chunk_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-chunk")
+    table_executor = ThreadPoolExecutor(max_workers=len(tables), thread_name_prefix="ingest-table")
+    futures = {}
+
+    def run_table(table_name):
+        for parent in deps.get(table_name, []):
+            if parent in futures:
+                futures[parent].result()  # re-raises if a parent failed
+        file_name, _ = TABLE_SOURCES[table_name]
+        with profile_thread(), step(f"load:{table_name}") as s:
+            stats = load_table(chunk_executor, os.path.join(raw_dir, file_name), table_name,
+                               chunksize=chunksize, max_in_flight=2 * workers, use_load_data=use_load_data,
+                               table_validator=validators[table_name])
+            stats["validation"] = validators[table_name].report()
+            s.rows_in, s.rows_out = stats["validation"]["rows_in"], stats["rows"]
+            s.attrs.update(rejected=stats["validation"]["rejected"],
+                           validation_seconds=stats["validation"]["seconds"])
+        return stats
+
+    try:
+        # Submit parents before children so every dependency future exists when awaited
+        for table_name in topological_order(tables, deps):
+            futures[table_name] = table_executor.submit(run_table, table_name)
+        results = {name: futures[name].result() for name in tables}
+    finally:
+        table_executor.shutdown(wait=True)
+        chunk_executor.shutdown(wait=True)
+
+    summary = write_quarantine_summary(validators, quarantine_dir)
+    rejected = sum(r["rejected"] for r in summary.values())
+    if rejected:
+        print(f"  [WARN] {rejected} rows quarantined - see {os.path.join(quarantine_dir, 'summary.json')}")
+    return results
+
+
+def topological_order(tables, deps):
+    """Order tables so that FK parents come before their children."""
+    ordered, visiting = [], set()
+
+    def visit(table):
+        if table in ordered:
+            return
+        if table in visiting:
+            raise ValueError(f"Circular foreign key dependency involving `{table}`")
+        visiting.add(table)
+        for parent in deps.get(table, []):
+            if parent in tables:
+                visit(parent)
+        visiting.discard(table)
+        ordered.append(table)
+
+    for table in tables:
+        visit(table)
+    return ordered
@@ -0,0 +1,279 @@
+"""
+Content-addressed cache of parsed raw CSVs as Arrow IPC (Feather v2) files.
+
+The first read of a raw file parses it once and saves the Arrow table
+uncompressed to data/cache/raw/<name>-<key>.arrow. The key is the sha256 of
+the file's contents plus the parser's `variant`. Later reads memory-map that
+file, whether they come from the same stage, another stage or a separate
+process (benchmark workers, query service). The columns are used straight
+from the page cache, without parsing or copying.
+
+Each source file has its own small index file under data/cache/raw/sources/
+that remembers its size, mtime and hash, so an unchanged file is not hashed
+again. Keeping one index file per source means processes caching different
+sources never overwrite each other's records. When a source's contents
+change, its next read writes a new entry and deletes the stale one; entries
+of sources that no longer exist are deleted along with their index files.
+Entries and index files are written to a temporary file and renamed into
+place, so concurrent readers never see a partial file.
+
+    table = cached_table(path, parse, variant="raw-v1")    # parse(path) -> pyarrow.Table
+    for batch in cached_batches(path, open_reader, variant="raw-v1"): ...
+                                                  # open_reader(path) -> pyarrow.RecordBatchReader
+
+cached_batches() is for chunked readers: on a miss it writes each batch to
+the entry as it is yielded, so the file is never held in memory whole.
+
+    python -m src.parse_cache --warm        # parse data/raw/ ahead of a run
+    python -m src.parse_cache --clear
+"""
+import os
+import sys
+import json
+import glob
+import hashlib
+import argparse
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from src.config import PARSE_CACHE_CONFIG
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+CACHE_DIR = PARSE_CACHE_CONFIG["dir"] or os.path.join(BASE_DIR, "data", "cache", "raw")
+INDEX_DIR = "sources"
+
+_index_lock = threading.Lock()
+_path_locks = {}
+
+
+def _path_lock(path):
+    with _index_lock:
+        return _path_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _tmp_name(path):
+    # unique per process and thread, so concurrent writers never share a temp file
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _index_path(source, cache_dir):
+    key = hashlib.sha256(source.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, INDEX_DIR, f"{os.path.basename(source)}-{key}.json")
+
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None  # missing, or damaged: only costs a re-hash
+
+
+def load_source(path, cache_dir=CACHE_DIR):
+    """Index record of one source file ({source, size, mtime_ns, sha256, entries}), or {}."""
+    return _load_json(_index_path(os.path.abspath(path), cache_dir)) or {}
+
+
+def load_index(cache_dir=CACHE_DIR):
+    """{"sources": {path: record}} over every per-source index file."""
+    sources = {}
+    for index_path in glob.glob(os.path.join(cache_dir, INDEX_DIR, "*.json")):
+        known = _load_json(index_path)
+        if known and "source" in known:
+            sources[known["source"]] = known
+    return {"sources": sources}
+
+
+def _save_source(known, cache_dir):
+    path = _index_path(known["source"], cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = _tmp_name(path)
+    with open(tmp_path, "w") as f:
+        json.dump(known, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def content_hash(path, known):
+    """sha256 of a file, reusing its index record while the size and mtime are unchanged."""
+    stat = os.stat(path)
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return known["sha256"]
+    return _file_sha256(path)
+
+
+def input_digest(files, cache):
+    """
+    Combined sha256 over the contents of `files`. A file whose size and mtime match
+    its entry in `cache["files"]` reuses the recorded hash instead of being read again.
+    Returns (digest, per-file entries keyed by path relative to the repo root).
+    """
+    known = cache.get("files", {})
+    entries = {}
+    combined = hashlib.sha256()
+    for path in files:
+        key = os.path.relpath(path, BASE_DIR)
+        stat = os.stat(path)
+        entry = known.get(key)
+        if not entry or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": _file_sha256(path)}
+        entries[key] = entry
+        combined.update(f"{key}\0{entry['sha256']}\n".encode())
+    return combined.hexdigest(), entries
+
+
+def entry_name(path, sha256, variant):
+    key = hashlib.sha256(f"{sha256}\0{variant}".encode()).hexdigest()[:16]
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{key}.arrow"
+
+
+def _read_entry(entry_path):
+    # memory_map: column buffers point into the mapped file instead of being read into memory
+    return pa.ipc.open_file(pa.memory_map(entry_path, "r")).read_all()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass  # already gone, or still mapped by a reader on Windows
+
+
+def evict(candidates=(), cache_dir=CACHE_DIR):
+    """
+    Drop the records and entries of sources that no longer exist, then delete every
+    candidate entry that no record references any more. Returns the entries deleted.
+    """
+    candidates = set(candidates)
+    index = load_index(cache_dir)
+    for source, known in list(index["sources"].items()):
+        if not os.path.exists(source):
+            candidates |= set(known.get("entries", {}).values())
+            _remove(_index_path(source, cache_dir))
+            del index["sources"][source]
+    live = {e for known in index["sources"].values() for e in known.get("entries", {}).values()}
+    stale = sorted(candidates - live)
+    for entry in stale:
+        _remove(os.path.join(cache_dir, entry))
+    return stale
+
+
+def _record(path, sha256, variant, entry, cache_dir):
+    """Point the source's record at `entry` for this variant; delete entries nothing references any more."""
+    stat = os.stat(path)
+    source = os.path.abspath(path)
+    with _index_lock:
+        previous = load_source(source, cache_dir)
+        entries = dict(previous.get("entries", {})) if previous.get("sha256") == sha256 else {}
+        entries[variant] = entry
+        _save_source({"source": source, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256,
+                      "entries": entries}, cache_dir)
+        evict(previous.get("entries", {}).values(), cache_dir)
+
+
+def cached_table(path, parse, variant="", cache_dir=CACHE_DIR):
+    """
+    The Arrow table for `path`, parsed with `parse(path)` at most once per content hash
+    and `variant` (a name for the parse options). Returns a memory-mapped table.
+    """
+    with _path_lock(path):
+        known = load_source(path, cache_dir)
+        sha256 = content_hash(path, known)
+        entry = entry_name(path, sha256, variant)
+        entry_path = os.path.join(cache_dir, entry)
+        if os.path.exists(entry_path):
+            if known.get("sha256") != sha256 or known.get("entries", {}).get(variant) != entry:
+                _record(path, sha256, variant, entry, cache_dir)
+            try:
+                return _read_entry(entry_path)
+            except FileNotFoundError:
+                pass  # evicted with a deleted source of the same name and contents before we recorded it
+
+        table = parse(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = _tmp_name(entry_path)
+        # uncompressed, so readers can map the buffers as they are
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, entry_path)
+        _record(path, sha256, variant, entry, cache_dir)
+        return _read_entry(entry_path)
+
+
+def cached_batches(path, open_reader, variant="", cache_dir=CACHE_DIR):
+    """
+    Record batches of `path`, from the same entry as cached_table(). On a miss the batches
+    of `open_reader(path)` are streamed into a new entry while they are yielded; the entry
+    is only recorded once the reader is exhausted. Dictionary columns may grow from batch
+    to batch, as long as each batch's dictionary extends the previous one.
+    """
+    with _path_lock(path):
+        known = load_source(path, cache_dir)
+        sha256 = content_hash(path, known)
+        entry = entry_name(path, sha256, variant)
+        entry_path = os.path.join(cache_dir, entry)
+        table = None
+        if os.path.exists(entry_path):
+            if known.get("sha256") != sha256 or known.get("entries", {}).get(variant) != entry:
+                _record(path, sha256, variant, entry, cache_dir)
+            try:
+                table = _read_entry(entry_path)
+            except FileNotFoundError:
+                pass  # evicted with a deleted source of the same name and contents before we recorded it
+    if table is not None:
+        yield from table.to_batches()
+        return
+
+    # Not under the path lock while yielding: the consumer may read the same file meanwhile.
+    # Concurrent builders write their own temp files; whichever is renamed last wins.
+    reader = open_reader(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = _tmp_name(entry_path)
+    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    try:
+        with pa.ipc.new_file(tmp_path, reader.schema, options=options) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                yield batch
+    except BaseException:
+        _remove(tmp_path)  # including a consumer that stopped early (GeneratorExit)
+        raise
+    os.replace(tmp_path, entry_path)
+    with _path_lock(path):
+        _record(path, sha256, variant, entry, cache_dir)
+
+
+def clear(cache_dir=CACHE_DIR):
+    """Delete every cache entry (and leftover temp files) and the index files; returns the number of files removed."""
+    files = [path for pattern in ("*.arrow", "*.tmp", os.path.join(INDEX_DIR, "*.json*"))
+             for path in glob.glob(os.path.join(cache_dir, pattern))]
+    for path in files:
+        os.remove(path)
+    return len(files)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the parsed raw-CSV cache")
+    parser.add_argument("--warm", action="store_true", help="parse every raw table into the cache")
+    parser.add_argument("--clear", action="store_true", help="delete all cache entries")
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    args = parser.parse_args()
+
+    if args.clear:
+        print(f"  [OK] Removed {clear()} files from {CACHE_DIR}")
+    if args.warm:
+        from src.raw_reader import TABLES, cached_raw_table
+        for table_name in TABLES:
+            table = cached_raw_table(table_name, raw_dir=args.raw_dir)
+            print(f"  [OK] {table_name}: {table.num_rows:,} rows ({table.nbytes / 1e6:.1f} MB mapped)")
@@ -0,0 +1,372 @@
+"""
+Per-patient feature table for risk scoring.
+
+One row per patient in patients.csv. Visit features come from visits joined
+to doctors (for the hospital); lab features come from lab reports joined to
+visits (for the patient):
+
+    total_visits, first_visit_date, last_visit_date
+    visits_90d, visits_365d      visits in the 90 / 365 days up to and including the latest visit
+    max_visits_90d               busiest 90-day window in the patient's history
+    avg_days_between_visits, max_days_between_visits
+    distinct_doctors, distinct_hospitals
+    total_lab_reports, abnormal_lab_share
+    abnormal_share_<test_type>   share of that test's results other than "Normal"
+    age_years, days_since_last_visit, visits_per_year      as of `as_of`
+
+The rolling counts and gaps are window computations over each patient's
+visits ordered by date. src/pyspark_features.py runs them as
+Window.partitionBy("patient_id").orderBy(day) with rangeBetween() and lag().
+The local backend gets the same results from sorted integer keys: a date
+range frame is a binary search, and lag() is a shifted array. Neither
+backend uses per-row Python. Visits without a valid date are left out of
+the visit features.
+
+`as_of` defaults to the latest visit date in the data, so rebuilding the
+same inputs gives the same table. Only the last three columns depend on it.
+
+The output goes to data/features/patient_features/ as Parquet (part files
+plus _SUCCESS), the layout read by src/processed_reader.py.
+
+Incremental mode reads only the rows appended to the raw files since the
+last run. The byte offset and sha256 of each file as last read are kept in
+data/state/features_state.json. It recomputes the patients those rows touch:
+- patients with new visits;
+- patients whose visits got new lab reports;
+- new patients;
+- patients with visits to newly added doctors.
+It then refreshes the as-of columns for everyone. A raw file that was
+rewritten rather than appended to (an edit anywhere before the saved offset,
+see incremental_ingest.appended_since) triggers a full rebuild.
+
+    python -m src.patient_features                    # full build
+    python -m src.patient_features --incremental
+    python -m src.patient_features --backend spark --as-of 2025-12-31
+"""
+import os
+import re
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from src.id_codec import ID_PREFIXES, INVALID_ID, decode_ids, encode_ids
+from src.incremental_ingest import appended_since, file_position, read_delta
+from src.instrumentation import step
+from src.local_transform import write_output
+from src.processed_reader import read_processed
+from src.raw_reader import read_table
+from src.transform_backend import BACKENDS, choose_backend
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+FEATURES_DIR = os.path.join(BASE_DIR, "data", "features")
+STATE_FILE = os.path.join(BASE_DIR, "data", "state", "features_state.json")
+OUTPUT_NAME = "patient_features"
+
+# Rolling windows: feature -> days, counted as a RANGE frame of (days - 1) preceding days through today
+WINDOWS = {"visits_90d": 90, "visits_365d": 365}
+NORMAL_RESULT = "Normal"
+SOURCES = {"patients": "patients.csv", "doctors": "doctors.csv", "visits": "visits.csv",
+           "lab_reports": "lab_reports.csv"}
+
+VISIT_COLUMNS = ["total_visits", "first_visit_date", "last_visit_date", "visits_90d", "visits_365d",
+                 "max_visits_90d", "avg_days_between_visits", "max_days_between_visits",
+                 "distinct_doctors", "distinct_hospitals"]
+LAB_COLUMNS = ["total_lab_reports", "abnormal_lab_share"]
+AS_OF_COLUMNS = ["age_years", "days_since_last_visit", "visits_per_year"]
+# Counts that are 0, not missing, for a patient without visits or lab reports
+COUNT_COLUMNS = ["total_visits", "visits_90d", "visits_365d", "max_visits_90d", "distinct_doctors",
+                 "distinct_hospitals", "total_lab_reports"]
+
+
+def test_type_column(test_type):
+    """abnormal_share_<test type> column name, e.g. "X-Ray" -> abnormal_share_x_ray."""
+    return "abnormal_share_" + re.sub(r"[^0-9a-z]+", "_", str(test_type).lower()).strip("_")
+
+
+def _lookup(df, key):
+    """One row per valid key, so malformed or duplicate IDs cannot multiply rows in a join."""
+    return df[df[key] != INVALID_ID].drop_duplicates(key)
+
+
+# ---------- Local (vectorized) backend ----------
+
+def visit_features(visits, doctors):
+    """Visit features per patient code (index) from typed visits and doctors."""
+    visits = visits[(visits["patient_id"] != INVALID_ID) & visits["visit_date"].notna()]
+    visits = visits.merge(_lookup(doctors, "doctor_id")[["doctor_id", "hospital"]], on="doctor_id", how="left")
+    if visits.empty:
+        return pd.DataFrame(columns=VISIT_COLUMNS, index=pd.Index([], name="patient_id"))
+
+    day = visits["visit_date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    patient = visits["patient_id"].to_numpy()
+    order = np.lexsort((day, patient))
+    day, patient = day[order], patient[order]
+    visits = visits.iloc[order].reset_index(drop=True)
+
+    # Dense patient ordinal x day as one sorted key: a patient's visits are contiguous and ordered
+    # by day, so the frame "day - (n - 1) .. day" is the key range found by two binary searches
+    new_patient = np.r_[True, patient[1:] != patient[:-1]]
+    ordinal = np.cumsum(new_patient) - 1
+    key = ordinal * (day.max() - day.min() + max(WINDOWS.values()) + 1) + (day - day.min())
+    end = np.searchsorted(key, key, side="right")  # a RANGE frame includes same-day peers
+    frame = pd.DataFrame({
+        "patient_id": patient,
+        "day": day,
+        # lag(day) over the patient's visits; the first visit has no gap
+        "gap": np.where(new_patient, np.nan, day - np.r_[day[0], day[:-1]]),
+        "doctor_id": visits["doctor_id"].where(visits["doctor_id"] != INVALID_ID),
+        "hospital": visits["hospital"],
+        **{name: end - np.searchsorted(key, key - (days - 1), side="left") for name, days in WINDOWS.items()},
+    })
+
+    groups = frame.groupby("patient_id", sort=False)
+    features = groups.agg(
+        total_visits=("day", "size"),
+        first_day=("day", "min"),
+        last_day=("day", "max"),
+        max_visits_90d=("visits_90d", "max"),
+        max_days_between_visits=("gap", "max"),
+        distinct_doctors=("doctor_id", "nunique"),
+        distinct_hospitals=("hospital", "nunique"),
+    )
+    # The last row of each patient is on their latest day (same-day visits share its window counts)
+    latest = frame.loc[np.r_[new_patient[1:], True], ["patient_id", *WINDOWS]].set_index("patient_id")
+    features = features.join(latest)
+    span = features["last_day"] - features["first_day"]
+    # The mean of consecutive gaps telescopes to the first-to-last span over (visits - 1)
+    features["avg_days_between_visits"] = (span / (features["total_visits"] - 1)).where(features["total_visits"] > 1)
+    features["first_visit_date"] = features["first_day"].to_numpy().astype("datetime64[D]").astype("datetime64[s]")
+    features["last_visit_date"] = features["last_day"].to_numpy().astype("datetime64[D]").astype("datetime64[s]")
+    return features[VISIT_COLUMNS]
+
+
+def lab_features(lab_reports, visits):
+    """Lab features per patient code (index): totals, overall and per-test-type abnormal shares."""
+    labs = lab_reports.merge(_lookup(visits, "visit_id")[["visit_id", "patient_id"]], on="visit_id", how="inner")
+    labs = labs[labs["patient_id"] != INVALID_ID]
+    has_result = labs["result"].notna()
+    frame = pd.DataFrame({"patient_id": labs["patient_id"], "test_type": labs["test_type"],
+                          "has_result": has_result, "abnormal": has_result & (labs["result"] != NORMAL_RESULT)})
+
+    groups = frame.groupby("patient_id")
+    counts = groups[["abnormal", "has_result"]].sum()
+    features = pd.DataFrame({"total_lab_reports": groups.size(),
+                             "abnormal_lab_share": counts["abnormal"] / counts["has_result"]})
+    per_test = frame.groupby(["patient_id", "test_type"], observed=True)[["abnormal", "has_result"]].sum()
+    shares = (per_test["abnormal"] / per_test["has_result"]).unstack("test_type")
+    shares = shares[sorted(shares.columns)]
+    shares.columns = [test_type_column(c) for c in shares.columns]
+    return features.join(shares)
+
+
+def add_as_of_features(features, dob, as_of):
+    """Set age_years, days_since_last_visit and visits_per_year as of `as_of` (dob aligned to the rows)."""
+    as_of = pd.Timestamp(as_of)
+    dob = pd.to_datetime(pd.Series(dob, index=features.index))
+    before_birthday = (dob.dt.month > as_of.month) | ((dob.dt.month == as_of.month) & (dob.dt.day > as_of.day))
+    features["age_years"] = (as_of.year - dob.dt.year - before_birthday.astype(int)).astype("Int64")
+    features["days_since_last_visit"] = (as_of - features["last_visit_date"]).dt.days.astype("Int64")
+    tenure = (as_of - features["first_visit_date"]).dt.days + 1
+    features["visits_per_year"] = features["total_visits"] / tenure * 365.25
+    return features
+
+
+def build_features(patients, doctors, visits, lab_reports):
+    """Feature table (as-of columns not yet set) for every valid patient in `patients`, by patient code."""
+    features = (_lookup(patients, "patient_id")[["patient_id"]].set_index("patient_id")
+                .join(visit_features(visits, doctors)).join(lab_features(lab_reports, visits)))
+    for column in COUNT_COLUMNS:
+        features[column] = features[column].fillna(0).astype(np.int64)
+    for column in ("first_visit_date", "last_visit_date"):
+        features[column] = pd.to_datetime(features[column])
+    return features
+
+
+def finalize(features, patients, as_of):
+    """Add the as-of columns and put the columns in their output order, with patient_id first."""
+    dob = _lookup(patients, "patient_id").set_index("patient_id")["dob"].reindex(features.index)
+    features = add_as_of_features(features, dob, as_of)
+    shares = sorted(c for c in features.columns if c.startswith("abnormal_share_"))
+    features = features[VISIT_COLUMNS + LAB_COLUMNS + shares + AS_OF_COLUMNS].sort_index()
+    return features.reset_index()
+
+
+def read_inputs(raw_dir=RAW_DIR):
+    """Typed reads of the columns the features use (src/raw_reader.py)."""
+    return (read_table("patients", columns=["patient_id", "dob"], raw_dir=raw_dir),
+            read_table("doctors", columns=["doctor_id", "hospital"], raw_dir=raw_dir),
+            read_table("visits", columns=["visit_id", "patient_id", "doctor_id", "visit_date"], raw_dir=raw_dir),
+            read_table("lab_reports", columns=["visit_id", "test_type", "result"], raw_dir=raw_dir))
+
+
+def default_as_of(visits):
+    latest = visits["visit_date"].max()
+    return latest if pd.notna(latest) else pd.Timestamp.today().normalize()
+
+
+def local_features(inputs, as_of, patient_codes=None):
+    """Features of all patients, or of `patient_codes` only, with the local backend."""
+    patients, doctors, visits, lab_reports = inputs
+    if patient_codes is not None:
+        patients = patients[patients["patient_id"].isin(patient_codes)]
+        visits = visits[visits["patient_id"].isin(patient_codes)]
+        lab_reports = lab_reports[lab_reports["visit_id"].isin(visits["visit_id"])]
+    return finalize(build_features(patients, doctors, visits, lab_reports), patients, as_of)
+
+
+def spark_features(raw_dir, as_of, patient_codes=None):
+    """Features of all patients, or of `patient_codes` only, computed on Spark and collected."""
+    from src.pyspark_features import spark_patient_features
+    from src.pyspark_transform import build_spark_session
+    spark = build_spark_session()
+    spark.sparkContext.setLogLevel("WARN")
+    patient_ids = None
+    if patient_codes is not None:
+        patient_ids = decode_ids(np.asarray(list(patient_codes), dtype=np.int64), ID_PREFIXES["patient_id"]).tolist()
+    try:
+        # one row per patient, so collecting the result is cheap next to the windows over the visits
+        features = spark_patient_features(spark, raw_dir, as_of, patient_ids).toPandas()
+    finally:
+        spark.stop()
+    features["patient_id"] = encode_ids(features["patient_id"], ID_PREFIXES["patient_id"])
+    for column in ("first_visit_date", "last_visit_date"):
+        features[column] = pd.to_datetime(features[column])
+    for column in ("age_years", "days_since_last_visit"):
+        features[column] = features[column].astype("Int64")
+    return features.sort_values("patient_id", ignore_index=True)
+
+
+# ---------- Incremental state ----------
+
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _positions(raw_dir):
+    return {source: file_position(os.path.join(raw_dir, file_name)) for source, file_name in SOURCES.items()}
+
+
+def _delta(raw_dir, source, offset, columns):
+    chunks = [chunk[columns] for chunk in read_delta(os.path.join(raw_dir, SOURCES[source]), offset)]
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+
+def appended_patients(state, raw_dir, visits):
+    """
+    (patient codes touched by the rows appended since `state`, latest new visit date),
+    or None when a raw file was rewritten rather than appended to.
+    """
+    offsets = state["offsets"]
+    for source, file_name in SOURCES.items():
+        if source not in offsets or not appended_since(os.path.join(raw_dir, file_name), offsets[source]):
+            return None
+
+    new_patients = _delta(raw_dir, "patients", offsets["patients"]["offset"], ["patient_id"])
+    new_doctors = _delta(raw_dir, "doctors", offsets["doctors"]["offset"], ["doctor_id"])
+    new_visits = _delta(raw_dir, "visits", offsets["visits"]["offset"], ["patient_id", "visit_date"])
+    new_labs = _delta(raw_dir, "lab_reports", offsets["lab_reports"]["offset"], ["visit_id"])
+
+    codes = [encode_ids(new_patients["patient_id"], ID_PREFIXES["patient_id"]),
+             encode_ids(new_visits["patient_id"], ID_PREFIXES["patient_id"])]
+    doctor_codes = encode_ids(new_doctors["doctor_id"], ID_PREFIXES["doctor_id"])
+    codes.append(visits.loc[visits["doctor_id"].isin(doctor_codes), "patient_id"].to_numpy())
+    lab_visits = encode_ids(new_labs["visit_id"], ID_PREFIXES["visit_id"])
+    codes.append(visits.loc[visits["visit_id"].isin(lab_visits), "patient_id"].to_numpy())
+    touched = np.unique(np.concatenate(codes))
+    latest = pd.to_datetime(new_visits["visit_date"], format="%Y-%m-%d", errors="coerce").max()
+    return set(touched[touched != INVALID_ID].tolist()), latest
+
+
+# ---------- Build ----------
+
+def generate(incremental=False, backend=None, as_of=None, raw_dir=RAW_DIR, features_dir=FEATURES_DIR,
+             state_file=STATE_FILE):
+    """
+    Build data/features/patient_features/. With incremental=True, recompute only the
+    patients touched by rows appended since the last run (a full build when there is
+    no usable state). Returns the number of patients recomputed.
+    """
+    backend = choose_backend(backend, raw_dir)
+    print(f"Building patient features ({backend})...")
+    inputs = read_inputs(raw_dir)
+    patients, visits = inputs[0], inputs[2]
+    state = load_state(state_file) if incremental else None
+    output_path = os.path.join(features_dir, OUTPUT_NAME)
+
+    touched = None
+    if state and os.path.exists(os.path.join(output_path, "_SUCCESS")):
+        with step("features:delta"):
+            touched = appended_patients(state, raw_dir, visits)
+        if touched is None:
+            print("  [INFO] A raw file was rewritten - rebuilding all patient features")
+
+    if touched is None:
+        as_of = pd.Timestamp(as_of) if as_of is not None else default_as_of(visits)
+        with step("features:compute", rows_in=len(visits), backend=backend) as s:
+            if backend == "local":
+                features = local_features(inputs, as_of)
+            else:
+                features = spark_features(raw_dir, as_of)
+            s.rows_out = recomputed = len(features)
+    else:
+        codes, latest = touched
+        if as_of is not None:
+            as_of = pd.Timestamp(as_of)
+        else:
+            # the same as_of a full rebuild would pick: the latest visit date seen so far
+            as_of = pd.Timestamp(state["as_of"])
+            if pd.notna(latest):
+                as_of = max(as_of, latest)
+        with step("features:compute", rows_in=len(codes), backend=backend) as s:
+            if codes:
+                fresh = local_features(inputs, as_of, codes) if backend == "local" else \
+                    spark_features(raw_dir, as_of, codes)
+            else:
+                fresh = None
+            existing = read_processed(OUTPUT_NAME, processed_dir=features_dir)
+            existing["patient_id"] = encode_ids(existing["patient_id"], ID_PREFIXES["patient_id"])
+            existing = existing[~existing["patient_id"].isin(codes)]
+            merged = pd.concat([existing, fresh], ignore_index=True) if fresh is not None else existing
+            for column in ("first_visit_date", "last_visit_date"):
+                merged[column] = pd.to_datetime(merged[column])
+            # Everyone's as-of columns move with as_of, not just the recomputed patients'
+            features = finalize(merged.set_index("patient_id").drop(columns=AS_OF_COLUMNS), patients, as_of)
+            s.rows_out = recomputed = len(codes)
+
+    with step(f"write:{OUTPUT_NAME}", rows_in=len(features)):
+        write_output(features, OUTPUT_NAME, "parquet", features_dir)
+    save_state({"as_of": as_of.strftime("%Y-%m-%d"), "backend": backend, "offsets": _positions(raw_dir)},
+               state_file)
+    print(f"  [OK] Features for {len(features):,} patients ({recomputed:,} recomputed, as of "
+          f"{as_of:%Y-%m-%d}) written to {output_path}")
+    return recomputed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the per-patient feature table")
+    parser.add_argument("--incremental", action="store_true",
+                        help="recompute only patients touched by rows appended since the last run")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="spark, local (vectorized pandas) or auto (default: TRANSFORM_BACKEND)")
+    parser.add_argument("--as-of", default=None, help="reference date (default: latest visit date)")
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--features-dir", default=FEATURES_DIR)
+    args = parser.parse_args()
+    generate(args.incremental, args.backend, args.as_of, args.raw_dir, args.features_dir)
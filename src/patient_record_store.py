@@ -0,0 +1,148 @@
+"""
+Sharded patient record store for the Patient Portal and Doctor Lookup.
+
+Layout of dashboard/patient_records/:
+
+    manifest.json        shard scheme, counts and the index dictionaries (all either portal needs up front)
+    shard_<n>.json       {patient_id: record} for the patients in shard n
+    search_<b>.json      {trigram: [index rows]} posting lists, bucketed by trigram hash
+    index_<k>.json       columnar search-result rows (dictionary-encoded), a fixed number per page
+
+A patient's shard is computed from its ID alone (FNV-1a hash or numeric range),
+so a lookup fetches manifest.json plus one shard. Search fetches the few
+trigram buckets that the query touches and then only the index pages that
+hold the matching rows, so neither portal downloads a patient-sized file.
+dashboard/patient_store.js implements the same hashing on the client; both
+hash the UTF-8 bytes of the text.
+"""
+import os
+import json
+import glob
+
+import numpy as np
+import pandas as pd
+
+from src.id_codec import ID_PREFIXES, encode_ids
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STORE_DIR = os.path.join(BASE_DIR, "dashboard", "patient_records")
+
+NGRAM = 3
+SEARCH_FIELDS = ["patient_id", "name", "city"]
+DICTIONARY_FIELDS = ["gender", "city", "blood_group"]
+INDEX_COLUMNS = ["patient_id", "name", "gender", "city", "blood_group", "total_visits", "total_lab_reports"]
+
+
+def fnv1a(text):
+    """32-bit FNV-1a over the UTF-8 bytes of `text` (matches fnv1a() in patient_store.js)."""
+    h = 0x811C9DC5
+    for byte in text.encode("utf-8"):
+        h = ((h ^ byte) * 16777619) & 0xFFFFFFFF
+    return h
+
+
+def shard_of(patient_id, shards):
+    """Shard number for one patient ID under the scheme described by `shards`."""
+    if shards["scheme"] == "range":
+        return int(patient_id[len(ID_PREFIXES["patient_id"]):]) // shards["size"]
+    return fnv1a(patient_id) % shards["count"]
+
+
+def assign_shards(patient_ids, records_per_shard=500, scheme="hash"):
+    """Return (shard number per patient, shard description for the manifest)."""
+    n = len(patient_ids)
+    if scheme == "range":
+        codes = encode_ids(patient_ids, ID_PREFIXES["patient_id"])
+        if (codes < 0).any():
+            raise ValueError("Range sharding needs numeric patient IDs; use scheme='hash'")
+        shards = {"scheme": "range", "size": records_per_shard}
+        return codes // records_per_shard, shards
+
+    shards = {"scheme": "hash", "count": max(1, -(-n // records_per_shard))}
+    return np.array([fnv1a(pid) % shards["count"] for pid in patient_ids], dtype=np.int64), shards
+
+
+def build_search_index(index_df, buckets):
+    """
+    Build trigram posting lists over SEARCH_FIELDS (lower-cased, per field).
+    Returns {bucket: {trigram: sorted row numbers}}.
+    """
+    parts = []
+    for field in SEARCH_FIELDS:
+        text = index_df[field].astype("string").str.lower().fillna("")
+        rows = np.arange(len(text))
+        longest = text.str.len().max()  # NA when there are no patients
+        for offset in range((int(longest) if pd.notna(longest) else 0) - NGRAM + 1):
+            grams = text.str.slice(offset, offset + NGRAM)
+            keep = (grams.str.len() == NGRAM).to_numpy(dtype=bool)
+            parts.append(pd.DataFrame({"gram": grams[keep].to_numpy(dtype=object), "row": rows[keep]}))
+    if not parts:
+        return {}
+
+    postings = pd.concat(parts, ignore_index=True).drop_duplicates().sort_values(["gram", "row"])
+    result = {}
+    for gram, group_rows in postings.groupby("gram", sort=False)["row"]:
+        result.setdefault(fnv1a(gram) % buckets, {})[gram] = group_rows.tolist()
+    return result
+
+
+def write_store(records, patient_index, store_dir=STORE_DIR, records_per_shard=500, scheme="hash",
+                search_buckets=64, index_rows_per_file=2000):
+    """Write records and index in the sharded layout, replacing any previous store."""
+    os.makedirs(store_dir, exist_ok=True)
+    for pattern in ["shard_*.json", "search_*.json", "index*.json"]:
+        for stale in glob.glob(os.path.join(store_dir, pattern)):
+            os.remove(stale)
+
+    index_df = pd.DataFrame(patient_index, columns=INDEX_COLUMNS)
+    shard_numbers, shards = assign_shards(index_df["patient_id"].tolist(), records_per_shard, scheme)
+    index_df["shard"] = shard_numbers
+
+    by_shard = {}
+    for pid, shard in zip(index_df["patient_id"].tolist(), shard_numbers.tolist()):
+        by_shard.setdefault(shard, {})[pid] = records[pid]
+    for shard, shard_records in by_shard.items():
+        with open(os.path.join(store_dir, f"shard_{shard}.json"), "w") as f:
+            json.dump(shard_records, f, separators=(",", ":"), default=str)
+
+    for bucket, postings in build_search_index(index_df, search_buckets).items():
+        with open(os.path.join(store_dir, f"search_{bucket}.json"), "w") as f:
+            json.dump(postings, f, separators=(",", ":"))
+
+    columns, dictionaries = {}, {}
+    for column in index_df.columns:
+        if column in DICTIONARY_FIELDS:
+            codes, uniques = pd.factorize(index_df[column])
+            columns[column] = codes.tolist()
+            dictionaries[column] = [str(u) for u in uniques]
+        else:
+            columns[column] = index_df[column].tolist()
+
+    pages = -(-len(index_df) // index_rows_per_file)
+    for page in range(pages):
+        rows = slice(page * index_rows_per_file, (page + 1) * index_rows_per_file)
+        with open(os.path.join(store_dir, f"index_{page}.json"), "w") as f:
+            json.dump({column: values[rows] for column, values in columns.items()}, f,
+                      separators=(",", ":"), default=str)
+
+    manifest = {
+        "total_patients": len(index_df),
+        "shards": shards,
+        "shard_files": len(by_shard),
+        "search": {"ngram": NGRAM, "buckets": search_buckets, "fields": SEARCH_FIELDS},
+        "index": {"rows_per_file": index_rows_per_file, "files": pages, "dictionaries": dictionaries},
+    }
+    with open(os.path.join(store_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_record(patient_id, store_dir=STORE_DIR):
+    """Fetch one patient record by reading the manifest and a single shard."""
+    with open(os.path.join(store_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    path = os.path.join(store_dir, f"shard_{shard_of(patient_id, manifest['shards'])}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(patient_id)
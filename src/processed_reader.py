@@ -0,0 +1,101 @@
+"""
+Shared reader for everything under data/processed/.
+
+Each output folder may hold Spark CSV part files, a (hive-partitioned)
+Parquet dataset, or Arrow IPC/Feather files. read_processed() reads all part
+files of whichever format it finds, reads only the requested `columns`, and
+applies `filters` as predicates: for Parquet they prune partitions and row
+groups before any data is decoded. Arrow IPC files are memory-mapped, so
+reading them is zero-copy. CSV columns are read with fixed types (the
+aggregation counts in CSV_INT_COLUMNS as integers, everything else as
+strings, with raw_reader's null markers) rather than inferred from the data,
+so every part file gets the same schema and an ID or date that happens to
+look like a number is not converted.
+
+    read_processed("visits_powerbi", columns=["visit_id", "reason"],
+                   filters=[("visit_year", "=", 2024), ("visit_month", "in", [1, 2, 3])])
+"""
+import os
+import csv
+import glob
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.raw_reader import NA_VALUES
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
+
+ARROW_EXTENSIONS = ("*.arrow", "*.feather", "*.ipc")
+# Count columns of the transform outputs; every other CSV column is read as a string
+CSV_INT_COLUMNS = ["total_visits", "unique_patients", "active_doctors", "patient_count", "report_count"]
+
+
+def detect_format(path):
+    """Return "parquet", "arrow" or "csv" for a processed output folder, or None if it is empty."""
+    if glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True):
+        return "parquet"
+    if any(glob.glob(os.path.join(path, "**", ext), recursive=True) for ext in ARROW_EXTENSIONS):
+        return "arrow"
+    if glob.glob(os.path.join(path, "part-*.csv")) or glob.glob(os.path.join(path, "*.csv")):
+        return "csv"
+    return None
+
+
+def _filter_expression(filters):
+    if not filters:
+        return None
+    if isinstance(filters, ds.Expression):
+        return filters
+    return pq.filters_to_expression(filters)
+
+
+def _read_arrow(path, columns, expression):
+    tables = []
+    for ext in ARROW_EXTENSIONS:
+        for file_path in sorted(glob.glob(os.path.join(path, "**", ext), recursive=True)):
+            # The table's buffers keep the mapping alive; nothing is copied into memory
+            tables.append(pa.ipc.open_file(pa.memory_map(file_path, "r")).read_all())
+    table = pa.concat_tables(tables, promote_options="default") if len(tables) > 1 else tables[0]
+    if expression is not None:
+        table = table.filter(expression)
+    return table.select(columns) if columns else table
+
+
+def _csv_format(first_file):
+    with open(first_file, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    column_types = {c: pa.int64() if c in CSV_INT_COLUMNS else pa.string() for c in header}
+    return ds.CsvFileFormat(convert_options=pv.ConvertOptions(
+        column_types=column_types, strings_can_be_null=True, null_values=NA_VALUES))
+
+
+def read_processed_table(name, columns=None, filters=None, processed_dir=PROCESSED_DIR):
+    """Read a processed output folder as a pyarrow Table (all part files)."""
+    path = os.path.join(processed_dir, name)
+    fmt = detect_format(path)
+    expression = _filter_expression(filters)
+
+    if fmt is None:
+        return None
+    if fmt == "arrow":
+        return _read_arrow(path, columns, expression)
+
+    if fmt == "parquet":
+        dataset = ds.dataset(path, format="parquet", partitioning="hive", exclude_invalid_files=True)
+    else:
+        files = sorted(glob.glob(os.path.join(path, "part-*.csv"))) or sorted(glob.glob(os.path.join(path, "*.csv")))
+        dataset = ds.dataset(files, format=_csv_format(files[0]))
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def read_processed(name, columns=None, filters=None, processed_dir=PROCESSED_DIR):
+    """Read a processed output folder into pandas; returns an empty DataFrame if it does not exist."""
+    table = read_processed_table(name, columns, filters, processed_dir)
+    if table is None:
+        return pd.DataFrame(columns=columns or [])
+    return table.to_pandas()
@@ -0,0 +1,124 @@
+"""
+Spark backend for src/patient_features.py.
+
+The same feature table as the local backend, built with window functions:
+
+    by_day = Window.partitionBy("patient_id").orderBy("day")
+    visits_90d  = count(*) over by_day.rangeBetween(-89, 0)
+    visits_365d = count(*) over by_day.rangeBetween(-364, 0)
+    gap         = day - lag(day) over by_day
+
+The window values come from the patient's latest visit day. max_visits_90d
+and max_days_between_visits are the maxima over all visits. Lab reports are
+joined to their visit for the patient, and the per-test-type abnormal shares
+are a pivot over the test types in the data. IDs are validated as
+src/id_codec.py does, so a malformed ID is dropped rather than counted as a
+patient, doctor or visit.
+
+pyspark is only imported when this backend is chosen.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from pyspark.sql import Window
+from pyspark.sql import functions as F
+from pyspark.sql.functions import broadcast, col
+
+from src.id_codec import ID_PREFIXES, MAX_DIGITS
+from src.models import Doctor, LabReport, Patient, Visit
+from src.patient_features import (AS_OF_COLUMNS, COUNT_COLUMNS, LAB_COLUMNS, NORMAL_RESULT, VISIT_COLUMNS,
+                                  WINDOWS, test_type_column)
+from src.pyspark_transform import schema_from_model
+
+
+def _valid_id(name):
+    """The ID, or null where id_codec would encode it as INVALID_ID (P0042, p42, ...)."""
+    prefix = ID_PREFIXES[name]
+    return F.when(col(name).rlike(f"^{prefix}(0|[1-9][0-9]{{0,{MAX_DIGITS - 1}}})$"), col(name))
+
+
+def _share(abnormal, with_result):
+    # null rather than a division by zero when no report has a result (ANSI mode raises on x / 0)
+    return F.when(with_result > 0, abnormal / with_result)
+
+
+def spark_patient_features(spark, raw_dir, as_of, patient_ids=None):
+    """Feature DataFrame for every patient, or for `patient_ids` (prefixed strings) only."""
+
+    def read_csv(file_name, model, columns):
+        df = spark.read.csv(os.path.join(raw_dir, file_name), header=True, schema=schema_from_model(model))
+        return df.select(*[_valid_id(c).alias(c) if c in ID_PREFIXES else col(c) for c in columns])
+
+    patients = read_csv("patients.csv", Patient, ["patient_id", "dob"]) \
+        .where(col("patient_id").isNotNull()).dropDuplicates(["patient_id"])
+    doctors = read_csv("doctors.csv", Doctor, ["doctor_id", "hospital"]) \
+        .where(col("doctor_id").isNotNull()).dropDuplicates(["doctor_id"])
+    visits = read_csv("visits.csv", Visit, ["visit_id", "patient_id", "doctor_id", "visit_date"])
+    lab_reports = read_csv("lab_reports.csv", LabReport, ["visit_id", "test_type", "result"])
+    if patient_ids is not None:
+        wanted = broadcast(spark.createDataFrame([(p,) for p in patient_ids], "patient_id string"))
+        patients = patients.join(wanted, "patient_id")
+        visits = visits.join(wanted, "patient_id")
+
+    # ---- Visit features: range windows over each patient's visits ordered by day ----
+    dated = visits.where(col("patient_id").isNotNull() & col("visit_date").isNotNull()) \
+        .join(broadcast(doctors), "doctor_id", "left") \
+        .withColumn("day", F.datediff(col("visit_date"), F.lit("1970-01-01").cast("date")))
+    by_day = Window.partitionBy("patient_id").orderBy("day")
+    for name, days in WINDOWS.items():
+        dated = dated.withColumn(name, F.count(F.lit(1)).over(by_day.rangeBetween(-(days - 1), 0)))
+    dated = dated \
+        .withColumn("gap", col("day") - F.lag("day").over(by_day)) \
+        .withColumn("last_day", F.max("day").over(Window.partitionBy("patient_id")))
+
+    def latest(name):
+        return F.max(F.when(col("day") == col("last_day"), col(name))).alias(name)
+
+    visit_features = dated.groupBy("patient_id").agg(
+        F.count(F.lit(1)).alias("total_visits"),
+        F.min("visit_date").alias("first_visit_date"),
+        F.max("visit_date").alias("last_visit_date"),
+        *[latest(name) for name in WINDOWS],
+        F.max("visits_90d").alias("max_visits_90d"),
+        F.max("gap").cast("double").alias("max_days_between_visits"),
+        F.countDistinct("doctor_id").alias("distinct_doctors"),
+        F.countDistinct("hospital").alias("distinct_hospitals"),
+    ).withColumn("avg_days_between_visits",
+                 F.when(col("total_visits") > 1, F.datediff("last_visit_date", "first_visit_date")
+                        / (col("total_visits") - 1)))
+
+    # ---- Lab features: reports joined to their visit's patient, then pivoted by test type ----
+    visit_owner = visits.where(col("visit_id").isNotNull()).dropDuplicates(["visit_id"]) \
+        .select("visit_id", "patient_id").where(col("patient_id").isNotNull())
+    labs = lab_reports.join(visit_owner, "visit_id") \
+        .withColumn("has_result", col("result").isNotNull().cast("int")) \
+        .withColumn("abnormal", (col("result").isNotNull() & (col("result") != NORMAL_RESULT)).cast("int")) \
+        .cache()
+    lab_features = labs.groupBy("patient_id").agg(
+        F.count(F.lit(1)).alias("total_lab_reports"),
+        _share(F.sum("abnormal"), F.sum("has_result")).alias("abnormal_lab_share"),
+    )
+    test_types = sorted(row[0] for row in labs.select("test_type").where(col("test_type").isNotNull())
+                        .distinct().collect())
+    per_test = labs.where(col("test_type").isNotNull()).groupBy("patient_id") \
+        .pivot("test_type", test_types).agg(_share(F.sum("abnormal"), F.sum("has_result"))) \
+        .select("patient_id", *[col(f"`{t}`").alias(test_type_column(t)) for t in test_types])
+
+    # ---- As-of features ----
+    as_of = F.lit(pd.Timestamp(as_of).date())
+    before_birthday = (F.month("dob") > F.month(as_of)) | \
+        ((F.month("dob") == F.month(as_of)) & (F.dayofmonth("dob") > F.dayofmonth(as_of)))
+    features = patients \
+        .join(visit_features, "patient_id", "left") \
+        .join(lab_features, "patient_id", "left") \
+        .join(per_test, "patient_id", "left") \
+        .fillna(0, subset=COUNT_COLUMNS) \
+        .withColumn("age_years", F.year(as_of) - F.year("dob") - before_birthday.cast("int")) \
+        .withColumn("days_since_last_visit", F.datediff(as_of, "last_visit_date")) \
+        .withColumn("visits_per_year",
+                    col("total_visits") / (F.datediff(as_of, "first_visit_date") + 1) * 365.25)
+    shares = [test_type_column(t) for t in test_types]
+    return features.select("patient_id", *VISIT_COLUMNS, *LAB_COLUMNS, *shares, *AS_OF_COLUMNS)
@@ -1,41 +1,132 @@
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, count, countDistinct
+from pyspark.sql.functions import col, count, countDistinct, broadcast, year, month
+from pyspark.sql.types import StructType, StructField, StringType, DateType, IntegerType
+from sqlalchemy import Date, Integer
 import os
 
-# Set HADOOP_HOME for Windows (winutils.exe)
+from src.config import SPARK_CONFIG
+from src.instrumentation import spark_step
+from src.models import Patient, Doctor, Visit, LabReport
+
 _BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 _HADOOP_HOME = os.path.join(_BASE, "hadoop")
-os.environ["HADOOP_HOME"] = _HADOOP_HOME
-os.environ["PATH"] = os.path.join(_HADOOP_HOME, "bin") + ";" + os.environ.get("PATH", "")
 
 
-def run_spark_transform():
+def configure_hadoop_home():
+    """Set HADOOP_HOME for Windows (winutils.exe); done when a session is built, not at import."""
+    if os.environ.get("HADOOP_HOME") == _HADOOP_HOME:
+        return
+    os.environ["HADOOP_HOME"] = _HADOOP_HOME
+    os.environ["PATH"] = os.path.join(_HADOOP_HOME, "bin") + os.pathsep + os.environ.get("PATH", "")
+
+
+def schema_from_model(model):
+    """Build a Spark StructType from a SQLAlchemy model (column order = CSV column order)."""
+    fields = []
+    for column in model.__table__.columns:
+        if isinstance(column.type, Date):
+            spark_type = DateType()
+        elif isinstance(column.type, Integer):
+            spark_type = IntegerType()
+        else:
+            spark_type = StringType()
+        fields.append(StructField(column.name, spark_type, nullable=not column.primary_key))
+    return StructType(fields)
+
+
+def build_spark_session(tuned=True, shuffle_partitions=None):
+    """Create the local SparkSession; the tuned mode enables AQE and sizes shuffles to the cores."""
+    configure_hadoop_home()
+    builder = SparkSession.builder \
+        .appName("Healthcare Analytics") \
+        .master("local[*]")
+
+    if tuned:
+        shuffle_partitions = shuffle_partitions or SPARK_CONFIG["shuffle_partitions"] or 2 * (os.cpu_count() or 1)
+        builder = builder \
+            .config("spark.sql.adaptive.enabled", "true") \
+            .config("spark.sql.adaptive.coalescePartitions.enabled", "true") \
+            .config("spark.sql.adaptive.skewJoin.enabled", "true") \
+            .config("spark.sql.shuffle.partitions", str(shuffle_partitions)) \
+            .config("spark.sql.autoBroadcastJoinThreshold", str(SPARK_CONFIG["broadcast_threshold"]))
+
+    return builder.getOrCreate()
+
+
+# Partition keys used for the Power BI exports when writing Parquet
+PARQUET_PARTITIONS = {
+    "visits_powerbi": {"visit_year": ("visit_date", year), "visit_month": ("visit_date", month)},
+    "lab_reports_powerbi": {"report_year": ("report_date", year), "report_month": ("report_date", month)},
+}
+
+
+def run_spark_transform(tuned=None, shuffle_partitions=None, output_format=None, raw_dir=None, processed_dir=None):
     """
     PySpark transformation layer:
     - Reads raw CSVs
     - Performs aggregations and feature engineering
     - Writes processed data for analytics / Power BI
+
+    The tuned mode (default, see SPARK_CONFIG) reads with explicit schemas from
+    src/models.py instead of inferSchema, caches the inputs that feed several
+    outputs, broadcasts the small doctors dimension, runs with adaptive query
+    execution and writes every output in parallel instead of through coalesce(1).
+
+    output_format="parquet" writes compressed Parquet instead of CSV, with the
+    visit and lab report exports partitioned by year/month (see
+    src/processed_reader.py for the matching reader).
+
+    raw_dir / processed_dir default to data/raw and data/processed.
     """
-    spark = SparkSession.builder \
-        .appName("Healthcare Analytics") \
-        .master("local[*]") \
-        .getOrCreate()
+    tuned = SPARK_CONFIG["tuned"] if tuned is None else tuned
+    output_format = output_format or SPARK_CONFIG["output_format"]
+    spark = build_spark_session(tuned, shuffle_partitions)
 
     # Set log level to reduce noise
     spark.sparkContext.setLogLevel("WARN")
 
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
-    PROCESSED_DIR = os.path.join(BASE_DIR, "data", "processed")
+    RAW_DIR = raw_dir or os.path.join(BASE_DIR, "data", "raw")
+    PROCESSED_DIR = processed_dir or os.path.join(BASE_DIR, "data", "processed")
 
     # Ensure processed directory exists
     os.makedirs(PROCESSED_DIR, exist_ok=True)
 
+    def read_csv(file_name, model):
+        path = os.path.join(RAW_DIR, file_name)
+        if tuned:
+            return spark.read.csv(path, header=True, schema=schema_from_model(model)).cache()
+        return spark.read.csv(path, header=True, inferSchema=True)
+
+    def write_output(df, folder_name):
+        # Transforms are lazy, so the write step covers computing the output too
+        with spark_step(spark, f"transform:{folder_name}", format=output_format):
+            _write(df, folder_name)
+
+    def _write(df, folder_name):
+        if not tuned:
+            df = df.coalesce(1)
+        path = os.path.join(PROCESSED_DIR, folder_name)
+        if output_format != "parquet":
+            df.write.csv(path, header=True, mode="overwrite")
+            return
+
+        partitions = PARQUET_PARTITIONS.get(folder_name, {})
+        for name, (source, fn) in partitions.items():
+            df = df.withColumn(name, fn(col(source)))
+        writer = df.write.mode("overwrite").option("compression", SPARK_CONFIG["parquet_compression"])
+        if partitions:
+            writer = writer.partitionBy(*partitions)
+        writer.parquet(path)
+
+    def dimension(df):
+        return broadcast(df) if tuned else df
+
     # ---- Read Raw Data ----
-    patients_df = spark.read.csv(os.path.join(RAW_DIR, "patients.csv"), header=True, inferSchema=True)
-    doctors_df = spark.read.csv(os.path.join(RAW_DIR, "doctors.csv"), header=True, inferSchema=True)
-    visits_df = spark.read.csv(os.path.join(RAW_DIR, "visits.csv"), header=True, inferSchema=True)
-    lab_reports_df = spark.read.csv(os.path.join(RAW_DIR, "lab_reports.csv"), header=True, inferSchema=True)
+    patients_df = read_csv("patients.csv", Patient)
+    doctors_df = read_csv("doctors.csv", Doctor)
+    visits_df = read_csv("visits.csv", Visit)
+    lab_reports_df = read_csv("lab_reports.csv", LabReport)
 
     # ---- Transform 1: Doctor Visit Summary ----
     doctor_summary = visits_df.groupBy("doctor_id") \
@@ -43,19 +134,15 @@ def run_spark_transform():
             count("visit_id").alias("total_visits"),
             countDistinct("patient_id").alias("unique_patients")
         )
-    doctor_summary = doctor_summary.join(doctors_df, on="doctor_id", how="left")
-    doctor_summary.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "doctor_summary"), header=True, mode="overwrite"
-    )
-    print("  [OK] Doctor Summary written to data/processed/doctor_summary/")
+    doctor_summary = doctor_summary.join(dimension(doctors_df), on="doctor_id", how="left")
+    write_output(doctor_summary, "doctor_summary")
+    print(f"  [OK] Doctor Summary written to {os.path.join(PROCESSED_DIR, 'doctor_summary')}/")
 
     # ---- Transform 2: City-wise Patient Distribution ----
     city_distribution = patients_df.groupBy("city") \
         .agg(count("patient_id").alias("patient_count"))
-    city_distribution.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "city_distribution"), header=True, mode="overwrite"
-    )
-    print("  [OK] City Distribution written to data/processed/city_distribution/")
+    write_output(city_distribution, "city_distribution")
+    print(f"  [OK] City Distribution written to {os.path.join(PROCESSED_DIR, 'city_distribution')}/")
 
     # ---- Transform 3: Visit Reason Analysis ----
     visit_reason_analysis = visits_df.groupBy("reason") \
@@ -63,46 +150,36 @@ def run_spark_transform():
             count("visit_id").alias("total_visits"),
             countDistinct("patient_id").alias("unique_patients")
         )
-    visit_reason_analysis.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "visit_reason_analysis"), header=True, mode="overwrite"
-    )
-    print("  [OK] Visit Reason Analysis written to data/processed/visit_reason_analysis/")
+    write_output(visit_reason_analysis, "visit_reason_analysis")
+    print(f"  [OK] Visit Reason Analysis written to {os.path.join(PROCESSED_DIR, 'visit_reason_analysis')}/")
 
     # ---- Transform 4: Lab Test Result Distribution ----
     lab_result_dist = lab_reports_df.groupBy("test_type", "result") \
         .agg(count("report_id").alias("report_count"))
-    lab_result_dist.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "lab_result_distribution"), header=True, mode="overwrite"
-    )
-    print("  [OK] Lab Result Distribution written to data/processed/lab_result_distribution/")
+    write_output(lab_result_dist, "lab_result_distribution")
+    print(f"  [OK] Lab Result Distribution written to {os.path.join(PROCESSED_DIR, 'lab_result_distribution')}/")
 
     # ---- Transform 5: Hospital-wise Visit Summary ----
-    hospital_visits = visits_df.join(doctors_df, on="doctor_id", how="left") \
+    hospital_visits = visits_df.join(dimension(doctors_df), on="doctor_id", how="left") \
         .groupBy("hospital") \
         .agg(
             count("visit_id").alias("total_visits"),
             countDistinct("patient_id").alias("unique_patients"),
             countDistinct("doctor_id").alias("active_doctors")
         )
-    hospital_visits.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "hospital_visits"), header=True, mode="overwrite"
-    )
-    print("  [OK] Hospital Visit Summary written to data/processed/hospital_visits/")
+    write_output(hospital_visits, "hospital_visits")
+    print(f"  [OK] Hospital Visit Summary written to {os.path.join(PROCESSED_DIR, 'hospital_visits')}/")
 
     # ---- Power BI Ready Exports ----
-    patients_df.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "patients_powerbi"), header=True, mode="overwrite"
-    )
-    doctors_df.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "doctors_powerbi"), header=True, mode="overwrite"
-    )
-    visits_df.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "visits_powerbi"), header=True, mode="overwrite"
-    )
-    lab_reports_df.coalesce(1).write.csv(
-        os.path.join(PROCESSED_DIR, "lab_reports_powerbi"), header=True, mode="overwrite"
-    )
-    print("  [OK] Power BI ready exports written to data/processed/")
+    write_output(patients_df, "patients_powerbi")
+    write_output(doctors_df, "doctors_powerbi")
+    write_output(visits_df, "visits_powerbi")
+    write_output(lab_reports_df, "lab_reports_powerbi")
+    print(f"  [OK] Power BI ready exports written to {PROCESSED_DIR}/")
+
+    if tuned:
+        for df in (patients_df, doctors_df, visits_df, lab_reports_df):
+            df.unpersist()
 
     spark.stop()
 
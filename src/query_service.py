@@ -0,0 +1,462 @@
+"""
+Async HTTP query service for the portal lookups.
+
+Serves the three stored procedures in sql/procedures.sql, plus patient search,
+as JSON over HTTP:
+
+    GET /patients/<patient_id>/history       -> GetPatientHistory
+    GET /patients/<patient_id>/lab-reports   -> GetPatientLabReports
+    GET /doctors/<doctor_id>/summary         -> GetDoctorSummary
+    GET /patients/search?q=<text>&limit=30   -> ID / name / city substring match
+    GET /metrics                             -> per-route latency percentiles
+    GET /health
+
+Two backends answer the queries: "mysql" calls the procedures on pooled
+connections (src/db_connection.py) from a thread pool, and "memory" answers
+from the raw CSVs, so the service runs without a database. Its per-patient
+lookups are slices of the CSR index in src/relation_index.py, memory-mapped
+from data/index/ (rebuilt there at startup when the raw files have changed);
+doctor summaries and search use small per-doctor and per-patient
+tables. Results are kept in an LRU cache with a TTL.
+
+    python -m src.query_service --backend memory --port 8765
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, unquote
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from src.config import QUERY_SERVICE_CONFIG, DB_POOL_CONFIG
+from src.relation_index import INDEX_DIR, open_index
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+
+BACKENDS = ["auto", "mysql", "memory"]
+MAX_ID_LENGTH = 20      # VARCHAR(20) procedure parameters
+DEFAULT_SEARCH_LIMIT = 30
+MAX_SEARCH_LIMIT = 200
+MAX_BODY_BYTES = 64 * 1024  # request bodies are read and discarded; larger ones are refused
+LATENCY_WINDOW = 10000  # samples kept per route for percentiles
+
+HISTORY_COLUMNS = ["name", "gender", "dob", "blood_group", "city", "visit_date", "reason", "visit_type",
+                   "doctor_name", "specialization", "hospital"]
+LAB_REPORT_COLUMNS = ["patient_name", "visit_date", "reason", "test_type", "result", "report_date"]
+SEARCH_COLUMNS = ["patient_id", "name", "gender", "city", "blood_group"]
+
+
+# ---------- Backends ----------
+
+class MemoryBackend:
+    """Answers the procedures from the CSR relation index and small tables built over the raw CSVs."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, raw_dir=RAW_DIR, index=None, index_dir=INDEX_DIR):
+        patients = pd.read_csv(os.path.join(raw_dir, "patients.csv"), dtype=str, keep_default_na=False)
+        doctors = pd.read_csv(os.path.join(raw_dir, "doctors.csv"), dtype=str, keep_default_na=False)
+        visits = pd.read_csv(os.path.join(raw_dir, "visits.csv"), dtype=str, keep_default_na=False,
+                             usecols=["visit_id", "patient_id", "doctor_id"])
+        # GetPatientHistory / GetPatientLabReports: one visit slice and one lab report slice per patient
+        self._index = index or open_index(raw_dir, index_dir)
+
+        doctor_columns = doctors.rename(columns={"name": "doctor_name"})
+
+        # GetDoctorSummary: doctors LEFT JOIN visits, one row per doctor
+        stats = visits.groupby("doctor_id").agg(total_visits=("visit_id", "count"),
+                                                 unique_patients=("patient_id", "nunique"))
+        summary = doctor_columns.set_index("doctor_id").join(stats).fillna({"total_visits": 0, "unique_patients": 0})
+        summary[["total_visits", "unique_patients"]] = summary[["total_visits", "unique_patients"]].astype(int)
+        self._doctors = {
+            doctor_id: row for doctor_id, row in zip(
+                summary.index,
+                summary[["doctor_name", "specialization", "hospital", "total_visits", "unique_patients"]]
+                .to_dict(orient="records"))
+        }
+
+        # Search: one lowercase "id|name|city" string per patient, scanned in file order
+        self._patients = patients[SEARCH_COLUMNS].to_dict(orient="records")
+        self._haystack = (patients["patient_id"] + "\0" + patients["name"] + "\0" + patients["city"]).str.lower().tolist()
+
+    def _patient(self, patient_id):
+        """(patient row, visit slice) for a known patient, else (None, None)."""
+        row = self._index.patient_row(patient_id)
+        return (row, slice(*self._index.visit_range(patient_id))) if row is not None else (None, None)
+
+    def patient_history(self, patient_id):
+        # patients JOIN visits JOIN doctors, newest visit first: visits of unknown doctors drop out
+        index = self._index
+        row, visits = self._patient(patient_id)
+        if row is None:
+            return []
+        patient = {"name": index.text("patients", "name", row), "gender": index.text("patients", "gender", row),
+                   "dob": index.dates("patients", "dob", row),
+                   "blood_group": index.text("patients", "blood_group", row),
+                   "city": index.text("patients", "city", row)}
+        out = []
+        for visit_date, reason, visit_type, doctor_code in zip(
+                index.dates("visits", "visit_date", visits), index.text("visits", "reason", visits),
+                index.text("visits", "visit_type", visits), index.arrays["visits.doctor_id"][visits].tolist()):
+            doctor = index.doctor_row(doctor_code)
+            if doctor is None:
+                continue
+            out.append({**patient, "visit_date": visit_date, "reason": reason, "visit_type": visit_type,
+                        "doctor_name": index.text("doctors", "name", doctor),
+                        "specialization": index.text("doctors", "specialization", doctor),
+                        "hospital": index.text("doctors", "hospital", doctor)})
+        return out
+
+    def patient_lab_reports(self, patient_id):
+        # patients JOIN visits JOIN lab_reports, newest report first
+        index = self._index
+        row, visits = self._patient(patient_id)
+        if row is None:
+            return []
+        name = index.text("patients", "name", row)
+        out = []
+        for position, visit_date, reason in zip(range(visits.start, visits.stop),
+                                                index.dates("visits", "visit_date", visits),
+                                                index.text("visits", "reason", visits)):
+            labs = slice(*index.lab_range(position))
+            for test_type, result, report_date in zip(index.text("lab_reports", "test_type", labs),
+                                                      index.text("lab_reports", "result", labs),
+                                                      index.dates("lab_reports", "report_date", labs)):
+                out.append({"patient_name": name, "visit_date": visit_date, "reason": reason,
+                            "test_type": test_type, "result": result, "report_date": report_date})
+        # stable, so reports on the same date keep newest-visit-first order; missing dates sort last
+        out.sort(key=lambda r: r["report_date"] or "", reverse=True)
+        return out
+
+    def doctor_summary(self, doctor_id):
+        row = self._doctors.get(doctor_id)
+        return [row] if row else []
+
+    def search_patients(self, query, limit):
+        query = query.lower()
+        out = []
+        for i, text in enumerate(self._haystack):
+            if query in text:
+                out.append(self._patients[i])
+                if len(out) >= limit:
+                    break
+        return out
+
+    def close(self):
+        pass
+
+
+class MySQLBackend:
+    """Calls the stored procedures on connections checked out from the shared pool."""
+
+    name = "mysql"
+    blocking = True
+
+    SEARCH_SQL = ("SELECT patient_id, name, gender, city, blood_group FROM patients "
+                  "WHERE patient_id LIKE %s OR name LIKE %s OR city LIKE %s "
+                  "ORDER BY patient_id LIMIT %s")
+
+    def __init__(self, pool=None):
+        from src.db_connection import get_pool
+        self.pool = pool or get_pool()
+
+    def _call(self, procedure, arg):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.callproc(procedure, (arg,))
+                rows = []
+                for result in cursor.stored_results():
+                    columns = result.column_names
+                    rows.extend(dict(zip(columns, values)) for values in result.fetchall())
+                return rows
+            finally:
+                cursor.close()
+
+    def patient_history(self, patient_id):
+        return self._call("GetPatientHistory", patient_id)
+
+    def patient_lab_reports(self, patient_id):
+        return self._call("GetPatientLabReports", patient_id)
+
+    def doctor_summary(self, doctor_id):
+        return self._call("GetDoctorSummary", doctor_id)
+
+    def search_patients(self, query, limit):
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.SEARCH_SQL, (pattern, pattern, pattern, limit))
+                columns = cursor.column_names
+                return [dict(zip(columns, values)) for values in cursor.fetchall()]
+            finally:
+                cursor.close()
+
+    def close(self):
+        pass
+
+
+def create_backend(backend=None, raw_dir=RAW_DIR, index_dir=INDEX_DIR):
+    """Build the named backend; "auto" uses MySQL when a pooled connection works, else the CSVs."""
+    backend = backend or QUERY_SERVICE_CONFIG["backend"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown query backend `{backend}`; expected one of {BACKENDS}")
+    if backend == "mysql":
+        return MySQLBackend()
+    if backend == "auto":
+        try:
+            mysql_backend = MySQLBackend()
+            with mysql_backend.pool.connection():
+                pass
+            return mysql_backend
+        except Exception as e:
+            print(f"  [WARN] MySQL unavailable ({e}); serving from CSVs in {raw_dir}")
+    return MemoryBackend(raw_dir, index_dir=index_dir)
+
+
+# ---------- Cache and metrics ----------
+
+class ResultCache:
+    """LRU cache whose entries also expire `ttl` seconds after they were stored."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LatencyMetrics:
+    """Per-route request counts and latency percentiles over the last LATENCY_WINDOW requests."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(lambda: {"requests": 0, "errors": 0, "cache_hits": 0})
+
+    def record(self, route, elapsed_ms, error=False, cache_hit=False):
+        self._samples[route].append(elapsed_ms)
+        counts = self._counts[route]
+        counts["requests"] += 1
+        counts["errors"] += int(error)
+        counts["cache_hits"] += int(cache_hit)
+
+    def snapshot(self):
+        out = {}
+        for route, samples in self._samples.items():
+            ordered = sorted(samples)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+            out[route] = {**self._counts[route], "p50_ms": pick(0.50), "p95_ms": pick(0.95),
+                          "p99_ms": pick(0.99), "max_ms": round(ordered[-1], 3)}
+        return out
+
+
+# ---------- HTTP service ----------
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Content Too Large",
+           500: "Internal Server Error"}
+
+
+class QueryService:
+    """Routes HTTP requests to backend queries, with caching and latency metrics."""
+
+    def __init__(self, backend, cache_size=None, cache_ttl=None, workers=None):
+        self.backend = backend
+        self.cache = ResultCache(QUERY_SERVICE_CONFIG["cache_size"] if cache_size is None else cache_size,
+                                 QUERY_SERVICE_CONFIG["cache_ttl"] if cache_ttl is None else cache_ttl)
+        self.metrics = LatencyMetrics()
+        # Blocking backends get one thread per pooled connection
+        self._executor = ThreadPoolExecutor(max_workers=workers or DB_POOL_CONFIG["size"]) if backend.blocking else None
+
+    @staticmethod
+    def _entity_id(value):
+        entity_id = unquote(value).strip().upper()
+        if not entity_id or len(entity_id) > MAX_ID_LENGTH:
+            raise HTTPError(400, "invalid id")
+        return entity_id
+
+    def route(self, path, params):
+        """Return (route name, backend method name, args) for a request path."""
+        parts = [p for p in path.split("/") if p]
+        if parts == ["patients", "search"]:
+            query = params.get("q", [""])[0].strip()
+            if not query:
+                raise HTTPError(400, "missing q")
+            try:
+                limit = int(params.get("limit", [DEFAULT_SEARCH_LIMIT])[0])
+            except ValueError:
+                raise HTTPError(400, "invalid limit")
+            return "search", "search_patients", (query, max(1, min(limit, MAX_SEARCH_LIMIT)))
+        if len(parts) == 3 and parts[0] == "patients" and parts[2] == "history":
+            return "patient_history", "patient_history", (self._entity_id(parts[1]),)
+        if len(parts) == 3 and parts[0] == "patients" and parts[2] == "lab-reports":
+            return "patient_lab_reports", "patient_lab_reports", (self._entity_id(parts[1]),)
+        if len(parts) == 3 and parts[0] == "doctors" and parts[2] == "summary":
+            return "doctor_summary", "doctor_summary", (self._entity_id(parts[1]),)
+        raise HTTPError(404, "not found")
+
+    async def query(self, method_name, args):
+        """Run a backend query through the cache; returns (rows, cache_hit)."""
+        key = (method_name,) + args
+        rows = self.cache.get(key)
+        if rows is not None:
+            return rows, True
+        method = getattr(self.backend, method_name)
+        if self._executor is not None:
+            rows = await asyncio.get_running_loop().run_in_executor(self._executor, method, *args)
+        else:
+            rows = method(*args)
+        self.cache.put(key, rows)
+        return rows, False
+
+    async def dispatch(self, method, target):
+        """Handle one request; returns (status, payload)."""
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok", "backend": self.backend.name}
+        if url.path == "/metrics":
+            return 200, {"backend": self.backend.name, "cache_entries": len(self.cache),
+                         "routes": self.metrics.snapshot()}
+
+        start = time.perf_counter()
+        route, cache_hit, error = "unknown", False, True
+        try:
+            if method != "GET":
+                raise HTTPError(405, "only GET is supported")
+            route, method_name, args = self.route(url.path, parse_qs(url.query))
+            rows, cache_hit = await self.query(method_name, args)
+            error = False
+            return 200, {"rows": rows, "count": len(rows)}
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            print(f"  [ERROR] {target}: {e}")
+            return 500, {"error": "query failed"}
+        finally:
+            self.metrics.record(route, (time.perf_counter() - start) * 1000, error, cache_hit)
+
+    @staticmethod
+    async def _discard_body(reader, headers):
+        """Read past a request's body so the next request starts on its own line; (status, error) if refused."""
+        if "transfer-encoding" in headers:
+            return 400, "chunked request bodies are not supported"
+        length = headers.get("content-length", "0")
+        if not (length.isascii() and length.isdigit()):
+            return 400, "invalid Content-Length"
+        if int(length) > MAX_BODY_BYTES:
+            return 413, "request body too large"
+        await reader.readexactly(int(length))
+        return None
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection (keep-alive unless the client closes)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode("latin-1").split()
+                refused = await self._discard_body(reader, headers) if len(parts) == 3 else None
+                if len(parts) != 3:
+                    status, payload, version = 400, {"error": "malformed request"}, "HTTP/1.0"
+                elif refused:
+                    # the unread body would be parsed as the next request, so the connection is closed
+                    status, payload, version = refused[0], {"error": refused[1]}, "HTTP/1.0"
+                else:
+                    method, target, version = parts
+                    status, payload = await self.dispatch(method, target)
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Access-Control-Allow-Origin: *\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=None, port=None):
+        host = host or QUERY_SERVICE_CONFIG["host"]
+        port = port or QUERY_SERVICE_CONFIG["port"]
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"  [OK] Query service ({self.backend.name} backend) listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.backend.close()
+
+
+def run_service(backend=None, host=None, port=None, raw_dir=RAW_DIR):
+    """Build the backend and serve until interrupted."""
+    service = QueryService(create_backend(backend, raw_dir))
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async HTTP query service for portal lookups")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="mysql, memory (CSV indexes) or auto (default: QUERY_SERVICE_BACKEND)")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+    run_service(args.backend, args.host, args.port)
@@ -0,0 +1,380 @@
+"""
+Precomputed patients -> visits -> lab reports index in CSR form.
+
+IDs are integer-encoded (src/id_codec.py) and numbered by rank: each table's
+distinct codes are saved sorted in a `*_keys` array, and an ID's ordinal is
+its position there (np.searchsorted), so sparse or far-out IDs cost one slot
+each. Ordinals index the `*_row` arrays, which give the row offset into that
+table's columnar attribute arrays.
+
+    visits are sorted by (patient, visit_date desc, file order)
+        patient_visit_indptr[p] : patient_visit_indptr[p + 1]  -> that patient's visits
+    lab reports are sorted by (visit position, file order)
+        visit_lab_indptr[v] : visit_lab_indptr[v + 1]          -> that visit's lab reports
+
+Because a patient's visits are contiguous, so are their lab reports, and
+both come back as one slice each; the memory backend of src/query_service.py
+answers its per-patient lookups from them. Low-cardinality text columns are
+dictionary-encoded (vocabularies in meta.json), names are stored as UTF-8
+bytes + offsets, and dates as int32 days since 1970-01-01. Every array is
+saved as its own .npy file and memory-mapped by RelationIndex.load();
+open_index() reuses the saved index while the raw files it was built from
+are unchanged, and rebuilds it otherwise.
+
+    python -m src.relation_index            # build data/index/ from data/raw/
+"""
+import os
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from src.id_codec import ID_PREFIXES, INVALID_ID, encode_id, encode_ids, decode_ids
+from src.parse_cache import input_digest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+INDEX_DIR = os.path.join(BASE_DIR, "data", "index")
+
+MISSING_DATE = np.iinfo(np.int32).min
+MISSING_CODE = -1
+
+SOURCE_TABLES = ["patients", "doctors", "visits", "lab_reports"]
+# Sorted distinct codes of each ID, whose positions are the ordinals
+KEY_ARRAYS = {"patient_id": "patient_keys", "doctor_id": "doctor_keys", "visit_id": "visit_keys"}
+
+# Dictionary-encoded columns per table
+CATEGORICAL_COLUMNS = {
+    "patients": ["gender", "blood_group", "city"],
+    "doctors": ["specialization", "hospital"],
+    "visits": ["reason", "visit_type"],
+    "lab_reports": ["test_type", "result"],
+}
+STRING_COLUMNS = {"patients": ["name"], "doctors": ["name"]}
+DATE_COLUMNS = {"patients": ["dob"], "visits": ["visit_date"], "lab_reports": ["report_date"]}
+
+
+# ---------- Column encoding ----------
+
+def _encode_dates(values):
+    dates = pd.to_datetime(pd.Series(values), errors="coerce", format="%Y-%m-%d")
+    days = dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+    days[dates.isna().to_numpy()] = MISSING_DATE
+    return days.astype(np.int32)
+
+
+def _encode_categories(values):
+    codes, vocabulary = pd.factorize(pd.Series(values), sort=True)
+    return codes.astype(np.int32), [str(v) for v in vocabulary]
+
+
+def _pack_strings(values):
+    encoded = [("" if pd.isna(v) else str(v)).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _key_set(*code_arrays):
+    """Sorted distinct valid codes; an ID's ordinal is its position in this array."""
+    return np.unique(np.concatenate([c[c != INVALID_ID] for c in code_arrays]).astype(np.int64))
+
+
+def _lookup(keys, codes):
+    """Ordinal of each code in the sorted `keys` (MISSING_CODE for codes that are not there)."""
+    idx = np.searchsorted(keys, codes)
+    found = (idx < len(keys)) & (codes != INVALID_ID)
+    found[found] = keys[idx[found]] == codes[found]
+    return np.where(found, idx, MISSING_CODE)
+
+
+def _rows(keys, codes):
+    """ordinal -> row offset for a table's key codes (MISSING_CODE for keys with no row)."""
+    rows = np.full(len(keys), MISSING_CODE, dtype=np.int64)
+    valid = codes != INVALID_ID
+    rows[np.searchsorted(keys, codes[valid])] = np.flatnonzero(valid)
+    return rows
+
+
+def _encode_table(df, table, arrays, meta):
+    """Add a table's encoded attribute columns to `arrays` (vocabularies go to meta)."""
+    for column in CATEGORICAL_COLUMNS.get(table, []):
+        arrays[f"{table}.{column}"], meta["vocabularies"][f"{table}.{column}"] = _encode_categories(df[column])
+    for column in STRING_COLUMNS.get(table, []):
+        arrays[f"{table}.{column}.offsets"], arrays[f"{table}.{column}.data"] = _pack_strings(df[column])
+    for column in DATE_COLUMNS.get(table, []):
+        arrays[f"{table}.{column}"] = _encode_dates(df[column])
+
+
+# ---------- Build ----------
+
+def source_files(raw_dir=RAW_DIR):
+    return [os.path.join(raw_dir, f"{table}.csv") for table in SOURCE_TABLES]
+
+
+def build_index(raw_dir=RAW_DIR):
+    """Build the index arrays from the raw CSVs; returns (arrays, meta)."""
+    # hashed before reading, so a file changed during the build makes the next open rebuild
+    digest, files = input_digest(source_files(raw_dir), {})
+    patients = pd.read_csv(os.path.join(raw_dir, "patients.csv"), dtype=str)
+    doctors = pd.read_csv(os.path.join(raw_dir, "doctors.csv"), dtype=str).drop_duplicates("doctor_id", keep="last")
+    visits = pd.read_csv(os.path.join(raw_dir, "visits.csv"), dtype=str)
+    lab_reports = pd.read_csv(os.path.join(raw_dir, "lab_reports.csv"), dtype=str)
+
+    patient_codes = encode_ids(patients["patient_id"], ID_PREFIXES["patient_id"])
+    doctor_codes = encode_ids(doctors["doctor_id"], ID_PREFIXES["doctor_id"])
+
+    # Visits of known patients, grouped by patient, newest first, file order within a date
+    visit_patient = encode_ids(visits["patient_id"], ID_PREFIXES["patient_id"])
+    patient_keys = _key_set(patient_codes, visit_patient)
+    keep = visit_patient != INVALID_ID
+    visits = visits[keep].assign(_patient=np.searchsorted(patient_keys, visit_patient[keep]))
+    visits = visits.sort_values("visit_date", ascending=False, kind="stable")
+    visits = visits.sort_values("_patient", kind="stable").reset_index(drop=True)
+    visit_codes = encode_ids(visits["visit_id"], ID_PREFIXES["visit_id"])
+    visit_patient_ord = visits["_patient"].to_numpy(dtype=np.int64)
+
+    # Lab reports of known visits, grouped by visit position, file order within a visit
+    visit_keys = _key_set(visit_codes)
+    visit_pos = _rows(visit_keys, visit_codes)
+    lab_visit = _lookup(visit_keys, encode_ids(lab_reports["visit_id"], ID_PREFIXES["visit_id"]))
+    known = lab_visit != MISSING_CODE
+    lab_pos = np.full(len(lab_reports), MISSING_CODE, dtype=np.int64)
+    lab_pos[known] = visit_pos[lab_visit[known]]
+    keep = lab_pos != MISSING_CODE
+    order = np.argsort(lab_pos[keep], kind="stable")
+    lab_reports = lab_reports[keep].iloc[order].reset_index(drop=True)
+    lab_visit_pos = lab_pos[keep][order]
+
+    doctor_keys = _key_set(doctor_codes)
+    visit_doctor = encode_ids(visits["doctor_id"], ID_PREFIXES["doctor_id"])
+
+    arrays = {
+        "patient_keys": patient_keys,
+        "doctor_keys": doctor_keys,
+        "visit_keys": visit_keys,
+        "patient_row": _rows(patient_keys, patient_codes),
+        "doctor_row": _rows(doctor_keys, doctor_codes),
+        "visit_pos": visit_pos,
+        "patient_visit_indptr": np.searchsorted(visit_patient_ord,
+                                                np.arange(len(patient_keys) + 1)).astype(np.int64),
+        "visit_lab_indptr": np.searchsorted(lab_visit_pos, np.arange(len(visits) + 1)).astype(np.int64),
+        "patients.patient_id": patient_codes,
+        "doctors.doctor_id": doctor_codes,
+        "visits.visit_id": visit_codes,
+        "visits.patient": visit_patient_ord,
+        "visits.doctor_id": visit_doctor,
+        "lab_reports.report_id": encode_ids(lab_reports["report_id"], ID_PREFIXES["report_id"]),
+    }
+    meta = {
+        "sources": {"digest": digest, "files": files},
+        "counts": {"patients": len(patients), "doctors": len(doctors), "visits": len(visits),
+                   "lab_reports": len(lab_reports)},
+        "vocabularies": {},
+    }
+    _encode_table(patients, "patients", arrays, meta)
+    _encode_table(doctors, "doctors", arrays, meta)
+    _encode_table(visits, "visits", arrays, meta)
+    _encode_table(lab_reports, "lab_reports", arrays, meta)
+    return arrays, meta
+
+
+def save_index(arrays, meta, index_dir=INDEX_DIR):
+    """Write one .npy per array plus meta.json (with the array names)."""
+    os.makedirs(index_dir, exist_ok=True)
+    # each file is written aside and renamed into place, so processes mapping
+    # the previous index keep reading intact files; meta.json goes last
+    for name, array in arrays.items():
+        path = os.path.join(index_dir, f"{name}.npy")
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(path + ".tmp", path)
+    path = os.path.join(index_dir, "meta.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump({**meta, "arrays": sorted(arrays)}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def open_index(raw_dir=RAW_DIR, index_dir=INDEX_DIR):
+    """
+    The saved index in `index_dir` (memory-mapped) if it was built from the current
+    raw files in `raw_dir`; otherwise build it, save it there and map that.
+    """
+    meta_path = os.path.join(index_dir, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            sources = json.load(f).get("sources", {})
+        files = source_files(raw_dir)
+        if sources and all(map(os.path.exists, files)) and input_digest(files, sources)[0] == sources["digest"]:
+            return RelationIndex.load(index_dir)
+    save_index(*build_index(raw_dir), index_dir=index_dir)
+    return RelationIndex.load(index_dir)
+
+
+# ---------- Lookups ----------
+
+class RelationIndex:
+    """Read-side view over a saved index; arrays are memory-mapped unless mmap=False."""
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        self.vocabularies = meta["vocabularies"]
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR, mmap=True):
+        with open(os.path.join(index_dir, "meta.json")) as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode=mode) for name in meta["arrays"]}
+        return cls(arrays, meta)
+
+    @classmethod
+    def build(cls, raw_dir=RAW_DIR):
+        return cls(*build_index(raw_dir))
+
+    # ----- ID helpers -----
+
+    def _code_ordinal(self, code, key):
+        """Position of an encoded ID in its sorted keys, or None."""
+        keys = self.arrays[KEY_ARRAYS[key]]
+        if code == INVALID_ID:
+            return None
+        i = int(np.searchsorted(keys, code))
+        return i if i < len(keys) and keys[i] == code else None
+
+    def _ordinal(self, value, key):
+        return self._code_ordinal(encode_id(value, ID_PREFIXES[key]), key)
+
+    def patient_row(self, patient_id):
+        """Row offset of a patient in the patients.* arrays, or None."""
+        p = self._ordinal(patient_id, "patient_id")
+        if p is None or self.arrays["patient_row"][p] == MISSING_CODE:
+            return None
+        return int(self.arrays["patient_row"][p])
+
+    def doctor_row(self, doctor_code):
+        """Row offset of an encoded doctor ID in the doctors.* arrays, or None."""
+        d = self._code_ordinal(doctor_code, "doctor_id")
+        if d is None or self.arrays["doctor_row"][d] == MISSING_CODE:
+            return None
+        return int(self.arrays["doctor_row"][d])
+
+    def visit_range(self, patient_id):
+        """(start, end) of the patient's visits in the visits.* arrays; empty for unknown IDs."""
+        p = self._ordinal(patient_id, "patient_id")
+        if p is None:
+            return 0, 0
+        indptr = self.arrays["patient_visit_indptr"]
+        return int(indptr[p]), int(indptr[p + 1])
+
+    def lab_range(self, visit_positions):
+        """(start, end) in the lab_reports.* arrays for a visit position or a (start, end) visit range."""
+        start, end = visit_positions if isinstance(visit_positions, tuple) else (visit_positions, visit_positions + 1)
+        indptr = self.arrays["visit_lab_indptr"]
+        return int(indptr[start]), int(indptr[end])
+
+    def visit_position(self, visit_id):
+        v = self._ordinal(visit_id, "visit_id")
+        if v is None or self.arrays["visit_pos"][v] == MISSING_CODE:
+            return None
+        return int(self.arrays["visit_pos"][v])
+
+    # ----- Decoding -----
+
+    def text(self, table, column, rows):
+        """Decode a dictionary-encoded or packed string column for a row offset or slice."""
+        name = f"{table}.{column}"
+        if name in self.vocabularies:
+            vocabulary = self.vocabularies[name]
+            codes = np.atleast_1d(self.arrays[name][rows])
+            values = [vocabulary[c] if c != MISSING_CODE else None for c in codes.tolist()]
+        else:
+            offsets, data = self.arrays[f"{name}.offsets"], self.arrays[f"{name}.data"]
+            idx = range(*rows.indices(len(offsets) - 1)) if isinstance(rows, slice) else [rows]
+            values = [bytes(data[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in idx]
+        return values if isinstance(rows, slice) else values[0]
+
+    def dates(self, table, column, rows):
+        days = np.atleast_1d(self.arrays[f"{table}.{column}"][rows])
+        values = [str(np.datetime64(int(d), "D")) if d != MISSING_DATE else None for d in days.tolist()]
+        return values if isinstance(rows, slice) else values[0]
+
+    def ids(self, table, key, rows):
+        values = decode_ids(np.atleast_1d(self.arrays[f"{table}.{key}"][rows]), ID_PREFIXES[key]).tolist()
+        return values if isinstance(rows, slice) else values[0]
+
+    # ----- Rollups -----
+
+    def visits_per_patient(self):
+        """Visit count for every patient ordinal (vectorised over the whole index)."""
+        return np.diff(self.arrays["patient_visit_indptr"])
+
+    def lab_reports_per_patient(self):
+        """Lab report count for every patient ordinal."""
+        return np.diff(self.arrays["visit_lab_indptr"][self.arrays["patient_visit_indptr"]])
+
+    def patient_rollup(self, patient_id):
+        """Counts for one patient computed on the index slices (no per-row Python objects)."""
+        start, end = self.visit_range(patient_id)
+        lab_start, lab_end = self.lab_range((start, end))
+        rollup = {"total_visits": end - start, "total_lab_reports": lab_end - lab_start}
+        for column in CATEGORICAL_COLUMNS["visits"]:
+            vocabulary = self.vocabularies[f"visits.{column}"]
+            counts = np.bincount(self.arrays[f"visits.{column}"][start:end] + 1, minlength=len(vocabulary) + 1)[1:]
+            rollup[column] = {vocabulary[i]: int(counts[i]) for i in np.flatnonzero(counts)}
+        return rollup
+
+    def doctor(self, doctor_code):
+        """Doctor details for an encoded doctor ID, with the portals' placeholders for unknown doctors."""
+        doctor_id = decode_ids([doctor_code], ID_PREFIXES["doctor_id"])[0] if doctor_code != INVALID_ID else None
+        row = self.doctor_row(doctor_code)
+        if row is None:
+            return {"doctor_id": doctor_id, "name": "Unknown", "specialization": "", "hospital": ""}
+        return {"doctor_id": doctor_id, "name": self.text("doctors", "name", row),
+                "specialization": self.text("doctors", "specialization", row),
+                "hospital": self.text("doctors", "hospital", row)}
+
+    def patient_visits(self, patient_id):
+        """The patient's visits (newest first) with doctor and lab reports, as plain dicts."""
+        start, end = self.visit_range(patient_id)
+        rows = slice(start, end)
+        visits = []
+        columns = zip(self.ids("visits", "visit_id", rows), self.dates("visits", "visit_date", rows),
+                      self.text("visits", "reason", rows), self.text("visits", "visit_type", rows),
+                      self.arrays["visits.doctor_id"][rows].tolist(), range(start, end))
+        for visit_id, visit_date, reason, visit_type, doctor_code, position in columns:
+            lab_rows = slice(*self.lab_range(position))
+            visits.append({
+                "visit_id": visit_id,
+                "visit_date": visit_date,
+                "reason": reason,
+                "visit_type": visit_type,
+                "doctor": self.doctor(doctor_code),
+                "lab_reports": [
+                    {"report_id": r, "test_type": t, "result": res, "report_date": d}
+                    for r, t, res, d in zip(self.ids("lab_reports", "report_id", lab_rows),
+                                            self.text("lab_reports", "test_type", lab_rows),
+                                            self.text("lab_reports", "result", lab_rows),
+                                            self.dates("lab_reports", "report_date", lab_rows))
+                ],
+            })
+        return visits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the patients -> visits -> lab reports CSR index")
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    args = parser.parse_args()
+
+    arrays, meta = build_index(args.raw_dir)
+    save_index(arrays, meta, args.index_dir)
+    size = sum(a.nbytes for a in arrays.values())
+    print(f"  [OK] Index written to {args.index_dir} ({len(arrays)} arrays, {size / 1e6:.1f} MB)")
+    print(f"  [OK] {meta['counts']['patients']} patients, {meta['counts']['visits']} visits, "
+          f"{meta['counts']['lab_reports']} lab reports")
@@ -0,0 +1,256 @@
+"""
+Dependency-aware stage scheduler for the pipeline.
+
+Each Stage declares the files it reads and writes:
+
+    Stage("transform", run, inputs=[raw CSVs], outputs=[data/processed])
+    Stage("dashboard", build, inputs=[data/processed/...], outputs=[dashboard_data.json])
+
+A stage depends on every stage whose outputs contain one of its inputs, and
+on the stages named in `after` (for dependencies that are not files, such as
+the MySQL load). Once a stage's dependencies are done it is started on a
+thread pool. Independent stages therefore overlap: the MySQL ingest runs
+alongside the transform, and the dashboard and patient record builds run
+side by side.
+
+As with make, a stage is skipped when all of these hold:
+- it succeeded last time;
+- its outputs still exist;
+- its signature is unchanged.
+
+The signature is the sha256 of:
+- its input files (a hash is reused while the file's size and mtime are unchanged);
+- its params;
+- the stamps of its dependencies.
+
+A stage's stamp is the hash of its outputs. A rerun that writes identical
+files therefore does not invalidate the stages downstream of it. A stage
+without outputs gets a new stamp every time it runs.
+
+Per-stage state is kept in data/state/pipeline_state.json and saved as each
+stage finishes. When a stage fails, the stages that depend on it are not
+run, but independent stages carry on. run(resume=True) then reruns only the
+stages that failed or never ran.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.config import PIPELINE_CONFIG
+from src.parse_cache import input_digest
+from src.instrumentation import profile_thread, step
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_FILE = os.path.join(BASE_DIR, "data", "state", "pipeline_state.json")
+
+
+class Stage:
+    """A named unit of work with declared input and output paths (files or directories)."""
+
+    def __init__(self, name, run, inputs=(), outputs=(), after=(), params=None, optional=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.params = params or {}
+        # an optional stage's failure is reported but does not fail the run
+        self.optional = optional
+
+
+def expand_paths(paths):
+    """Files under `paths` in a stable order; hidden and `_`-prefixed names (.crc, _SUCCESS) are ignored."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith((".", "_")))
+                files.extend(os.path.join(root, n) for n in sorted(names) if not n.startswith((".", "_")))
+        elif os.path.exists(path):
+            files.append(path)
+    return files
+
+
+def _contains(outer, inner):
+    outer, inner = os.path.abspath(outer), os.path.abspath(inner)
+    return inner == outer or inner.startswith(outer.rstrip(os.sep) + os.sep)
+
+
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"stages": {}}
+
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Scheduler:
+    """Runs stages in dependency order, concurrently where possible, skipping up-to-date ones."""
+
+    def __init__(self, stages, state_file=STATE_FILE, workers=None):
+        self.stages = {s.name: s for s in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.state_file = state_file
+        self.workers = workers or PIPELINE_CONFIG["workers"]
+        self.deps = self._dependencies()
+        self.order = self._topological_order()
+        self._lock = threading.Lock()
+
+    def _dependencies(self):
+        deps = {}
+        for stage in self.stages.values():
+            found = set()
+            for name in stage.after:
+                if name not in self.stages:
+                    raise ValueError(f"Stage `{stage.name}` runs after unknown stage `{name}`")
+                found.add(name)
+            for other in self.stages.values():
+                if other is not stage and any(_contains(out, path) or _contains(path, out)
+                                              for out in other.outputs for path in stage.inputs):
+                    found.add(other.name)
+            deps[stage.name] = found
+        return deps
+
+    def _topological_order(self):
+        order, done, visiting = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through stage `{name}`")
+            visiting.add(name)
+            for dep in sorted(self.deps[name]):
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def select(self, targets=None):
+        """The target stages plus everything they depend on, in topological order."""
+        if not targets:
+            return list(self.order)
+        unknown = [t for t in targets if t not in self.stages]
+        if unknown:
+            raise ValueError(f"Unknown stage(s) {unknown}; expected some of {self.order}")
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.deps[name])
+        return [name for name in self.order if name in needed]
+
+    # ---------- Single stage ----------
+
+    def _signature(self, stage, record, dep_stamps):
+        digest, files = input_digest(expand_paths(stage.inputs), record or {})
+        payload = json.dumps({"inputs": digest, "params": stage.params, "deps": dep_stamps},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest(), files
+
+    def _stamp(self, stage, record, signature):
+        if not stage.outputs:
+            return hashlib.sha256(f"{signature}\0{time.time_ns()}".encode()).hexdigest()
+        digest, files = input_digest(expand_paths(stage.outputs), {"files": record.get("output_files", {})})
+        record["output_files"] = files
+        return digest
+
+    def _execute(self, stage, record, dep_stamps, force, resume):
+        """Run or skip one stage; returns its new state record (with a transient `result` key)."""
+        with profile_thread(), step(f"stage:{stage.name}", **stage.params) as s:
+            if resume and not force and record.get("status") == "ok":
+                s.attrs["result"] = "skipped"
+                return {**record, "result": "skipped"}
+
+            signature, files = self._signature(stage, record, dep_stamps)
+            outputs_exist = all(os.path.exists(p) for p in stage.outputs)
+            if (not force and record.get("status") == "ok" and record.get("signature") == signature
+                    and outputs_exist):
+                s.attrs["result"] = "skipped"
+                return {**record, "files": files, "result": "skipped"}
+
+            print(f"\n[STAGE] {stage.name} started")
+            start = time.perf_counter()
+            new = {"signature": signature, "files": files, "output_files": record.get("output_files", {})}
+            try:
+                stage.run()
+            except Exception as e:
+                s.attrs["result"] = "failed"
+                return {**new, "status": "failed", "error": f"{type(e).__name__}: {e}",
+                        "seconds": round(time.perf_counter() - start, 3),
+                        "finished": datetime.now().isoformat(timespec="seconds"), "result": "failed"}
+            new["stamp"] = self._stamp(stage, new, signature)
+            s.attrs["result"] = "ran"
+            return {**new, "status": "ok", "seconds": round(time.perf_counter() - start, 3),
+                    "finished": datetime.now().isoformat(timespec="seconds"), "result": "ran"}
+
+    # ---------- Run ----------
+
+    def run(self, targets=None, force=False, resume=False):
+        """
+        Run the selected stages (all by default). Returns {stage: result}, where result is
+        "ran", "skipped", "failed" or "blocked" (a dependency failed).
+        """
+        selected = self.select(targets)
+        state = load_state(self.state_file)
+        records = state.setdefault("stages", {})
+        results = {}
+        pending = list(selected)
+        running = {}
+
+        def finish(name, record):
+            results[name] = record.pop("result")
+            with self._lock:
+                records[name] = record
+                state["last_run"] = {"finished": datetime.now().isoformat(timespec="seconds"),
+                                     "stages": selected, "results": dict(results)}
+                save_state(state, self.state_file)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stage") as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = self.deps[name] & set(selected)
+                    if any(results.get(d) in ("failed", "blocked") for d in deps):
+                        pending.remove(name)
+                        print(f"  [SKIP] {name}: a dependency failed")
+                        finish(name, {**records.get(name, {}), "status": "blocked", "result": "blocked"})
+                    elif all(d in results for d in deps):
+                        pending.remove(name)
+                        dep_stamps = {d: records.get(d, {}).get("stamp") for d in sorted(self.deps[name])}
+                        # copy the context so steps opened inside the stage nest under its own step
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, self._execute, self.stages[name], dict(records.get(name, {})),
+                                            dep_stamps, force, resume)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    record = future.result()
+                    result = record["result"]
+                    finish(name, record)
+                    if result == "ran":
+                        print(f"  [OK] {name} finished in {record['seconds']:.2f}s")
+                    elif result == "skipped":
+                        print(f"  [SKIP] {name}: up to date")
+                    else:
+                        print(f"  [WARN] {name} failed: {record['error']}")
+        return {name: results[name] for name in selected}
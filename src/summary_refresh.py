@@ -0,0 +1,210 @@
+"""
+Refresh job for the pre-aggregated summary tables in sql/summary.sql.
+
+Triggers on `visits` and `lab_reports` append +1/-1 rows to
+summary_visit_log / summary_lab_log for every insert, upsert and delete,
+whichever loader wrote them. refresh_summaries() folds the logged changes
+into the summary tables in one transaction and then drains the logs, so
+each run only touches the groups that changed since the previous one:
+
+    doctor_daily_stats, doctor_patients,
+    hospital_monthly_patients -> hospital_monthly_stats, lab_result_monthly
+
+refresh_summaries(full=True) rebuilds everything from the base tables
+(needed once after installing sql/summary.sql, and after doctors move
+hospitals); run it while no ingest is in progress.
+
+    python -m src.summary_refresh [--full] [--ensure-indexes]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.db_connection import get_connection
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_FILE = os.path.join(BASE_DIR, "sql", "schema.sql")
+
+SUMMARY_TABLES = ["doctor_daily_stats", "doctor_patients", "hospital_monthly_patients",
+                  "hospital_monthly_stats", "lab_result_monthly"]
+
+
+def _month(column):
+    """SQL expression for the first day of `column`'s month, as a DATE."""
+    return f"DATE_SUB({column}, INTERVAL DAYOFMONTH({column}) - 1 DAY)"
+
+
+# Row sources: the drained change log, or every base row counted once
+VISIT_SOURCES = {
+    "log": "SELECT sign, doctor_id, patient_id, visit_date FROM summary_visit_log WHERE id <= {max_id}",
+    "full": "SELECT 1 AS sign, doctor_id, patient_id, visit_date FROM visits",
+}
+LAB_SOURCES = {
+    "log": "SELECT sign, test_type, result, report_date FROM summary_lab_log WHERE id <= {max_id}",
+    "full": "SELECT 1 AS sign, test_type, result, report_date FROM lab_reports",
+}
+
+VISIT_STATEMENTS = [
+    # Additive counts
+    """INSERT INTO doctor_daily_stats (doctor_id, visit_date, visit_count)
+       SELECT doctor_id, visit_date, SUM(sign) FROM ({source}) src
+       WHERE doctor_id IS NOT NULL AND visit_date IS NOT NULL
+       GROUP BY doctor_id, visit_date
+       ON DUPLICATE KEY UPDATE visit_count = visit_count + VALUES(visit_count)""",
+    """INSERT INTO doctor_patients (doctor_id, patient_id, visit_count)
+       SELECT doctor_id, patient_id, SUM(sign) FROM ({source}) src
+       WHERE doctor_id IS NOT NULL AND patient_id IS NOT NULL
+       GROUP BY doctor_id, patient_id
+       ON DUPLICATE KEY UPDATE visit_count = visit_count + VALUES(visit_count)""",
+    f"""INSERT INTO hospital_monthly_patients (hospital, month, patient_id, visit_count)
+       SELECT d.hospital, {_month("src.visit_date")} AS month, src.patient_id, SUM(src.sign)
+       FROM ({{source}}) src JOIN doctors d ON d.doctor_id = src.doctor_id
+       WHERE d.hospital IS NOT NULL AND src.visit_date IS NOT NULL AND src.patient_id IS NOT NULL
+       GROUP BY d.hospital, month, src.patient_id
+       ON DUPLICATE KEY UPDATE visit_count = visit_count + VALUES(visit_count)""",
+    # Hospital-months whose distinct counts must be recomputed
+    "DROP TEMPORARY TABLE IF EXISTS summary_touched",
+    f"""CREATE TEMPORARY TABLE summary_touched (PRIMARY KEY (hospital, month))
+       SELECT DISTINCT d.hospital, {_month("src.visit_date")} AS month
+       FROM ({{source}}) src JOIN doctors d ON d.doctor_id = src.doctor_id
+       WHERE d.hospital IS NOT NULL AND src.visit_date IS NOT NULL""",
+    # Groups whose count dropped to zero no longer exist
+    """DELETE s FROM doctor_daily_stats s
+       JOIN (SELECT DISTINCT doctor_id, visit_date FROM ({source}) src) t
+         ON t.doctor_id = s.doctor_id AND t.visit_date = s.visit_date
+       WHERE s.visit_count <= 0""",
+    """DELETE s FROM doctor_patients s
+       JOIN (SELECT DISTINCT doctor_id, patient_id FROM ({source}) src) t
+         ON t.doctor_id = s.doctor_id AND t.patient_id = s.patient_id
+       WHERE s.visit_count <= 0""",
+    """DELETE s FROM hospital_monthly_patients s
+       JOIN summary_touched t ON t.hospital = s.hospital AND t.month = s.month
+       WHERE s.visit_count <= 0""",
+    """DELETE s FROM hospital_monthly_stats s
+       JOIN summary_touched t ON t.hospital = s.hospital AND t.month = s.month""",
+    """INSERT INTO hospital_monthly_stats (hospital, month, visit_count, unique_patients, active_doctors)
+       SELECT p.hospital, p.month, SUM(p.visit_count), COUNT(*),
+              (SELECT COUNT(DISTINCT s.doctor_id)
+               FROM doctor_daily_stats s JOIN doctors d ON d.doctor_id = s.doctor_id
+               WHERE d.hospital = p.hospital AND s.visit_date BETWEEN p.month AND LAST_DAY(p.month))
+       FROM hospital_monthly_patients p
+       JOIN summary_touched t ON t.hospital = p.hospital AND t.month = p.month
+       GROUP BY p.hospital, p.month""",
+    "DROP TEMPORARY TABLE IF EXISTS summary_touched",
+]
+
+LAB_STATEMENTS = [
+    f"""INSERT INTO lab_result_monthly (month, test_type, result, report_count)
+       SELECT {_month("report_date")} AS month, test_type, result, SUM(sign) FROM ({{source}}) src
+       WHERE report_date IS NOT NULL AND test_type IS NOT NULL AND result IS NOT NULL
+       GROUP BY month, test_type, result
+       ON DUPLICATE KEY UPDATE report_count = report_count + VALUES(report_count)""",
+    "DELETE FROM lab_result_monthly WHERE report_count <= 0",
+]
+
+
+def parse_indexes(schema_file=SCHEMA_FILE):
+    """Return {table: [(index name, column list)]} from the INDEX clauses in schema.sql."""
+    with open(schema_file) as f:
+        schema = f.read()
+
+    indexes = {}
+    for match in re.finditer(r"CREATE TABLE(?: IF NOT EXISTS)?\s+(\w+)\s*\((.*?)\);", schema, re.S | re.I):
+        table, body = match.group(1), match.group(2)
+        found = re.findall(r"^\s*(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)", body, re.M | re.I)
+        if found:
+            indexes[table] = [(name, columns.strip()) for name, columns in found]
+    return indexes
+
+
+def ensure_indexes(cursor, schema_file=SCHEMA_FILE):
+    """Add the secondary indexes declared in schema.sql to tables created before they existed."""
+    added = []
+    for table, indexes in parse_indexes(schema_file).items():
+        cursor.execute("SELECT DISTINCT index_name FROM information_schema.statistics "
+                       "WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+        existing = {row[0].lower() for row in cursor.fetchall()}
+        for name, columns in indexes:
+            if name.lower() not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD INDEX {name} ({columns})")
+                added.append(f"{table}.{name}")
+    return added
+
+
+def _log_position(cursor, log_table):
+    cursor.execute(f"SELECT COUNT(*), MAX(id) FROM {log_table}")
+    count, max_id = cursor.fetchone()
+    return int(count), max_id
+
+
+def _apply(cursor, statements, source):
+    for statement in statements:
+        cursor.execute(statement.format(source=source))
+
+
+def refresh_summaries(full=False, conn=None):
+    """
+    Fold logged visit / lab report changes into the summary tables, or rebuild
+    them from the base tables with full=True. Returns a dict with refresh statistics.
+    """
+    start = time.perf_counter()
+    own_conn = conn is None
+    conn = conn or get_connection(pooled=True)
+    cursor = conn.cursor()
+    try:
+        visit_changes, visit_max = _log_position(cursor, "summary_visit_log")
+        lab_changes, lab_max = _log_position(cursor, "summary_lab_log")
+
+        if full:
+            for table in SUMMARY_TABLES:
+                cursor.execute(f"DELETE FROM {table}")
+            _apply(cursor, VISIT_STATEMENTS, VISIT_SOURCES["full"])
+            _apply(cursor, LAB_STATEMENTS, LAB_SOURCES["full"])
+        else:
+            if visit_max is not None:
+                _apply(cursor, VISIT_STATEMENTS, VISIT_SOURCES["log"].format(max_id=int(visit_max)))
+            if lab_max is not None:
+                _apply(cursor, LAB_STATEMENTS, LAB_SOURCES["log"].format(max_id=int(lab_max)))
+
+        # Drain only what was read; rows logged meanwhile wait for the next run
+        if visit_max is not None:
+            cursor.execute("DELETE FROM summary_visit_log WHERE id <= %s", (int(visit_max),))
+        if lab_max is not None:
+            cursor.execute("DELETE FROM summary_lab_log WHERE id <= %s", (int(lab_max),))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        if own_conn:
+            conn.close()
+
+    elapsed = time.perf_counter() - start
+    mode = "full" if full else "incremental"
+    print(f"  [OK] Summary tables refreshed ({mode}, {visit_changes} visit and {lab_changes} "
+          f"lab report changes, {elapsed:.2f}s)")
+    return {"mode": mode, "visit_changes": visit_changes, "lab_changes": lab_changes, "seconds": elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the MySQL summary tables")
+    parser.add_argument("--full", action="store_true", help="rebuild from the base tables instead of the change logs")
+    parser.add_argument("--ensure-indexes", action="store_true",
+                        help="add schema.sql's secondary indexes to existing tables first")
+    args = parser.parse_args()
+
+    if args.ensure_indexes:
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            added = ensure_indexes(cursor)
+        finally:
+            cursor.close()
+            conn.close()
+        print(f"  [OK] Indexes added: {', '.join(added) or 'none (already present)'}")
+    refresh_summaries(full=args.full)
@@ -0,0 +1,190 @@
+"""
+Seeded, streaming synthetic data generator for the four raw tables.
+
+A profile of the shipped CSVs (row counts, ID ranges, category frequencies,
+first/last names, date ranges) is sampled to write datasets of the same
+schema and value distributions at any scale factor:
+
+    python -m src.synthetic_data --scale 10 --out data/synthetic/x10
+
+Rows are written in chunks of `chunk_rows`, so memory stays flat at any
+scale. Each chunk draws from its own generator seeded with
+(seed, table, chunk), so the same seed and chunk size always produce the
+same files. Foreign keys are drawn uniformly from the generated parent IDs,
+as in the source data.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from src.id_codec import ID_PREFIXES, TABLE_KEYS, encode_ids
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+SYNTHETIC_DIR = os.path.join(BASE_DIR, "data", "synthetic")
+
+# Output order is FK order: parents first
+TABLE_COLUMNS = {
+    "patients": ["patient_id", "name", "gender", "dob", "blood_group", "city"],
+    "doctors": ["doctor_id", "name", "specialization", "hospital"],
+    "visits": ["visit_id", "patient_id", "doctor_id", "visit_date", "reason", "visit_type"],
+    "lab_reports": ["report_id", "visit_id", "test_type", "result", "report_date"],
+}
+CATEGORY_COLUMNS = {
+    "patients": ["gender", "blood_group", "city"],
+    "doctors": ["specialization", "hospital"],
+    "visits": ["reason", "visit_type"],
+    "lab_reports": ["test_type", "result"],
+}
+DATE_COLUMNS = {"patients": "dob", "visits": "visit_date", "lab_reports": "report_date"}
+DATASET_FILE = "dataset.json"
+
+
+def build_profile(raw_dir=RAW_DIR):
+    """Summarise the raw CSVs into the distributions the generator samples from."""
+    profile = {"rows": {}, "id_start": {}, "categories": {}, "dates": {}, "names": {}}
+    names = []
+    for table, columns in TABLE_COLUMNS.items():
+        df = pd.read_csv(os.path.join(raw_dir, f"{table}.csv"), dtype=str, keep_default_na=False)
+        key = TABLE_KEYS[table]
+        profile["rows"][table] = len(df)
+        codes = encode_ids(df[key], ID_PREFIXES[key])
+        profile["id_start"][key] = int(codes[codes >= 0].min()) if (codes >= 0).any() else 0
+
+        for column in CATEGORY_COLUMNS[table]:
+            freq = df[column].value_counts(normalize=True, sort=False)
+            profile["categories"][f"{table}.{column}"] = [freq.index.tolist(), freq.to_numpy().tolist()]
+        if table in DATE_COLUMNS:
+            days = pd.to_datetime(df[DATE_COLUMNS[table]], errors="coerce").dropna().to_numpy(dtype="datetime64[D]")
+            profile["dates"][f"{table}.{DATE_COLUMNS[table]}"] = [int(days.min().astype(np.int64)),
+                                                                  int(days.max().astype(np.int64))]
+        if "name" in columns:
+            names.append(df["name"])
+
+    parts = pd.concat(names).str.split(" ", n=1, expand=True).fillna("")
+    for label, column in (("first", 0), ("last", 1)):
+        freq = parts[column].value_counts(normalize=True, sort=False)
+        profile["names"][label] = [freq.index.tolist(), freq.to_numpy().tolist()]
+    return profile
+
+
+class _Sampler:
+    """Vectorised draws from a profile with one generator per chunk."""
+
+    def __init__(self, profile, rng):
+        self.profile = profile
+        self.rng = rng
+
+    def choice(self, distribution, size):
+        values, probabilities = distribution
+        return np.asarray(values, dtype=object)[self.rng.choice(len(values), size=size, p=probabilities)]
+
+    def category(self, table, column, size):
+        return self.choice(self.profile["categories"][f"{table}.{column}"], size)
+
+    def dates(self, table, column, size):
+        low, high = self.profile["dates"][f"{table}.{column}"]
+        days = self.rng.integers(low, high + 1, size=size).astype("datetime64[D]")
+        return np.datetime_as_string(days)
+
+    def names(self, size):
+        first = self.choice(self.profile["names"]["first"], size)
+        last = self.choice(self.profile["names"]["last"], size)
+        return pd.Series(first).str.cat(pd.Series(last), sep=" ").str.strip().to_numpy()
+
+    def ids(self, key, start, count, size=None, sequential_from=None):
+        """Prefixed IDs: sequential from `sequential_from`, or `size` uniform draws from [start, start + count)."""
+        if sequential_from is not None:
+            codes = np.arange(sequential_from, sequential_from + size) + start
+        else:
+            codes = self.rng.integers(start, start + count, size=size)
+        return (ID_PREFIXES[key] + pd.Series(codes).astype(str)).to_numpy()
+
+
+def _chunk(table, sampler, offset, size, counts, starts):
+    s = sampler
+    if table == "patients":
+        data = {"patient_id": s.ids("patient_id", starts["patient_id"], 0, size, offset),
+                "name": s.names(size),
+                "gender": s.category(table, "gender", size),
+                "dob": s.dates(table, "dob", size),
+                "blood_group": s.category(table, "blood_group", size),
+                "city": s.category(table, "city", size)}
+    elif table == "doctors":
+        data = {"doctor_id": s.ids("doctor_id", starts["doctor_id"], 0, size, offset),
+                "name": s.names(size),
+                "specialization": s.category(table, "specialization", size),
+                "hospital": s.category(table, "hospital", size)}
+    elif table == "visits":
+        data = {"visit_id": s.ids("visit_id", starts["visit_id"], 0, size, offset),
+                "patient_id": s.ids("patient_id", starts["patient_id"], counts["patients"], size),
+                "doctor_id": s.ids("doctor_id", starts["doctor_id"], counts["doctors"], size),
+                "visit_date": s.dates(table, "visit_date", size),
+                "reason": s.category(table, "reason", size),
+                "visit_type": s.category(table, "visit_type", size)}
+    else:
+        data = {"report_id": s.ids("report_id", starts["report_id"], 0, size, offset),
+                "visit_id": s.ids("visit_id", starts["visit_id"], counts["visits"], size),
+                "test_type": s.category(table, "test_type", size),
+                "result": s.category(table, "result", size),
+                "report_date": s.dates(table, "report_date", size)}
+    return pd.DataFrame(data, columns=TABLE_COLUMNS[table])
+
+
+def generate_dataset(out_dir, scale=1.0, seed=42, chunk_rows=200_000, profile=None, raw_dir=RAW_DIR):
+    """
+    Write patients/doctors/visits/lab_reports CSVs at `scale` times the source
+    row counts into `out_dir`, plus dataset.json describing the run. Returns that description.
+    """
+    profile = profile or build_profile(raw_dir)
+    counts = {table: max(1, int(round(rows * scale))) for table, rows in profile["rows"].items()}
+    starts = profile["id_start"]
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    for table_no, table in enumerate(TABLE_COLUMNS):
+        path = os.path.join(out_dir, f"{table}.csv")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", newline="") as f:
+            for chunk_no, offset in enumerate(range(0, counts[table], chunk_rows)):
+                size = min(chunk_rows, counts[table] - offset)
+                sampler = _Sampler(profile, np.random.default_rng([seed, table_no, chunk_no]))
+                _chunk(table, sampler, offset, size, counts, starts).to_csv(f, header=chunk_no == 0, index=False)
+        os.replace(tmp_path, path)
+        print(f"  [OK] {counts[table]:,} rows written to {path}")
+
+    dataset = {"scale": scale, "seed": seed, "chunk_rows": chunk_rows, "rows": counts,
+               "bytes": sum(os.path.getsize(os.path.join(out_dir, f"{t}.csv")) for t in TABLE_COLUMNS),
+               "seconds": round(time.perf_counter() - start, 3)}
+    with open(os.path.join(out_dir, DATASET_FILE), "w") as f:
+        json.dump(dataset, f, indent=2)
+    return dataset
+
+
+def load_dataset_info(out_dir):
+    """dataset.json of a generated directory, or None."""
+    path = os.path.join(out_dir, DATASET_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic raw CSVs at a scale factor")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiple of the data/raw row counts")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=None, help="output directory (default: data/synthetic/x<scale>)")
+    parser.add_argument("--chunk-rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    out_dir = args.out or os.path.join(SYNTHETIC_DIR, f"x{args.scale:g}")
+    info = generate_dataset(out_dir, args.scale, args.seed, args.chunk_rows)
+    print(f"  [OK] {sum(info['rows'].values()):,} rows ({info['bytes'] / 1e6:.1f} MB) in {info['seconds']:.1f}s")
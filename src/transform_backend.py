@@ -0,0 +1,46 @@
+"""
+Pluggable transform backend for step 2 of the pipeline.
+
+    run_transform("spark")  -> src.pyspark_transform.run_spark_transform
+    run_transform("local")  -> src.local_transform.run_local_transform (no JVM)
+    run_transform("auto")   -> "local" when the raw inputs are smaller than
+                               TRANSFORM_CONFIG["local_max_bytes"], else "spark"
+
+Backends are imported lazily, so choosing "local" never imports pyspark.
+"""
+import os
+
+from src.config import TRANSFORM_CONFIG
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+
+RAW_FILES = ["patients.csv", "doctors.csv", "visits.csv", "lab_reports.csv"]
+BACKENDS = ["auto", "spark", "local"]
+
+
+def input_size(raw_dir=RAW_DIR):
+    """Total size in bytes of the raw input files."""
+    return sum(os.path.getsize(os.path.join(raw_dir, f)) for f in RAW_FILES if os.path.exists(os.path.join(raw_dir, f)))
+
+
+def choose_backend(backend=None, raw_dir=RAW_DIR):
+    """Resolve "auto" (or None) to a concrete backend name."""
+    backend = backend or TRANSFORM_CONFIG["backend"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown transform backend `{backend}`; expected one of {BACKENDS}")
+    if backend == "auto":
+        return "local" if input_size(raw_dir) <= TRANSFORM_CONFIG["local_max_bytes"] else "spark"
+    return backend
+
+
+def run_transform(backend=None, **options):
+    """Run the transform step on the chosen backend; returns the backend name used."""
+    backend = choose_backend(backend, options.get("raw_dir") or RAW_DIR)
+    if backend == "local":
+        from src.local_transform import run_local_transform
+        run_local_transform(**options)
+    else:
+        from src.pyspark_transform import run_spark_transform
+        run_spark_transform(**options)
+    return backend
@@ -0,0 +1,39 @@
+"""
+Shared fixtures: a small synthetic dataset (src/synthetic_data.py) copied into
+each test's tmp_path, so tests can append to or edit the raw files freely.
+"""
+import os
+import sys
+import shutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.config import PARSE_CACHE_CONFIG
+from src.synthetic_data import generate_dataset
+
+# 200 patients, 20 doctors, 1,000 visits, 600 lab reports
+SCALE = 0.02
+
+
+@pytest.fixture(scope="session")
+def dataset_dir(tmp_path_factory):
+    out_dir = tmp_path_factory.mktemp("raw")
+    generate_dataset(str(out_dir), scale=SCALE, seed=7)
+    return out_dir
+
+
+@pytest.fixture
+def raw_dir(dataset_dir, tmp_path):
+    """A private copy of the synthetic raw CSVs."""
+    path = tmp_path / "raw"
+    shutil.copytree(dataset_dir, path)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def no_parse_cache(monkeypatch):
+    # keep tests from writing entries into data/cache/ (the parse cache has its own tests)
+    monkeypatch.setitem(PARSE_CACHE_CONFIG, "enabled", False)
+
@@ -0,0 +1,17 @@
+"""Helpers for editing the raw CSVs in tests."""
+
+
+def append_rows(path, rows):
+    """Append CSV lines (lists of values) to a raw file."""
+    with open(path, "a", newline="") as f:
+        for row in rows:
+            f.write(",".join(str(v) for v in row) + "\n")
+
+
+def split_file(path, keep_rows):
+    """Truncate a CSV to its header plus the first `keep_rows` rows; return the removed lines."""
+    with open(path, newline="") as f:
+        lines = f.readlines()
+    with open(path, "w", newline="") as f:
+        f.writelines(lines[:keep_rows + 1])
+    return lines[keep_rows + 1:]
@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+import pytest
+
+from src.aggregate_state import AGGREGATES, BUCKETS_DIR, AggregateStore, refresh
+from src.config import AGGREGATE_CONFIG
+from tests.helpers import append_rows, split_file
+
+
+def assert_same_totals(store, expected):
+    for name, spec in AGGREGATES.items():
+        keys = spec["keys"]
+        got = store.totals(name).sort_values(keys, ignore_index=True)
+        want = expected.totals(name).sort_values(keys, ignore_index=True)
+        pd.testing.assert_frame_equal(got, want, check_dtype=False)
+
+
+def test_incremental_refresh_matches_full_build(raw_dir, tmp_path):
+    visits = os.path.join(raw_dir, "visits.csv")
+    tail = split_file(visits, 600)
+    refresh(raw_dir, str(tmp_path / "state"))
+    with open(visits, "a", newline="") as f:
+        f.writelines(tail)
+    store, folded = refresh(raw_dir, str(tmp_path / "state"))
+
+    assert folded["visits"] == len(tail)
+    full, _ = refresh(raw_dir, str(tmp_path / "full"))
+    assert_same_totals(store, full)
+
+
+def test_edit_before_saved_offset_rebuilds(raw_dir, tmp_path, capsys):
+    visits = os.path.join(raw_dir, "visits.csv")
+    refresh(raw_dir, str(tmp_path / "state"))
+    df = pd.read_csv(visits, dtype=str)
+    # move an early visit to another doctor: same file size, so only the mtime shows the edit
+    df.loc[2, "doctor_id"] = next(d for d in df["doctor_id"] if d != df.loc[2, "doctor_id"])
+    df.to_csv(visits, index=False)
+
+    store, folded = refresh(raw_dir, str(tmp_path / "state"))
+
+    assert "rewritten" in capsys.readouterr().out
+    assert folded["visits"] == len(df)
+    full, _ = refresh(raw_dir, str(tmp_path / "full"))
+    assert_same_totals(store, full)
+
+
+def test_doctor_hospital_change_rebuilds(raw_dir, tmp_path, capsys):
+    refresh(raw_dir, str(tmp_path / "state"))
+    doctors_file = os.path.join(raw_dir, "doctors.csv")
+    doctors = pd.read_csv(doctors_file, dtype=str)
+    doctors.loc[0, "hospital"] = next(h for h in doctors["hospital"] if h != doctors.loc[0, "hospital"])
+    doctors.to_csv(doctors_file, index=False)
+
+    store, folded = refresh(raw_dir, str(tmp_path / "state"))
+
+    assert "doctors.csv changed" in capsys.readouterr().out
+    full, _ = refresh(raw_dir, str(tmp_path / "full"))
+    assert_same_totals(store, full)
+    _, folded = refresh(raw_dir, str(tmp_path / "state"))
+    assert sum(folded.values()) == 0
+
+
+@pytest.mark.parametrize("sketch", ["hll", "exact"])
+def test_refresh_rewrites_only_touched_months(raw_dir, tmp_path, monkeypatch, sketch):
+    monkeypatch.setitem(AGGREGATE_CONFIG, "sketch", sketch)
+    state_dir = str(tmp_path / "state")
+    refresh(raw_dir, state_dir)
+    buckets_dir = os.path.join(state_dir, BUCKETS_DIR)
+    before = set(os.listdir(buckets_dir))
+
+    visits = os.path.join(raw_dir, "visits.csv")
+    month = pd.read_csv(visits, dtype=str)["visit_date"].iloc[-1][:7]
+    append_rows(visits, [["V990001", "P100000", "D2000", f"{month}-01", "Fever", "Consultation"],
+                         ["V990002", "P100001", "D2001", f"{month}-02", "Fever", "Consultation"]])
+    _, folded = refresh(raw_dir, state_dir)
+
+    after = set(os.listdir(buckets_dir))
+    assert folded["visits"] == 2
+    assert [d.split(".")[0] for d in after - before] == [d.split(".")[0] for d in before - after] == [month]
+    full, _ = refresh(raw_dir, str(tmp_path / "full"))
+    assert_same_totals(AggregateStore.load(state_dir), full)
+
+
+def test_exact_sketch_keeps_ids_beyond_32_bits(tmp_path):
+    doctors = pd.DataFrame({"doctor_id": ["D1", "D2"], "hospital": ["Apollo", "Fortis"]})
+    visits = pd.DataFrame({"visit_id": ["V1", "V2", "V3"], "patient_id": ["P4294967297", "P1", "P1"],
+                           "doctor_id": ["D1", "D2", "D2"], "visit_date": "2024-01-01",
+                           "reason": "Fever", "visit_type": "Consultation"})
+    store = AggregateStore(str(tmp_path), sketch="exact")
+    store.fold_source("visits", visits, doctors)
+
+    # (entry << 32) | code would have put P4294967297 (2**32 + 1) under D2 as P1
+    totals = store.totals("doctor").set_index("doctor_id")
+    assert totals["distinct_patient_id"].to_dict() == {"D1": 1, "D2": 1}
+    assert store.totals("reason")["distinct_patient_id"].tolist() == [2]
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from src.data_validation import build_validators
+
+
+def _patients(ids):
+    return pd.DataFrame({"patient_id": ids, "name": "x", "gender": "F"})
+
+
+def test_distinct_malformed_keys_are_not_duplicates():
+    validators = build_validators(["patients", "visits"], quarantine_dir=None)
+    patients = validators["patients"]
+
+    valid = patients.validate(_patients(["P1", "p2", "P03", "p2"]))
+    assert list(valid["patient_id"]) == ["P1", "p2", "P03"]
+    # a later chunk repeating a malformed key is still a duplicate
+    assert patients.validate(_patients(["P03", "P4"]))["patient_id"].tolist() == ["P4"]
+    assert patients.counts == {"duplicate_patient_id": 2}
+
+
+def test_visits_may_reference_accepted_malformed_patients():
+    validators = build_validators(["patients", "doctors", "visits"], quarantine_dir=None)
+    validators["patients"].validate(_patients(["P1", "p2"]))
+    validators["doctors"].validate(pd.DataFrame({"doctor_id": ["D1"], "name": "x"}))
+
+    visits = pd.DataFrame({"visit_id": ["V1", "V2", "V3"], "patient_id": ["p2", "P03", "P1"], "doctor_id": "D1"})
+    valid = validators["visits"].validate(visits)
+    assert valid["visit_id"].tolist() == ["V1", "V3"]
+    assert validators["visits"].counts == {"unknown_patient_id": 1}
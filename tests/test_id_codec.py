@@ -0,0 +1,89 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.generate_patient_records import generate as generate_records
+from src.id_codec import INVALID_ID, MAX_DIGITS, decode_ids, decode_ids_arrow, encode_id, encode_ids
+from src.local_transform import run_local_transform
+from src.processed_reader import read_processed
+from tests.helpers import append_rows
+
+MALFORMED = ["P0100000", "p100001", "P" + "1" * (MAX_DIGITS + 1), "P12a", "P", "X100", "P-1", "P²"]
+
+
+def test_round_trip():
+    ids = ["P0", "P7", "P100000", "P" + "9" * MAX_DIGITS]
+    codes = encode_ids(ids, "P")
+    assert list(decode_ids(codes, "P")) == ids
+    assert decode_ids_arrow(codes, "P").to_pylist() == ids
+
+
+def test_non_canonical_ids_are_invalid():
+    codes = encode_ids(MALFORMED + [None], "P")
+    assert (codes == INVALID_ID).all()
+    assert decode_ids_arrow(codes, "P").to_pylist() == [None] * len(codes)
+
+
+def test_scalar_and_vector_encoders_agree():
+    ids = ["P0", "P7", "P100000", "P" + "9" * MAX_DIGITS] + MALFORMED
+    assert [encode_id(pid, "P") for pid in ids] == list(encode_ids(ids, "P"))
+
+
+def test_every_valid_code_decodes_to_its_input():
+    rng = np.random.default_rng(0)
+    ids = [f"P{'0' * z}{n}" for z, n in zip(rng.integers(0, 2, 500), rng.integers(0, 10**12, 500))]
+    codes = encode_ids(ids, "P")
+    valid = codes != INVALID_ID
+    assert list(np.asarray(ids, dtype=object)[valid]) == list(decode_ids(codes[valid], "P"))
+
+
+def test_exports_pass_malformed_ids_through(raw_dir, tmp_path):
+    rows = [[pid, "Odd Id", "F", "1990-01-01", "O+", "Pune"] for pid in MALFORMED[:3]]
+    append_rows(os.path.join(raw_dir, "patients.csv"), rows)
+
+    run_local_transform("csv", raw_dir=raw_dir, processed_dir=str(tmp_path / "processed"))
+    exported = pd.read_csv(tmp_path / "processed" / "patients_powerbi" / "part-00000.csv", dtype=str)
+    assert list(exported["patient_id"].tail(3)) == MALFORMED[:3]
+    assert exported["patient_id"].is_unique
+
+    generate_records(raw_dir=raw_dir, output_file=str(tmp_path / "records.json"))
+    with open(tmp_path / "records.json") as f:
+        records = json.load(f)["records"]
+    assert set(MALFORMED[:3]) <= set(records)
+    assert all(records[pid]["patient_id"] == pid for pid in MALFORMED[:3])
+
+
+def test_aggregations_keep_malformed_ids_apart(raw_dir, tmp_path):
+    append_rows(os.path.join(raw_dir, "doctors.csv"), [["d1", "Odd Doc", "Neurologist", "Odd Hospital"],
+                                                      ["D01", "Odd Doc", "Neurologist", "Odd Hospital"]])
+    append_rows(os.path.join(raw_dir, "visits.csv"), [
+        ["V900001", "p2", "d1", "2024-01-01", "Odd Reason", "Consultation"],
+        ["V900002", "P03", "d1", "2024-01-02", "Odd Reason", "Consultation"],
+        ["V900003", "p2", "D01", "2024-01-03", "Odd Reason", "Consultation"],
+    ])
+    processed_dir = str(tmp_path / "processed")
+    run_local_transform("csv", raw_dir=raw_dir, processed_dir=processed_dir)
+
+    # Spark's semantics: group and count distinct on the ID strings as written
+    visits = pd.read_csv(os.path.join(raw_dir, "visits.csv"), dtype=str)
+    doctors = pd.read_csv(os.path.join(raw_dir, "doctors.csv"), dtype=str)
+    expected = visits.groupby("doctor_id").agg(total_visits=("visit_id", "count"),
+                                               unique_patients=("patient_id", "nunique"))
+    summary = read_processed("doctor_summary", processed_dir=processed_dir).set_index("doctor_id")
+    assert summary.loc[["d1", "D01"], "total_visits"].tolist() == [2, 1]
+    assert summary.loc[["d1", "D01"], "unique_patients"].tolist() == [2, 1]
+    for column in ("total_visits", "unique_patients"):
+        assert summary[column].to_dict() == expected[column].to_dict()
+
+    reasons = read_processed("visit_reason_analysis", processed_dir=processed_dir).set_index("reason")
+    assert reasons.loc["Odd Reason", "unique_patients"] == 2
+
+    joined = visits.merge(doctors[["doctor_id", "hospital"]], on="doctor_id", how="left")
+    expected = joined.groupby("hospital").agg(unique_patients=("patient_id", "nunique"),
+                                              active_doctors=("doctor_id", "nunique"))
+    hospitals = read_processed("hospital_visits", processed_dir=processed_dir).set_index("hospital")
+    assert hospitals.loc["Odd Hospital", ["unique_patients", "active_doctors"]].tolist() == [2, 2]
+    for column in ("unique_patients", "active_doctors"):
+        assert hospitals[column].to_dict() == expected[column].to_dict()
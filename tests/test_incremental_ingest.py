@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from src import incremental_ingest
+from src.incremental_ingest import ingest_all_incremental
+from tests.helpers import append_rows
+
+
+class RecordingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def executemany(self, sql, batch):
+        self.rows.extend(batch)
+
+    def close(self):
+        pass
+
+
+class RecordingConnection:
+    """Stands in for MySQL: keeps the rows each upsert sends."""
+
+    def __init__(self):
+        self.rows = []
+
+    def cursor(self):
+        return RecordingCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def get_connection(pooled=False):
+        opened.append(RecordingConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(incremental_ingest, "get_connection", get_connection)
+    return opened
+
+
+def ingest(raw_dir, tmp_path, tables):
+    return ingest_all_incremental(raw_dir, str(tmp_path / "manifest.json"), str(tmp_path / "state"), tables,
+                                  str(tmp_path / "quarantine"))
+
+
+def test_malformed_keys_are_not_sent_again(raw_dir, tmp_path, connections):
+    patients = os.path.join(raw_dir, "patients.csv")
+    append_rows(patients, [["PX-1", "Asha Rao", "F", "1990-01-01", "A+", "Pune"],
+                           ["P12AB", "Ravi Das", "M", "1985-06-30", "O-", "Agra"]])
+    first = ingest(raw_dir, tmp_path, ["patients"])
+    assert first["patients"]["rows"] == 202
+
+    # a non-append edit forces a full re-read; only the edited row has changed
+    with open(patients) as f:
+        text = f.read()
+    with open(patients, "w") as f:
+        f.write(text.replace("Charita Reddy", "Charita Reddi"))
+    second = ingest(raw_dir, tmp_path, ["patients"])
+    assert second["patients"]["mode"] == "full"
+    assert second["patients"]["rows"] == 1
+    assert connections[-1].rows[0][1] == "Charita Reddi"
+
+
+def test_appended_rows_are_checked_against_rows_loaded_before(raw_dir, tmp_path, connections):
+    tables = ["patients", "doctors", "visits"]
+    ingest(raw_dir, tmp_path, tables)
+
+    append_rows(os.path.join(raw_dir, "visits.csv"), [
+        ["V900000", "P100000", "D2000", "2026-02-01", "Fever", "Consultation"],
+        ["V900001", "P999999", "D2000", "2026-02-01", "Fever", "Consultation"],  # unknown patient
+        ["V300000", "P100001", "D2001", "2026-02-01", "Fever", "Consultation"],  # loaded by the first run
+    ])
+    stats = ingest(raw_dir, tmp_path, tables)
+
+    assert [stats[t]["mode"] for t in tables] == ["skip", "skip", "append"]
+    assert stats["visits"]["scanned"] == 3
+    assert stats["visits"]["rows"] == 1
+    assert connections[-1].rows[0][0] == "V900000"
+    assert stats["visits"]["validation"]["rejected_by_rule"] == {"unknown_patient_id": 1, "duplicate_visit_id": 1}
+    assert os.path.exists(tmp_path / "quarantine" / "visits_rejected.csv")
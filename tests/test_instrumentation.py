@@ -0,0 +1,25 @@
+import json
+import time
+
+import pytest
+
+from src.instrumentation import finish_run, start_run
+from src.scheduler import Scheduler, Stage
+
+
+def busy_stage():
+    start, spins = time.perf_counter(), 0
+    while time.perf_counter() - start < 0.2:
+        spins += 1
+
+
+@pytest.mark.parametrize("profile, top", [("cprofile", "top"), ("sample", "top_own")])
+def test_profilers_see_stages_on_worker_threads(tmp_path, profile, top):
+    start_run("test", profile=profile, report_dir=str(tmp_path))
+    try:
+        Scheduler([Stage("busy", busy_stage)], state_file=str(tmp_path / "state.json")).run()
+    finally:
+        path = finish_run()
+    with open(path) as f:
+        summary = json.load(f)["profile"]
+    assert any(row["function"].startswith("busy_stage ") for row in summary[top])
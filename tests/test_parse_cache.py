@@ -0,0 +1,79 @@
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+import pyarrow.csv as pv
+
+from src.parse_cache import cached_batches, cached_table, load_index
+from src.raw_reader import parse_csv, parse_csv_batches, table_schema
+
+
+def parse(path):
+    return pv.read_csv(path)
+
+
+def cache_all(paths, cache_dir):
+    return [cached_table(path, parse, "test", cache_dir).num_rows for path in paths]
+
+
+def test_processes_caching_different_sources_keep_each_others_records(raw_dir, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    paths = [os.path.join(raw_dir, name) for name in sorted(os.listdir(raw_dir)) if name.endswith(".csv")]
+    with ProcessPoolExecutor(max_workers=len(paths)) as pool:
+        list(pool.map(cache_all, [[p] for p in paths], [cache_dir] * len(paths)))
+
+    sources = load_index(cache_dir)["sources"]
+    assert sorted(sources) == sorted(os.path.abspath(p) for p in paths)
+    entries = {entry for known in sources.values() for entry in known["entries"].values()}
+    assert entries == {name for name in os.listdir(cache_dir) if name.endswith(".arrow")}
+
+
+def test_entries_of_deleted_sources_are_evicted(raw_dir, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    copy_dir = tmp_path / "copy"
+    copy_dir.mkdir()
+    doomed = str(copy_dir / "visits_copy.csv")
+    shutil.copy(os.path.join(raw_dir, "visits.csv"), doomed)
+    cache_all([doomed, os.path.join(raw_dir, "patients.csv")], cache_dir)
+    assert len(load_index(cache_dir)["sources"]) == 2
+
+    os.remove(doomed)
+    cache_all([os.path.join(raw_dir, "doctors.csv")], cache_dir)
+
+    sources = load_index(cache_dir)["sources"]
+    assert os.path.abspath(doomed) not in sources
+    assert sorted(n for n in os.listdir(cache_dir) if n.endswith(".arrow")) == \
+        sorted(e for known in sources.values() for e in known["entries"].values())
+
+
+def test_streamed_entry_matches_a_whole_file_parse(raw_dir, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    path = os.path.join(raw_dir, "visits.csv")
+    schema = table_schema("visits")
+
+    def open_reader(p):
+        # small blocks, so the category dictionaries grow across batches
+        return parse_csv_batches(p, schema, block_size=4096)
+
+    streamed = list(cached_batches(path, open_reader, "test", cache_dir))
+    assert len(streamed) > 1
+    expected = parse_csv(path, schema)
+    assert pa.Table.from_batches(streamed).to_pylist() == expected.to_pylist()
+
+    # the entry is recorded, so a whole-file read of the same variant maps it instead of parsing
+    def fail(p):
+        raise AssertionError("parsed again")
+
+    assert cached_table(path, fail, "test", cache_dir).to_pylist() == expected.to_pylist()
+
+
+def test_stream_stopped_early_leaves_no_entry(raw_dir, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    path = os.path.join(raw_dir, "visits.csv")
+    batches = cached_batches(path, lambda p: parse_csv_batches(p, table_schema("visits"), block_size=4096),
+                             "test", cache_dir)
+    next(batches)
+    batches.close()
+    assert os.listdir(cache_dir) == []
+    assert load_index(cache_dir)["sources"] == {}
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.patient_features import OUTPUT_NAME, generate
+from tests.helpers import append_rows
+
+
+def build(raw_dir, out_dir, incremental=False):
+    generate(incremental, "local", raw_dir=raw_dir, features_dir=str(out_dir),
+             state_file=str(out_dir / "state.json"))
+    return pd.read_parquet(out_dir / OUTPUT_NAME)
+
+
+def test_incremental_matches_full_build_after_appends(raw_dir, tmp_path):
+    build(raw_dir, tmp_path / "inc")
+    visits = pd.read_csv(os.path.join(raw_dir, "visits.csv"), dtype=str)
+    next_visit = visits["visit_id"].str[1:].astype(int).max() + 1
+    patients = visits["patient_id"].unique()[:3]
+    append_rows(os.path.join(raw_dir, "patients.csv"), [["P999999", "New Patient", "F", "1990-05-01", "O+", "Pune"]])
+    append_rows(os.path.join(raw_dir, "visits.csv"),
+                [[f"V{next_visit + i}", p, visits["doctor_id"][0], "2026-01-15", "Fever", "OPD"]
+                 for i, p in enumerate([*patients, "P999999"])])
+    append_rows(os.path.join(raw_dir, "lab_reports.csv"),
+                [["R999999", visits["visit_id"][5], "ECG", "Abnormal", "2026-01-16"]])
+
+    incremental = build(raw_dir, tmp_path / "inc", incremental=True)
+    full = build(raw_dir, tmp_path / "full")
+    pd.testing.assert_frame_equal(incremental, full)
+    assert "P999999" in set(full["patient_id"])
+
+
+def test_edit_before_saved_offset_rebuilds(raw_dir, tmp_path):
+    build(raw_dir, tmp_path / "inc")
+    path = os.path.join(raw_dir, "visits.csv")
+    visits = pd.read_csv(path, dtype=str)
+    # move an early visit to another patient, rewriting the file in place
+    visits.loc[3, "patient_id"] = next(p for p in visits["patient_id"] if p != visits.loc[3, "patient_id"])
+    visits.to_csv(path, index=False)
+
+    incremental = build(raw_dir, tmp_path / "inc", incremental=True)
+    full = build(raw_dir, tmp_path / "full")
+    pd.testing.assert_frame_equal(incremental, full)
+
+
+def test_rolling_counts_match_naive_windows(raw_dir, tmp_path):
+    features = build(raw_dir, tmp_path / "out").set_index("patient_id")
+    visits = pd.read_csv(os.path.join(raw_dir, "visits.csv"), dtype=str)
+    visits["day"] = pd.to_datetime(visits["visit_date"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    for patient_id, group in visits.groupby("patient_id"):
+        days = np.sort(group["day"].to_numpy())
+        row = features.loc[patient_id]
+        assert row["total_visits"] == len(days)
+        assert row["visits_90d"] == np.sum(days > days[-1] - 90)
+        assert row["visits_365d"] == np.sum(days > days[-1] - 365)
+        assert row["max_visits_90d"] == max(np.sum((days > d - 90) & (days <= d)) for d in days)
+        gaps = np.diff(days)
+        assert (pd.isna(row["max_days_between_visits"]) if not len(gaps)
+                else row["max_days_between_visits"] == gaps.max())
@@ -0,0 +1,37 @@
+import json
+import os
+
+from src.generate_patient_records import generate as generate_records
+from src.patient_record_store import fnv1a, load_record, write_store
+
+
+def test_fnv1a_hashes_utf8_bytes():
+    assert fnv1a("") == 0x811C9DC5
+    assert fnv1a("a") == 0xE40C292C
+    assert fnv1a("foobar") == 0xBF9CF968
+    # U+00E9 is the two bytes C3 A9 in UTF-8, not the single code unit E9
+    assert fnv1a("é") == ((((0x811C9DC5 ^ 0xC3) * 16777619) & 0xFFFFFFFF ^ 0xA9) * 16777619) & 0xFFFFFFFF
+
+
+def test_empty_store(tmp_path):
+    manifest = write_store({}, [], str(tmp_path))
+    assert manifest["total_patients"] == 0 and manifest["index"]["files"] == 0
+    assert load_record("P100000", str(tmp_path)) is None
+
+
+def test_index_pages_and_lookups(raw_dir, tmp_path):
+    store_dir = str(tmp_path / "store")
+    generate_records(raw_dir=raw_dir, output_file=str(tmp_path / "records.json"))
+    generate_records(raw_dir=raw_dir, sharded=True, store_dir=store_dir)
+    with open(tmp_path / "records.json") as f:
+        single = json.load(f)
+
+    with open(os.path.join(store_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    assert not os.path.exists(os.path.join(store_dir, "index.json"))
+    patient_ids = []
+    for page in range(manifest["index"]["files"]):
+        with open(os.path.join(store_dir, f"index_{page}.json")) as f:
+            patient_ids += json.load(f)["patient_id"]
+    assert patient_ids == [row["patient_id"] for row in single["patient_index"]]
+    assert all(load_record(pid, store_dir) == single["records"][pid] for pid in patient_ids)
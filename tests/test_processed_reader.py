@@ -0,0 +1,15 @@
+from src.processed_reader import read_processed
+
+
+def test_csv_parts_share_fixed_column_types(tmp_path):
+    folder = tmp_path / "city_distribution"
+    folder.mkdir()
+    # inferred from the first part alone, `city` would be an integer and `first_seen` a date
+    (folder / "part-00000.csv").write_text("city,patient_count,first_seen\n411001,3,2024-01-05\n,2,\n")
+    (folder / "part-00001.csv").write_text("city,patient_count,first_seen\nPune,5,2024-02-30\n")
+
+    df = read_processed("city_distribution", processed_dir=str(tmp_path))
+
+    assert df["city"].tolist()[::2] == ["411001", "Pune"] and df["city"].isna().tolist() == [False, True, False]
+    assert df["patient_count"].dtype == "int64" and df["patient_count"].tolist() == [3, 2, 5]
+    assert df["first_seen"].tolist()[::2] == ["2024-01-05", "2024-02-30"]
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from src.query_service import HISTORY_COLUMNS, LAB_REPORT_COLUMNS, MAX_BODY_BYTES, MemoryBackend, QueryService
+from tests.helpers import append_rows
+
+
+def _read(raw_dir, name):
+    return pd.read_csv(os.path.join(raw_dir, name), dtype=str, keep_default_na=False)
+
+
+def test_memory_backend_matches_the_procedure_joins(raw_dir, tmp_path):
+    patients, doctors = _read(raw_dir, "patients.csv"), _read(raw_dir, "doctors.csv")
+    visits, lab_reports = _read(raw_dir, "visits.csv"), _read(raw_dir, "lab_reports.csv")
+    # GetPatientHistory / GetPatientLabReports, as SQL would run them
+    history = (patients.merge(visits, on="patient_id")
+               .merge(doctors.rename(columns={"name": "doctor_name"}), on="doctor_id"))
+    labs = (patients.rename(columns={"name": "patient_name"})
+            .merge(visits, on="patient_id").merge(lab_reports, on="visit_id"))
+
+    backend = MemoryBackend(raw_dir, index_dir=str(tmp_path / "index"))
+    for patient_id in patients["patient_id"]:
+        got = backend.patient_history(patient_id)
+        expected = history[history["patient_id"] == patient_id][HISTORY_COLUMNS]
+        assert [r["visit_date"] for r in got] == sorted(expected["visit_date"], reverse=True)
+        assert sorted(map(str, got)) == sorted(map(str, expected.to_dict(orient="records")))
+
+        got = backend.patient_lab_reports(patient_id)
+        expected = labs[labs["patient_id"] == patient_id][LAB_REPORT_COLUMNS]
+        assert [r["report_date"] for r in got] == sorted(expected["report_date"], reverse=True)
+        assert sorted(map(str, got)) == sorted(map(str, expected.to_dict(orient="records")))
+
+    assert backend.patient_history("P0100000") == backend.patient_lab_reports("nope") == []
+
+
+def test_memory_backend_maps_the_saved_index(raw_dir, tmp_path):
+    index_dir = str(tmp_path / "index")
+    MemoryBackend(raw_dir, index_dir=index_dir)
+    backend = MemoryBackend(raw_dir, index_dir=index_dir)
+    assert isinstance(backend._index.arrays["patient_row"], np.memmap)
+    assert backend.patient_history("P99999999999") == []
+
+    # a far-out ID takes one slot in the index, not a span up to it; the changed files force a rebuild
+    append_rows(os.path.join(raw_dir, "patients.csv"), [["P99999999999", "Far Out", "F", "1990-01-01", "O+", "Pune"]])
+    append_rows(os.path.join(raw_dir, "visits.csv"),
+                [["V99999999999", "P99999999999", "D2000", "2024-01-01", "Fever", "Consultation"]])
+    backend = MemoryBackend(raw_dir, index_dir=index_dir)
+    assert [r["name"] for r in backend.patient_history("P99999999999")] == ["Far Out"]
+    patients = _read(raw_dir, "patients.csv")
+    assert len(backend._index.arrays["patient_row"]) == patients["patient_id"].nunique()
+
+
+async def _exchange(service, data):
+    """Send raw bytes to the service on a fresh connection; return the response statuses until it closes."""
+    server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(data)
+        await writer.drain()
+        responses = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+    return [status.decode() for status in re.findall(rb"HTTP/1\.1 (\d{3}) ", responses)]
+
+
+def test_request_bodies_are_skipped_or_refused(raw_dir, tmp_path):
+    service = QueryService(MemoryBackend(raw_dir, index_dir=str(tmp_path / "index")))
+    last = b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n"
+    # the body looks like a request, but is read and discarded rather than served
+    body = b"GET /health HTTP/1.1\r\n\r\n"
+    post = b"POST /patients/P100000/history HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+    assert asyncio.run(_exchange(service, post + last)) == ["405", "200"]
+
+    too_large = f"POST /health HTTP/1.1\r\nContent-Length: {MAX_BODY_BYTES + 1}\r\n\r\n".encode()
+    assert asyncio.run(_exchange(service, too_large + last)) == ["413"]
+    chunked = b"POST /health HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n"
+    assert asyncio.run(_exchange(service, chunked + last)) == ["400"]
@@ -0,0 +1,54 @@
+from src.scheduler import Scheduler, Stage
+
+
+def build(tmp_path, fail=()):
+    """raw.txt -> a -> a.txt -> b -> b.txt -> d, plus an independent stage c; stages in `fail` raise."""
+    calls = []
+
+    def copy(name, source, target, transform=str.strip):
+        def run():
+            calls.append(name)
+            if name in fail:
+                raise RuntimeError(f"{name} broke")
+            target.write_text(transform(source.read_text()))
+        return run
+
+    raw, a, b, c, d = (tmp_path / f"{n}.txt" for n in ["raw", "a", "b", "c", "d"])
+    stages = [
+        Stage("a", copy("a", raw, a), inputs=[raw], outputs=[a]),
+        Stage("b", copy("b", a, b, str.upper), inputs=[a], outputs=[b]),
+        Stage("c", copy("c", raw, c), inputs=[raw], outputs=[c]),
+        Stage("d", copy("d", b, d), inputs=[b], outputs=[d]),
+    ]
+    return Scheduler(stages, state_file=str(tmp_path / "state.json"), workers=2), calls
+
+
+def test_skips_up_to_date_stages(tmp_path):
+    raw = tmp_path / "raw.txt"
+    raw.write_text("hello\n")
+    scheduler, calls = build(tmp_path)
+    assert scheduler.run() == {"a": "ran", "b": "ran", "c": "ran", "d": "ran"}
+
+    scheduler, calls = build(tmp_path)
+    assert set(scheduler.run().values()) == {"skipped"} and calls == []
+
+    # new input bytes, same output: a and c rerun, but b's inputs hash the same, so b and d stay skipped
+    raw.write_text("hello  \n")
+    scheduler, calls = build(tmp_path)
+    assert scheduler.run() == {"a": "ran", "b": "skipped", "c": "ran", "d": "skipped"}
+
+    (tmp_path / "d.txt").unlink()
+    scheduler, calls = build(tmp_path)
+    assert scheduler.run() == {"a": "skipped", "b": "skipped", "c": "skipped", "d": "ran"}
+
+
+def test_resume_reruns_only_failed_and_blocked_stages(tmp_path):
+    (tmp_path / "raw.txt").write_text("hello\n")
+    scheduler, calls = build(tmp_path, fail={"b"})
+    assert scheduler.run() == {"a": "ran", "b": "failed", "c": "ran", "d": "blocked"}
+    assert "d" not in calls
+
+    scheduler, calls = build(tmp_path)
+    assert scheduler.run(resume=True) == {"a": "skipped", "b": "ran", "c": "skipped", "d": "ran"}
+    assert sorted(calls) == ["b", "d"]
+    assert (tmp_path / "d.txt").read_text() == "HELLO"